@@ -0,0 +1,48 @@
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+from config import ACCESS_CACHE_TTL, ACCESS_CACHE_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+# telegram_id владельца -> (момент истечения, версия доступа пользователя, решение о доступе).
+# Кэш свой в каждом процессе: решение действует, пока user.access_version в БД не изменилась
+# (её увеличивает любая запись, влияющая на доступ), поэтому отзыв доступа виден всем воркерам сразу
+_access_cache = {}
+
+def get_access(telegram_id: str, version: Optional[int]) -> Optional[dict]:
+    """Возвращает закэшированное решение о доступе или None, если его нет, истёк TTL или сменилась версия"""
+    entry = _access_cache.get(str(telegram_id))
+    if entry is None:
+        return None
+    expires_at, cached_version, decision = entry
+    if expires_at < time.monotonic() or cached_version != version:
+        _access_cache.pop(str(telegram_id), None)
+        return None
+    return decision
+
+def set_access(telegram_id: str, version: Optional[int], decision: dict, valid_until: Optional[datetime] = None,
+               ttl: float = ACCESS_CACHE_TTL) -> None:
+    """Сохраняет решение о доступе на ttl секунд, но не дольше valid_until (конец пробного периода или подписки)"""
+    if valid_until is not None:
+        ttl = min(ttl, max(0.0, (valid_until - datetime.now(timezone.utc)).total_seconds()))
+    if len(_access_cache) >= ACCESS_CACHE_MAX_SIZE:
+        _prune()
+    _access_cache[str(telegram_id)] = (time.monotonic() + ttl, version, decision)
+
+def invalidate_access(telegram_id: Optional[str] = None) -> None:
+    """Сбрасывает решение для пользователя (или весь кэш) в этом процессе; другие процессы видят смену access_version"""
+    if telegram_id is None:
+        _access_cache.clear()
+    else:
+        _access_cache.pop(str(telegram_id), None)
+    logger.info(f"[ACCESS_CACHE] invalidate: telegram_id={telegram_id}")
+
+def _prune() -> None:
+    now = time.monotonic()
+    for key in [k for k, (expires_at, _, _) in _access_cache.items() if expires_at < now]:
+        del _access_cache[key]
+    # Если все записи ещё живы — выкидываем самые старые
+    while len(_access_cache) >= ACCESS_CACHE_MAX_SIZE:
+        del _access_cache[next(iter(_access_cache))]
@@ -1,23 +1,94 @@
+import asyncio
 import httpx
 import logging
 import json
-from datetime import datetime, timezone
-from typing import Optional, Dict, Any
-from config import GOOGLE_SHEETS_WEBHOOK_URL
+import os
+import random
+import re
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from config import (
+    GOOGLE_SHEETS_WEBHOOK_URL, ANALYTICS_QUEUE_MAXSIZE, ANALYTICS_BATCH_SIZE, ANALYTICS_FLUSH_INTERVAL,
+    ANALYTICS_MAX_RETRIES, ANALYTICS_BACKOFF_BASE, ANALYTICS_BACKOFF_MAX, ANALYTICS_SPILL_PATH, ANALYTICS_SPILL_MAX_BYTES,
+    ANALYTICS_BATCH_PAYLOAD,
+    INSIGHTS_SEND_CONCURRENCY, INSIGHTS_MAX_RETRIES
+)
+from send_scheduler import broadcast_priority, caller_handles_retry_after
 
 logger = logging.getLogger(__name__)
 
+# Сколько дней хранить отметки о доставке ежедневных инсайтов
+INSIGHTS_CHECKPOINT_DAYS = 7
+
+def _process_spill_path() -> str:
+    """Файл неотправленных строк этого процесса: у каждого воркера свой, без гонок записи и переименования"""
+    root, ext = os.path.splitext(ANALYTICS_SPILL_PATH)
+    return f"{root}.{os.getpid()}{ext}"
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _orphan_spill_paths() -> List[str]:
+    """Файлы завершившихся процессов (и общий файл прежних версий) — их строки дошлёт любой живой процесс"""
+    directory = os.path.dirname(ANALYTICS_SPILL_PATH) or "."
+    root, ext = os.path.splitext(os.path.basename(ANALYTICS_SPILL_PATH))
+    pattern = re.compile(re.escape(root) + r"(?:\.(\d+))?" + re.escape(ext) + r"(?:\.replay)?$")
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        match = pattern.match(name)
+        if match and (match.group(1) is None or not _process_alive(int(match.group(1)))):
+            paths.append(os.path.join(directory, name))
+    return paths
+
 class AnalyticsTracker:
+    """Очередь действий пользователей, которую фоновая задача отправляет в Google Sheets пачками"""
+
     def __init__(self):
         self.webhook_url = GOOGLE_SHEETS_WEBHOOK_URL
-        
+        self.spill_path = _process_spill_path()
+        # deque с maxlen при переполнении сам вытесняет самые старые строки
+        self._queue = deque(maxlen=max(1, ANALYTICS_QUEUE_MAXSIZE))
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: List[dict] = []
+        self._stopping = False
+        self.stats = {
+            "enqueued_total": 0, "dropped_overflow": 0, "sent_rows": 0, "sent_batches": 0, "failed_batches": 0,
+            "retries": 0, "rejected_rows": 0, "spilled_rows": 0, "spill_dropped_rows": 0, "replayed_rows": 0,
+        }
+
+    @staticmethod
+    def _format_additional_data(additional_data: Optional[Dict[str, Any]]) -> str:
+        readable_data = ""
+        if additional_data:
+            # Если это {'question_text': ...} или {'form_name': ...}
+            if (len(additional_data) == 1 and isinstance(list(additional_data.values())[0], str)):
+                readable_data = list(additional_data.values())[0]
+            # Если это {'form_data': {...}}
+            elif 'form_data' in additional_data and isinstance(additional_data['form_data'], dict):
+                # Просто значения полей формы через запятую
+                readable_data = ', '.join(str(v) for v in additional_data['form_data'].values())
+            else:
+                # fallback: сериализуем в строку
+                readable_data = json.dumps(additional_data, ensure_ascii=False)
+        return readable_data
+
     async def log_user_action(self, 
                              user_id: str, 
                              action: str, 
                              project_id: Optional[str] = None,
                              additional_data: Optional[Dict[str, Any]] = None):
         """
-        Логирует действия пользователя в Google Sheets
+        Ставит действие пользователя в очередь отправки в Google Sheets (сама отправка — в фоне)
         
         Actions:
         - "asked_question" - задал вопрос
@@ -27,45 +98,218 @@ class AnalyticsTracker:
         - "rated_response" - поставил оценку ответу
         - "filled_form" - заполнил форму
         """
-        logging.info(f"[ANALYTICS] log_user_action: начало, user_id={user_id}, action={action}, project_id={project_id}, additional_data={additional_data}")
         try:
-            timestamp = datetime.now(timezone.utc).isoformat()
-            # --- Новый формат additional_data ---
-            readable_data = ""
-            if additional_data:
-                # Если это {'question_text': ...} или {'form_name': ...}
-                if (len(additional_data) == 1 and isinstance(list(additional_data.values())[0], str)):
-                    readable_data = list(additional_data.values())[0]
-                # Если это {'form_data': {...}}
-                elif 'form_data' in additional_data and isinstance(additional_data['form_data'], dict):
-                    # Просто значения полей формы через запятую
-                    readable_data = ', '.join(str(v) for v in additional_data['form_data'].values())
-                else:
-                    # fallback: сериализуем в строку
-                    readable_data = json.dumps(additional_data, ensure_ascii=False)
             data = {
-                "timestamp": timestamp,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
                 "user_id": user_id,
                 "action": action,
                 "project_id": project_id or "",
-                "additional_data": readable_data
+                "additional_data": self._format_additional_data(additional_data)
             }
-            logging.info(f"[ANALYTICS] log_user_action: сформирован пакет данных для отправки: {data}")
-            
-            logging.info(f"[ANALYTICS] log_user_action: {action} for user {user_id}")
-            
-            if self.webhook_url:
-                async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-                    response = await client.post(self.webhook_url, json=data)
-                    response.raise_for_status()
-                    logging.info(f"[ANALYTICS] log_user_action: данные успешно отправлены в Google Sheets")
-            else:
-                logging.warning(f"[ANALYTICS] GOOGLE_SHEETS_WEBHOOK_URL не настроен, данные не отправлены")
-                
+            if not self.webhook_url:
+                logging.warning(f"[ANALYTICS] GOOGLE_SHEETS_WEBHOOK_URL не настроен, действие {action} не отправляется")
+                return
+            if len(self._queue) == self._queue.maxlen:
+                self.stats["dropped_overflow"] += 1
+            self._queue.append(data)
+            self.stats["enqueued_total"] += 1
+            logging.info(f"[ANALYTICS] log_user_action: {action} for user {user_id} поставлено в очередь ({len(self._queue)})")
+            if self._wakeup is not None and len(self._queue) >= ANALYTICS_BATCH_SIZE:
+                self._wakeup.set()
         except Exception as e:
             logging.error(f"[ANALYTICS] log_user_action: ОШИБКА: {e}")
-            import traceback
-            logging.error(f"[ANALYTICS] log_user_action: полный traceback: {traceback.format_exc()}")
+
+    def _take_batch(self) -> List[dict]:
+        # Без пачечного формата запрос несёт одну строку: в _inflight — ровно то, что ещё не доставлено
+        size = ANALYTICS_BATCH_SIZE if ANALYTICS_BATCH_PAYLOAD else 1
+        batch = []
+        while self._queue and len(batch) < size:
+            batch.append(self._queue.popleft())
+        return batch
+
+    async def _post_with_retry(self, payload: dict, row_count: int) -> bool:
+        """Отправляет запрос с экспоненциальной задержкой между попытками; False — webhook недоступен"""
+        for attempt in range(ANALYTICS_MAX_RETRIES + 1):
+            try:
+                response = await self._client.post(self.webhook_url, json=payload)
+                response.raise_for_status()
+                self.stats["sent_rows"] += row_count
+                self.stats["sent_batches"] += 1
+                return True
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if 400 <= status < 500 and status != 429:
+                    # Повтор не поможет: webhook отвергает сами данные
+                    self.stats["rejected_rows"] += row_count
+                    logging.error(f"[ANALYTICS] Webhook отклонил {row_count} строк: HTTP {status}")
+                    return True
+                error = f"HTTP {status}"
+            except httpx.HTTPError as e:
+                error = repr(e)
+            if attempt == ANALYTICS_MAX_RETRIES or self._stopping:
+                break
+            self.stats["retries"] += 1
+            delay = min(ANALYTICS_BACKOFF_MAX, ANALYTICS_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logging.warning(f"[ANALYTICS] Ошибка отправки ({error}), попытка {attempt + 1}, повтор через {delay:.1f} с")
+            await asyncio.sleep(delay)
+        self.stats["failed_batches"] += 1
+        return False
+
+    async def _send_rows(self, rows: List[dict]) -> int:
+        """Отправляет строки; возвращает, сколько первых строк доставлено (остальные вызывающий сохраняет в файл).
+        По умолчанию — строка на запрос, в формате, который ждёт webhook Apps Script; одним запросом
+        {"rows": [...]} — только с ANALYTICS_BATCH_PAYLOAD, когда webhook обновлён под пачки"""
+        if ANALYTICS_BATCH_PAYLOAD:
+            return len(rows) if await self._post_with_retry({"rows": rows}, len(rows)) else 0
+        for sent, row in enumerate(rows):
+            if not await self._post_with_retry(row, 1):
+                return sent
+        return len(rows)
+
+    def _append_spill(self, rows: List[dict]) -> bool:
+        """Дописывает строки в файл процесса (JSON Lines); False — файл достиг предела"""
+        size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+        if size >= ANALYTICS_SPILL_MAX_BYTES:
+            return False
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        return True
+
+    async def _spill(self, rows: List[dict]):
+        """Сохраняет неотправленные строки в локальный файл для повторной отправки (запись — вне event loop)"""
+        if not rows:
+            return
+        try:
+            appended = await asyncio.to_thread(self._append_spill, rows)
+        except OSError as e:
+            self.stats["spill_dropped_rows"] += len(rows)
+            logging.error(f"[ANALYTICS] Не удалось сохранить строки в {self.spill_path}: {e}")
+            return
+        if not appended:
+            self.stats["spill_dropped_rows"] += len(rows)
+            logging.error(f"[ANALYTICS] Файл {self.spill_path} достиг предела, {len(rows)} строк потеряно")
+            return
+        self.stats["spilled_rows"] += len(rows)
+        logging.warning(f"[ANALYTICS] {len(rows)} строк сохранено в {self.spill_path} до восстановления webhook")
+
+    def _claim_spill(self) -> Optional[str]:
+        """Файл для повторной отправки: недосланный .replay, свой файл или файл завершившегося процесса"""
+        replay_path = self.spill_path + ".replay"
+        if os.path.exists(replay_path):
+            return replay_path
+        for path in [self.spill_path] + _orphan_spill_paths():
+            try:
+                # Переименование отделяет читаемые строки от дописываемых; чужой файл забирает ровно один процесс
+                os.replace(path, replay_path)
+            except FileNotFoundError:
+                continue
+            return replay_path
+        return None
+
+    @staticmethod
+    def _read_spill(path: str) -> List[dict]:
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Строка, оборванная при аварийном завершении процесса
+                    continue
+        return rows
+
+    async def _replay_spill(self) -> bool:
+        """Отправляет строки из файлов, накопленные пока webhook был недоступен; False — webhook всё ещё недоступен"""
+        while True:
+            replay_path = await asyncio.to_thread(self._claim_spill)
+            if replay_path is None:
+                return True
+            rows = await asyncio.to_thread(self._read_spill, replay_path)
+            sent_all = True
+            for start in range(0, len(rows), ANALYTICS_BATCH_SIZE):
+                chunk = rows[start:start + ANALYTICS_BATCH_SIZE]
+                sent = await self._send_rows(chunk)
+                self.stats["replayed_rows"] += sent
+                if sent < len(chunk):
+                    await self._spill(rows[start + sent:])
+                    sent_all = False
+                    break
+            await asyncio.to_thread(os.remove, replay_path)
+            if not sent_all:
+                return False
+            logging.info(f"[ANALYTICS] Из файла повторно отправлено {len(rows)} строк")
+
+    async def _ship_queue(self) -> bool:
+        """Отправляет очередь пачками; если webhook недоступен, остаток очереди уходит в файл"""
+        while self._queue:
+            self._inflight = self._take_batch()
+            sent = await self._send_rows(self._inflight) == len(self._inflight)
+            if not sent:
+                # Не ждём полный цикл повторов для каждой пачки — всё накопленное сохраняем сразу
+                await self._spill(self._inflight + list(self._queue))
+                self._queue.clear()
+            self._inflight = []
+            if not sent:
+                return False
+        return True
+
+    async def _run(self):
+        # Файл мог остаться с прошлого запуска
+        spill_pending = True
+        while True:
+            if not self._queue and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=ANALYTICS_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            try:
+                if not await self._ship_queue():
+                    spill_pending = True
+                elif spill_pending and not self._stopping:
+                    spill_pending = not await self._replay_spill()
+            except Exception as e:
+                logging.error(f"[ANALYTICS] Ошибка фоновой отправки: {e}", exc_info=True)
+            if self._stopping and not self._queue:
+                break
+
+    def start(self):
+        """Запускает фоновую отправку (вызывается при старте приложения)"""
+        if self._task is not None or not self.webhook_url:
+            return
+        self._stopping = False
+        # Воркер мог быть создан fork после импорта модуля — файл по pid уже рабочего процесса
+        self.spill_path = _process_spill_path()
+        self._wakeup = asyncio.Event()
+        self._client = httpx.AsyncClient(timeout=10.0, follow_redirects=True)
+        self._task = asyncio.create_task(self._run(), name="analytics-shipper")
+        mode = f"пачки до {ANALYTICS_BATCH_SIZE} строк" if ANALYTICS_BATCH_PAYLOAD else "по строке на запрос"
+        logging.info(f"[ANALYTICS] Фоновая отправка запущена: {mode}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Отправляет остаток очереди; что не успело уйти — сохраняется в файл"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        except Exception as e:
+            logging.error(f"[ANALYTICS] Ошибка фоновой отправки при остановке: {e}")
+        await self._spill(self._inflight + list(self._queue))
+        self._inflight = []
+        self._queue.clear()
+        self._task = None
+        await self._client.aclose()
+        self._client = None
+        logging.info("[ANALYTICS] Фоновая отправка остановлена")
+
+    def metrics(self) -> dict:
+        return {"running": self._task is not None, "queue_depth": len(self._queue), **self.stats}
 
 # Глобальный экземпляр трекера
 analytics = AnalyticsTracker()
@@ -100,78 +344,98 @@ async def log_form_filled(user_id: str, project_id: Optional[str] = None, form_d
     additional_data = {"form_data": form_data} if form_data else None
     await analytics.log_user_action(user_id, "filled_form", project_id, additional_data)
 
+def format_insights_report(project_name: Optional[str], sorted_themes: list) -> str:
+    """Текст ежедневного отчёта по темам запросов проекта"""
+    report = f"📊 **Ежедневная статистика проекта {project_name or 'Неизвестный'}:**\n\n"
+    for theme, count in sorted_themes[:5]:  # Только топ-5
+        theme_display = theme.replace('_', ' ').title()
+        report += f"• {theme_display}: {count} запросов\n"
+    report += f"\n📈 Всего запросов: {sum(count for _, count in sorted_themes)}"
+    report += f"\n🕐 Период: последние 24 часа"
+    return report
+
+async def _send_insights_message(bot, chat_id: str, text: str) -> Optional[str]:
+    """Отправляет отчёт; возвращает статус для отметки или None, если все попытки исчерпаны"""
+    for attempt in range(INSIGHTS_MAX_RETRIES + 1):
+        last_attempt = attempt == INSIGHTS_MAX_RETRIES
+        try:
+            # Повторы при RetryAfter делает только этот цикл: планировщик отправки (send_scheduler.py) здесь
+            # лишь приостанавливает лимиты бота и чата, иначе попытки перемножились бы
+            with caller_handles_retry_after():
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+            return "sent"
+        except TelegramRetryAfter as e:
+            # Ждём здесь же: следующий запуск рассылки — только завтра, отложенный отчёт иначе потерялся бы
+            logging.warning(f"[ANALYTICS] Telegram ограничил отправку в чат {chat_id} на {e.retry_after} с (попытка {attempt + 1})")
+            if not last_attempt:
+                await asyncio.sleep(e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат недоступен — повтор не поможет
+            logging.error(f"[ANALYTICS] Инсайты не доставлены в чат {chat_id}: {e}")
+            return "failed"
+        except Exception as e:
+            logging.error(f"[ANALYTICS] Ошибка отправки инсайтов в чат {chat_id} (попытка {attempt + 1}): {e}")
+            if not last_attempt:
+                await asyncio.sleep(min(ANALYTICS_BACKOFF_MAX, ANALYTICS_BACKOFF_BASE * 2 ** attempt))
+    return None
+
 async def send_daily_insights_to_project_owners():
     """Отправляет ежедневные инсайты всем владельцам проектов"""
     logging.info("[ANALYTICS] Starting daily insights distribution")
     try:
-        from database import get_daily_themes, get_project_by_id
+        from database import (
+            get_theme_counts_by_project, get_delivered_insights, mark_insights_delivered, prune_insights_deliveries
+        )
         from settings_bot import settings_bot
-        
-        # Получаем все проекты с темами за последние 24 часа
-        from datetime import datetime, timezone, timedelta
-        day_ago = datetime.now(timezone.utc) - timedelta(hours=24)
-        
-        # Группируем темы по проектам
-        project_themes = {}
-        
-        # Получаем все проекты
-        from database import get_all_projects
-        
-        all_projects = await get_all_projects()
-        project_themes = {}
-        
-        # Получаем темы для каждого проекта
-        for project in all_projects:
-            project_id = project.get('id', '')
-            themes = await get_daily_themes(project_id)
-            if themes:
-                project_themes[project_id] = [theme['theme'] for theme in themes]
-        
-        # Отправляем инсайты каждому владельцу проекта
-        for project_id, themes_list in project_themes.items():
-            if not themes_list:
-                continue
-                
-            try:
-                # Получаем информацию о проекте
-                project = await get_project_by_id(project_id)
-                if not project:
-                    continue
-                
-                # Анализируем темы
-                theme_counts = {}
-                for theme in themes_list:
-                    theme_counts[theme] = theme_counts.get(theme, 0) + 1
-                
-                # Сортируем по популярности
-                sorted_themes = sorted(theme_counts.items(), key=lambda x: x[1], reverse=True)
-                
-                # Формируем отчет
-                report = f"📊 **Ежедневная статистика проекта {project.get('project_name', 'Неизвестный')}:**\n\n"
-                for theme, count in sorted_themes[:5]:  # Только топ-5
-                    theme_display = theme.replace('_', ' ').title()
-                    report += f"• {theme_display}: {count} запросов\n"
-                
-                report += f"\n📈 Всего запросов: {len(themes_list)}"
-                report += f"\n🕐 Период: последние 24 часа"
-                
-                # Отправляем владельцу проекта
-                owner_telegram_id = project.get('telegram_id', '')
-                await settings_bot.send_message(
-                    chat_id=owner_telegram_id,
-                    text=report,
-                    parse_mode="Markdown"
-                )
-                
-                logging.info(f"[ANALYTICS] Sent daily insights to project owner {owner_telegram_id}")
-                
-            except Exception as e:
-                logging.error(f"[ANALYTICS] Error sending insights for project {project_id}: {e}")
+
+        today = datetime.now(timezone.utc).date()
+        run_day = today.isoformat()
+        await prune_insights_deliveries((today - timedelta(days=INSIGHTS_CHECKPOINT_DAYS)).isoformat())
+
+        # Темы всех проектов за 24 часа одним запросом; уже доставленные сегодня (до сбоя) пропускаем
+        projects = await get_theme_counts_by_project()
+        delivered = await get_delivered_insights(run_day)
+        reports_by_chat = {}
+        for project in projects:
+            if project['project_id'] in delivered or not project['telegram_id']:
                 continue
-        
-        logging.info(f"[ANALYTICS] Daily insights distribution completed for {len(project_themes)} projects")
+            text = format_insights_report(project['project_name'], project['themes'])
+            reports_by_chat.setdefault(project['telegram_id'], []).append((project['project_id'], text))
+
+        chats = asyncio.Queue()
+        for item in reports_by_chat.items():
+            chats.put_nowait(item)
+        counters = {"sent": 0, "failed": 0, "postponed": 0}
+
+        async def worker():
+            # Чат целиком обрабатывается одним воркером: отчёты одному владельцу уходят по порядку
+            while not chats.empty():
+                owner_telegram_id, reports = chats.get_nowait()
+                for project_id, text in reports:
+                    status = await _send_insights_message(settings_bot, owner_telegram_id, text)
+                    if status is None:
+                        counters["postponed"] += 1
+                        continue
+                    await mark_insights_delivered(run_day, project_id, status)
+                    counters[status] += 1
+                    if status == "sent":
+                        logging.info(f"[ANALYTICS] Sent daily insights to project owner {owner_telegram_id}")
+
+        workers = min(INSIGHTS_SEND_CONCURRENCY, len(reports_by_chat))
+        # Рассылка идёт в полосе низкого приоритета, чтобы не задерживать ответы пользователям
+        with broadcast_priority():
+            results = await asyncio.gather(*(worker() for _ in range(workers)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"[ANALYTICS] Ошибка воркера рассылки инсайтов: {result}")
+
+        logging.info(
+            f"[ANALYTICS] Daily insights distribution completed: {len(projects)} projects with themes, "
+            f"skipped {len(delivered)} already delivered, sent {counters['sent']}, failed {counters['failed']}, "
+            f"postponed {counters['postponed']}"
+        )
         
     except Exception as e:
         logging.error(f"[ANALYTICS] Error in daily insights distribution: {e}")
         import traceback
-        logging.error(f"[ANALYTICS] Full traceback: {traceback.format_exc()}") 
\ No newline at end of file
+        logging.error(f"[ANALYTICS] Full traceback: {traceback.format_exc()}")
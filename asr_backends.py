@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+import speech_recognition as sr
+
+from config import TRANSCRIBE_WORKERS, TRANSCRIBE_TIMEOUT, ASR_PROCESS_WORKERS, VOSK_MODEL_PATH, SPHINX_LANGUAGE
+from process_pool import create_process_pool, terminate_process_pool
+
+logger = logging.getLogger(__name__)
+
+# Офлайн-движкам нужен 16 кГц, 16 бит, моно — в этом формате и декодирует audio_pipeline
+OFFLINE_SAMPLE_RATE = 16000
+OFFLINE_SAMPLE_WIDTH = 2
+
+class AsrBackend:
+    """Движок распознавания речи: recognize() возвращает текст чанка ('' — речи нет) или бросает исключение"""
+
+    name = ""
+
+    def __init__(self, workers: int, timeout: float = TRANSCRIBE_TIMEOUT):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+        self.stats = {
+            "calls": 0, "failures": 0, "empty": 0, "in_flight": 0, "audio_seconds": 0.0,
+            "latency_last": 0.0, "latency_total": 0.0, "latency_max": 0.0,
+        }
+
+    def _create_executor(self) -> Executor:
+        raise NotImplementedError
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    async def _recognize(self, chunk: sr.AudioData, language: str) -> str:
+        raise NotImplementedError
+
+    async def recognize(self, chunk: sr.AudioData, language: str) -> str:
+        started = time.monotonic()
+        self.stats["calls"] += 1
+        self.stats["in_flight"] += 1
+        try:
+            text = await self._recognize(chunk, language)
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        finally:
+            latency = time.monotonic() - started
+            self.stats["in_flight"] -= 1
+            self.stats["latency_last"] = latency
+            self.stats["latency_total"] += latency
+            self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+        self.stats["audio_seconds"] += len(chunk.frame_data) / (chunk.sample_rate * chunk.sample_width)
+        if not text:
+            self.stats["empty"] += 1
+        return text
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> dict:
+        calls = self.stats["calls"]
+        return {
+            "workers": self.workers,
+            **self.stats,
+            "latency_avg": self.stats["latency_total"] / calls if calls else 0.0,
+            # Секунд работы движка на секунду аудио: < 1 — быстрее реального времени
+            "real_time_factor": self.stats["latency_total"] / self.stats["audio_seconds"] if self.stats["audio_seconds"] else 0.0,
+        }
+
+def _google_recognize(chunk: sr.AudioData, language: str, timeout: float) -> str:
+    recognizer = sr.Recognizer()
+    recognizer.operation_timeout = timeout
+    try:
+        return recognizer.recognize_google(chunk, language=language)
+    except sr.UnknownValueError:
+        # Тишина или неразборчивая речь — повтор не поможет
+        return ""
+
+class GoogleBackend(AsrBackend):
+    """Облачное распознавание Google: по HTTP-запросу на чанк, запросы идут в пуле потоков"""
+
+    name = "google"
+
+    def __init__(self, workers: int = TRANSCRIBE_WORKERS, timeout: float = TRANSCRIBE_TIMEOUT):
+        super().__init__(workers, timeout)
+
+    def _create_executor(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="asr-google")
+
+    async def _recognize(self, chunk: sr.AudioData, language: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), _google_recognize, chunk, language, self.timeout)
+
+# Модель Vosk загружается один раз в каждом процессе пула (сотни МБ, загрузка — секунды)
+_vosk_model = None
+
+def _vosk_recognize(raw: bytes, model_path: str) -> str:
+    global _vosk_model
+    if _vosk_model is None:
+        try:
+            from vosk import Model, SetLogLevel
+        except ImportError:
+            raise sr.RequestError("Модуль vosk не установлен (pip install vosk)")
+        if not os.path.isdir(model_path):
+            raise sr.RequestError(f"Модель Vosk не найдена: {model_path}")
+        SetLogLevel(-1)
+        _vosk_model = Model(model_path)
+    from vosk import KaldiRecognizer
+    recognizer = KaldiRecognizer(_vosk_model, OFFLINE_SAMPLE_RATE)
+    recognizer.AcceptWaveform(raw)
+    return json.loads(recognizer.FinalResult()).get("text", "")
+
+def _sphinx_recognize(raw: bytes, language: str) -> str:
+    recognizer = sr.Recognizer()
+    try:
+        return recognizer.recognize_sphinx(sr.AudioData(raw, OFFLINE_SAMPLE_RATE, OFFLINE_SAMPLE_WIDTH), language=language)
+    except sr.UnknownValueError:
+        return ""
+
+class ProcessPoolBackend(AsrBackend):
+    """Офлайн-распознавание на CPU: декодер держит GIL, поэтому работает в отдельных процессах"""
+
+    def __init__(self, workers: int = ASR_PROCESS_WORKERS, timeout: float = TRANSCRIBE_TIMEOUT):
+        super().__init__(workers, timeout)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _create_executor(self) -> Executor:
+        # Воркеры не импортируют приложение (server.py) — см. process_pool
+        return create_process_pool(self.workers)
+
+    def _terminate(self, executor: Executor):
+        """Убивает процессы пула (зависший чанк иначе занимает процесс) — следующий вызов создаст пул заново"""
+        if executor is self._executor:
+            self._executor = None
+            terminate_process_pool(executor)
+
+    def _call(self, raw: bytes, language: str) -> tuple:
+        """Функция и аргументы для процесса пула (функция — на уровне модуля, чтобы передаваться через pickle)"""
+        raise NotImplementedError
+
+    async def _recognize(self, chunk: sr.AudioData, language: str) -> str:
+        # memoryview не передаётся в другой процесс — копируем PCM чанка в bytes
+        raw = bytes(chunk.get_raw_data(convert_rate=OFFLINE_SAMPLE_RATE, convert_width=OFFLINE_SAMPLE_WIDTH))
+        func, *args = self._call(raw, language)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        # Не больше чанков, чем процессов в пуле: таймаут считает распознавание, а не ожидание в очереди пула
+        async with self._semaphore:
+            executor = self._get_executor()
+            loop = asyncio.get_running_loop()
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"[VOICE] {self.name}: чанк не распознан за {self.timeout} с, процессы пула перезапускаются")
+                self._terminate(executor)
+                raise
+            except BrokenProcessPool:
+                # Процесс пула упал (нехватка памяти) или пул перезапущен из-за чужого зависшего чанка
+                self._terminate(executor)
+                raise
+
+class VoskBackend(ProcessPoolBackend):
+    """Vosk (Kaldi): офлайн, есть компактные модели для русского; язык определяется моделью VOSK_MODEL_PATH"""
+
+    name = "vosk"
+
+    def __init__(self, workers: int = ASR_PROCESS_WORKERS, timeout: float = TRANSCRIBE_TIMEOUT,
+                 model_path: str = VOSK_MODEL_PATH):
+        super().__init__(workers, timeout)
+        self.model_path = model_path
+        if not os.path.isdir(model_path):
+            logger.error(f"[VOICE] Модель Vosk не найдена: {model_path} — распознавание через vosk будет завершаться ошибкой")
+
+    def _call(self, raw: bytes, language: str) -> tuple:
+        return _vosk_recognize, raw, self.model_path
+
+class SphinxBackend(ProcessPoolBackend):
+    """CMU PocketSphinx через SpeechRecognition: офлайн, из коробки только en-US (другие языки — SPHINX_LANGUAGE)"""
+
+    name = "sphinx"
+
+    def _call(self, raw: bytes, language: str) -> tuple:
+        return _sphinx_recognize, raw, SPHINX_LANGUAGE or language
+
+BACKENDS = {backend.name: backend for backend in (GoogleBackend, VoskBackend, SphinxBackend)}
+
+def create_backends(names: str) -> List[AsrBackend]:
+    """Движки по списку имён через запятую (порядок — порядок попыток); неизвестные имена пропускаются"""
+    backends = []
+    for name in (part.strip().lower() for part in names.split(",")):
+        if not name:
+            continue
+        if name not in BACKENDS:
+            logger.error(f"[VOICE] Неизвестный движок распознавания '{name}', доступны: {', '.join(BACKENDS)}")
+            continue
+        backends.append(BACKENDS[name]())
+    if not backends:
+        backends.append(GoogleBackend())
+    logger.info(f"[VOICE] Распознавание речи: {', '.join(backend.name for backend in backends)}")
+    return backends
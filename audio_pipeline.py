@@ -0,0 +1,177 @@
+import asyncio
+import logging
+from typing import Iterator, List, Tuple
+
+import numpy as np
+import speech_recognition as sr
+from pydub import AudioSegment
+from pydub.utils import db_to_float
+
+from transcription import transcriber
+
+logger = logging.getLogger(__name__)
+
+# Формат распознавания: 16 кГц, моно, 16 бит — этого достаточно для речи и втрое меньше исходных 48 кГц Opus
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+
+_SAMPLE_DTYPES = {1: np.dtype('i1'), 2: np.dtype('<i2'), 4: np.dtype('<i4')}
+
+# Длина чанка для распознавания (Google не принимает длинные фрагменты за один запрос)
+CHUNK_LENGTH_MS = 30000
+
+class PcmAudio:
+    """Декодированное аудио в памяти (signed 16-bit little-endian PCM); куски — memoryview без копирования"""
+
+    def __init__(self, data: bytes, sample_rate: int = SAMPLE_RATE, sample_width: int = SAMPLE_WIDTH,
+                 channels: int = CHANNELS):
+        self.data = data
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self.frame_width = sample_width * channels
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.data) // self.frame_width
+
+    @property
+    def duration_ms(self) -> int:
+        # Округление как у len(AudioSegment)
+        return round(1000 * (self.frame_count / self.sample_rate))
+
+    @property
+    def max_possible_amplitude(self) -> float:
+        return (2 ** (self.sample_width * 8)) / 2
+
+    def frame_index(self, ms):
+        """Номер кадра для миллисекунды (число или массив) — та же арифметика, что при срезах AudioSegment"""
+        if isinstance(ms, np.ndarray):
+            return (ms * (self.sample_rate / 1000.0)).astype(np.int64)
+        return int(ms * (self.sample_rate / 1000.0))
+
+    def _offset(self, ms: int) -> int:
+        # Границы кусков всегда по целому кадру
+        return min(self.frame_index(ms), self.frame_count) * self.frame_width
+
+    def samples(self) -> np.ndarray:
+        """Сэмплы как массив NumPy поверх буфера (без копирования), форма (кадры, каналы)"""
+        frames = self.frame_count
+        return np.frombuffer(self.data, dtype=_SAMPLE_DTYPES[self.sample_width],
+                             count=frames * self.channels).reshape(frames, self.channels)
+
+    def slice(self, start_ms: int, end_ms: int) -> memoryview:
+        return memoryview(self.data)[self._offset(start_ms):self._offset(end_ms)]
+
+    def chunks(self, chunk_length_ms: int = CHUNK_LENGTH_MS) -> Iterator[memoryview]:
+        for start in range(0, self.duration_ms, chunk_length_ms):
+            yield self.slice(start, start + chunk_length_ms)
+
+    def audio_data(self, frames=None) -> sr.AudioData:
+        """Данные для speech_recognition прямо из буфера (по умолчанию — всё аудио)"""
+        return sr.AudioData(memoryview(self.data) if frames is None else frames, self.sample_rate, self.sample_width)
+
+    def to_segment(self) -> AudioSegment:
+        return AudioSegment(data=bytes(self.data), sample_width=self.sample_width,
+                            frame_rate=self.sample_rate, channels=self.channels)
+
+def detect_silence(audio: PcmAudio, min_silence_len: int = 1000, silence_thresh: float = -16,
+                   seek_step: int = 1) -> List[List[int]]:
+    """Участки тишины [начало, конец] в мс — как pydub.silence.detect_silence, но окна RMS считаются массивами NumPy"""
+    seg_len = audio.duration_ms
+    if seg_len < min_silence_len:
+        return []
+    silence_thresh = db_to_float(silence_thresh) * audio.max_possible_amplitude
+
+    # Префиксные суммы квадратов сэмплов: сумма по любому окну — разность двух элементов
+    squares = np.square(audio.samples(), dtype=np.int64 if audio.sample_width <= 2 else np.float64).sum(axis=1)
+    np.cumsum(squares, out=squares)
+    frames = audio.frame_count
+    bounds = np.minimum(audio.frame_index(np.arange(seg_len + 1)), frames)
+    prefix = np.where(bounds > 0, squares[np.maximum(bounds - 1, 0)] if frames else 0, 0)
+
+    # Окна длиной min_silence_len с шагом seek_step; последнее окно проверяется всегда
+    last_slice_start = seg_len - min_silence_len
+    starts = np.arange(0, last_slice_start + 1, seek_step)
+    if last_slice_start % seek_step:
+        starts = np.append(starts, last_slice_start)
+    ends = starts + min_silence_len
+    # Как у audioop.rms: делим на полное число сэмплов окна (за концом записи pydub дополняет тишиной), затем отбрасываем дробную часть
+    count = (audio.frame_index(ends) - audio.frame_index(starts)) * audio.channels
+    sums = (prefix[ends] - prefix[starts]).astype(np.float64)
+    rms = np.floor(np.sqrt(np.divide(sums, count, out=np.zeros_like(sums), where=count > 0)))
+    silence_starts = starts[rms <= silence_thresh]
+    if not len(silence_starts):
+        return []
+
+    # Соседние тихие окна склеиваются в один участок; разрыв — только если окна не перекрываются
+    gaps = np.diff(silence_starts)
+    breaks = np.flatnonzero((gaps != seek_step) & (gaps > min_silence_len))
+    range_starts = np.concatenate(([silence_starts[0]], silence_starts[breaks + 1]))
+    range_ends = np.concatenate((silence_starts[breaks], [silence_starts[-1]])) + min_silence_len
+    return [[int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+
+def detect_nonsilent(audio: PcmAudio, min_silence_len: int = 1000, silence_thresh: float = -16,
+                     seek_step: int = 1) -> List[List[int]]:
+    """Участки со звуком [начало, конец] в мс (дополнение к detect_silence)"""
+    silent_ranges = detect_silence(audio, min_silence_len, silence_thresh, seek_step)
+    len_seg = audio.duration_ms
+    if not silent_ranges:
+        return [[0, len_seg]]
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+        return []
+    prev_end = 0
+    nonsilent_ranges = []
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+    if end != len_seg:
+        nonsilent_ranges.append([prev_end, len_seg])
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+    return nonsilent_ranges
+
+def split_on_silence_ranges(audio: PcmAudio, min_silence_len: int = 1000, silence_thresh: float = -16,
+                            keep_silence=100, seek_step: int = 1) -> List[List[int]]:
+    """Границы кусков в мс с той же семантикой keep_silence, что у pydub.silence.split_on_silence"""
+    if isinstance(keep_silence, bool):
+        keep_silence = audio.duration_ms if keep_silence else 0
+    output_ranges = [
+        [start - keep_silence, end + keep_silence]
+        for start, end in detect_nonsilent(audio, min_silence_len, silence_thresh, seek_step)
+    ]
+    # Если тишины меньше, чем 2 * keep_silence, она делится пополам между соседними кусками
+    for range_i, range_ii in zip(output_ranges, output_ranges[1:]):
+        if range_ii[0] < range_i[1]:
+            range_i[1] = (range_i[1] + range_ii[0]) // 2
+            range_ii[0] = range_i[1]
+    return [[max(start, 0), min(end, audio.duration_ms)] for start, end in output_ranges]
+
+def split_on_silence(audio: PcmAudio, min_silence_len: int = 1000, silence_thresh: float = -16,
+                     keep_silence=100, seek_step: int = 1) -> List[memoryview]:
+    """Режет аудио по паузам; куски — срезы общего буфера"""
+    return [
+        audio.slice(start, end)
+        for start, end in split_on_silence_ranges(audio, min_silence_len, silence_thresh, keep_silence, seek_step)
+    ]
+
+async def decode_audio(content: bytes, sample_rate: int = SAMPLE_RATE) -> PcmAudio:
+    """Один проход ffmpeg: OGG/Opus (и любой другой формат) из памяти сразу в PCM нужного формата, без временных файлов"""
+    process = await asyncio.create_subprocess_exec(
+        AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(CHANNELS), "-ar", str(sample_rate), "pipe:1",
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    data, stderr = await process.communicate(content)
+    if process.returncode != 0:
+        raise ValueError(f"Не удалось декодировать аудио: {stderr.decode(errors='ignore').strip()[-300:]}")
+    return PcmAudio(data, sample_rate)
+
+async def transcribe_voice(content: bytes, language: str = 'ru-RU', chunk_length_ms: int = CHUNK_LENGTH_MS) -> Tuple[str, int]:
+    """Голосовое сообщение в текст: декодирование в память, нарезка на чанки и параллельное распознавание;
+    возвращает текст и число чанков, пропущенных из-за ошибок распознавания"""
+    audio = await decode_audio(content)
+    chunks: List[sr.AudioData] = [audio.audio_data(frames) for frames in audio.chunks(chunk_length_ms)]
+    logger.info(f"[VOICE] Аудио {audio.duration_ms / 1000:.1f} с, чанков: {len(chunks)}")
+    return await transcriber.transcribe_with_failures(chunks, language=language)
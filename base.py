@@ -1,63 +1,110 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from settings_bot import router as settings_api_router, settings_router
-from main_bot import router as main_bot_router
+from config import SERVER_URL, MAIN_BOT_TOKEN
+from settings_bot import router as settings_api_router, settings_router, settings_update_queue, set_settings_webhook, SETTINGS_BOT_TOKEN, SETTINGS_WEBHOOK_URL
+from main_bot import router as main_bot_router, main_update_queue, set_main_bot_webhook
+from database import database, telemetry_buffer, engine, Base
+from migrations import run_migrations
+from db_pool import startup_database, shutdown_database
+from llm_client import close_llm_client
+from analytics import analytics
+from send_scheduler import stop_send_schedulers
+from job_scheduler import job_scheduler
+from file_utils import shutdown_extraction_pool
+from transcription import transcriber
 import logging
-import asyncio
-from datetime import datetime, timezone, timedelta
-import time
 
-app = FastAPI()
-# FastAPI endpoints (webhook, REST)
-app.include_router(settings_api_router)
-app.include_router(main_bot_router)
-
-# aiogram Dispatcher setup (пример, если нужно)
-# from aiogram import Dispatcher
-# dispatcher = Dispatcher(...)
-# dispatcher.include_router(settings_router)
+def register_jobs():
+    """Фоновые задачи приложения; расписание есть у каждого воркера, каждый запуск выполняет один (аренда в БД)"""
+    job_scheduler.add_job("check_expired_trials", "settings_bot:check_expired_trials", "interval", min_gap=30, minutes=1)
+    job_scheduler.add_job("check_expired_paid_month", "settings_bot:check_expired_paid_month", "interval", min_gap=1800, hours=1)
+    # Ежедневные инсайты владельцам проектов в 9:00 UTC
+    job_scheduler.add_job(
+        "daily_insights", "analytics:send_daily_insights_to_project_owners", "cron", min_gap=12 * 3600, hour=9, minute=0
+    )
 
-# Удалён пример функции с невалидным синтаксисом
+async def set_webhooks():
+    try:
+        logging.info(f"[ENV] SERVER_URL={SERVER_URL}")
+        logging.info(f"[ENV] SETTINGS_BOT_TOKEN={SETTINGS_BOT_TOKEN}, SETTINGS_WEBHOOK_URL={SETTINGS_WEBHOOK_URL}")
+        logging.info(f"[ENV] MAIN_BOT_TOKEN={'Настроен' if MAIN_BOT_TOKEN else 'НЕ НАСТРОЕН'}")
+        
+        # Устанавливаем webhook для settings бота
+        logging.info("[STARTUP] Setting settings bot webhook...")
+        await set_settings_webhook()
+        print("[STARTUP] Settings bot webhook set!")
+        
+        # Устанавливаем webhook для основного бота
+        logging.info("[STARTUP] Setting main bot webhook...")
+        await set_main_bot_webhook()
+        print("[STARTUP] Main bot webhook set!")
+        
+        logging.info("[STARTUP] All webhooks set successfully!")
+        
+    except Exception as e:
+        print(f"[STARTUP] Failed to set webhooks: {e}")
+        logging.error(f"[STARTUP] Failed to set webhooks: {e}")
+        raise
 
-# Планировщик для ежедневной отправки инсайтов
-async def daily_insights_scheduler():
-    """Планировщик для ежедневной отправки инсайтов"""
-    logging.info("[SCHEDULER] Daily insights scheduler started")
-    
-    while True:
-        try:
-            # Ждем до следующего дня в 9:00 UTC
-            now = datetime.now(timezone.utc)
-            next_run = now.replace(hour=9, minute=0, second=0, microsecond=0)
-            
-            if now.hour >= 9:
-                next_run += timedelta(days=1)
-            
-            wait_seconds = (next_run - now).total_seconds()
-            logging.info(f"[SCHEDULER] Next daily insights run at {next_run} (waiting {wait_seconds:.0f} seconds)")
-            
-            await asyncio.sleep(wait_seconds)
-            
-            # Отправляем инсайты
-            logging.info("[SCHEDULER] Sending daily insights")
-            from analytics import send_daily_insights_to_project_owners
-            await send_daily_insights_to_project_owners()
-            
-        except Exception as e:
-            logging.error(f"[SCHEDULER] Error in daily insights scheduler: {e}")
-            # Ждем час перед повторной попыткой
-            await asyncio.sleep(3600)
-
-# Запускаем планировщик при старте приложения
-@app.on_event("startup")
 async def startup_event():
     """Запускается при старте приложения"""
     logging.info("[APP] Starting up...")
     
-    # Запускаем планировщик в фоне
-    asyncio.create_task(daily_insights_scheduler())
-    logging.info("[APP] Daily insights scheduler started")
+    # Миграции схемы — до первых запросов к БД; параллельно стартующие воркеры ждут блокировку записи
+    run_migrations(engine, Base.metadata)
+    # Открываем пул соединений с БД один раз на всё время работы приложения
+    await startup_database(database)
+    # Пакетная запись аналитики в фоне
+    telemetry_buffer.start()
+    # Отправка аналитики в Google Sheets в фоне
+    analytics.start()
+    
+    # Воркеры очередей обновлений Telegram
+    main_update_queue.start()
+    settings_update_queue.start()
+    
+    # Планировщик фоновых задач
+    register_jobs()
+    job_scheduler.start()
+    
+    # Webhook ставим последним, когда обработчики обновлений уже готовы
+    await set_webhooks()
 
-@app.on_event("shutdown")
 async def shutdown_event():
     """Запускается при остановке приложения"""
-    logging.info("[APP] Shutting down...")
\ No newline at end of file
+    logging.info("[APP] Shutting down...")
+    job_scheduler.stop()
+    # Сначала дообрабатываем принятые обновления, пока БД и HTTP-клиент ещё открыты
+    await main_update_queue.stop()
+    await settings_update_queue.stop()
+    await close_llm_client()
+    await shutdown_extraction_pool()
+    transcriber.shutdown()
+    await analytics.stop()
+    await stop_send_schedulers()
+    # Дописываем накопленную аналитику, пока пул соединений открыт
+    await telemetry_buffer.stop()
+    await shutdown_database(database)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Единая точка запуска и остановки фоновых подсистем приложения"""
+    try:
+        # Запуск — внутри try: если он упадёт на полпути (например, в set_webhooks), уже запущенные очереди,
+        # планировщик и пул БД всё равно остановятся; остановка каждой подсистемы допускает, что она не запускалась
+        await startup_event()
+        yield
+    finally:
+        await shutdown_event()
+
+app = FastAPI(lifespan=lifespan)
+# FastAPI endpoints (webhook, REST)
+app.include_router(settings_api_router)
+app.include_router(main_bot_router)
+
+# aiogram Dispatcher setup (пример, если нужно)
+# from aiogram import Dispatcher
+# dispatcher = Dispatcher(...)
+# dispatcher.include_router(settings_router)
+
+# Удалён пример функции с невалидным синтаксисом
\ No newline at end of file
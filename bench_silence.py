@@ -0,0 +1,70 @@
+"""Сравнение поиска пауз: pydub.silence.split_on_silence против векторизованного audio_pipeline.split_on_silence.
+
+Запуск: python bench_silence.py [длительность в секундах] [частота дискретизации]
+"""
+import sys
+import time
+
+import numpy as np
+from pydub import silence as pydub_silence
+
+from audio_pipeline import PcmAudio, split_on_silence_ranges
+
+# Параметры как в utils.process_by_silence
+MIN_SILENCE_LEN = 500
+SILENCE_THRESH = -40
+KEEP_SILENCE = 200
+
+def make_speech_like(duration_s: float, sample_rate: int, seed: int = 0) -> PcmAudio:
+    """Синтетическая «речь»: фразы шума разной громкости вперемешку с паузами и тихим фоном"""
+    rng = np.random.default_rng(seed)
+    total = int(duration_s * sample_rate)
+    samples = rng.normal(0, 30, total)  # фон около -60 dBFS
+    position = 0
+    while position < total:
+        phrase = int(rng.uniform(0.3, 4.0) * sample_rate)
+        pause = int(rng.uniform(0.1, 1.5) * sample_rate)
+        samples[position:position + phrase] += rng.normal(0, rng.uniform(1000, 8000), min(phrase, total - position))
+        position += phrase + pause
+    pcm = np.clip(samples, -32768, 32767).astype('<i2')
+    return PcmAudio(pcm.tobytes(), sample_rate)
+
+def pydub_ranges(audio: PcmAudio) -> list:
+    """Границы кусков pydub в мс (split_on_silence возвращает только сами куски)"""
+    segment = audio.to_segment()
+    keep = KEEP_SILENCE
+    ranges = [
+        [start - keep, end + keep]
+        for start, end in pydub_silence.detect_nonsilent(segment, MIN_SILENCE_LEN, SILENCE_THRESH)
+    ]
+    for range_i, range_ii in zip(ranges, ranges[1:]):
+        if range_ii[0] < range_i[1]:
+            range_i[1] = (range_i[1] + range_ii[0]) // 2
+            range_ii[0] = range_i[1]
+    return [[max(start, 0), min(end, len(segment))] for start, end in ranges]
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    sample_rate = int(sys.argv[2]) if len(sys.argv) > 2 else 16000
+    audio = make_speech_like(duration, sample_rate)
+    print(f"🔄 Аудио {audio.duration_ms / 1000:.0f} с, {sample_rate} Гц")
+
+    segment = audio.to_segment()
+    pydub_chunks, pydub_time = timed(
+        pydub_silence.split_on_silence, segment, MIN_SILENCE_LEN, SILENCE_THRESH, KEEP_SILENCE
+    )
+    expected = pydub_ranges(audio)
+    ranges, numpy_time = timed(split_on_silence_ranges, audio, MIN_SILENCE_LEN, SILENCE_THRESH, KEEP_SILENCE)
+
+    print(f"  pydub: {pydub_time:.3f} с, кусков: {len(pydub_chunks)}")
+    print(f"  numpy: {numpy_time:.3f} с, кусков: {len(ranges)}")
+    print(f"  ускорение: x{pydub_time / numpy_time:.0f}")
+    if ranges != expected or len(ranges) != len(pydub_chunks):
+        print("❌ Границы кусков не совпадают с pydub")
+        sys.exit(1)
+    print("✅ Границы кусков совпадают с pydub")
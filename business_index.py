@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import re
+
+import numpy as np
+
+from config import BUSINESS_CHUNK_SIZE, BUSINESS_CHUNK_OVERLAP, BUSINESS_TOP_K, BUSINESS_FULL_TEXT_LIMIT
+from text_embeddings import embed_text, embed_texts
+
+logger = logging.getLogger(__name__)
+
+# project_id -> {"digest", "chunks", "matrix"}
+_indexes = {}
+
+def _digest(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+def chunk_text(text: str, chunk_size: int = BUSINESS_CHUNK_SIZE, overlap: int = BUSINESS_CHUNK_OVERLAP) -> list:
+    """Режет текст на фрагменты по абзацам; слишком длинные абзацы — окном с перекрытием"""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r'\n\s*\n|\n', text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            step = max(1, chunk_size - overlap)
+            for start in range(0, len(paragraph), step):
+                chunks.append(paragraph[start:start + chunk_size])
+                if start + chunk_size >= len(paragraph):
+                    break
+        elif len(current) + len(paragraph) + 1 > chunk_size:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+def index_project(project_id: str, business_info: str) -> None:
+    """Строит (или перестраивает) индекс фрагментов business_info проекта"""
+    if not business_info or len(business_info) <= BUSINESS_FULL_TEXT_LIMIT:
+        # Небольшие тексты передаются в промпт целиком, индекс им не нужен
+        drop_project_index(project_id)
+        return
+    chunks = chunk_text(business_info)
+    matrix = embed_texts(chunks)
+    # IDF по фрагментам проекта: n-граммы, встречающиеся везде (общие слова каталога), весят меньше
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    idf = (np.log((len(chunks) + 1) / (document_frequency + 1)) + 1).astype(np.float32)
+    _indexes[str(project_id)] = {
+        "digest": _digest(business_info),
+        "chunks": chunks,
+        "idf": idf,
+        "matrix": _normalize_rows(matrix * idf),
+    }
+    logger.info(f"[BUSINESS_INDEX] Проект {project_id}: {len(chunks)} фрагментов в индексе")
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def drop_project_index(project_id: str) -> None:
+    _indexes.pop(str(project_id), None)
+
+def _get_index(project_id: str, business_info: str) -> dict:
+    index = _indexes.get(str(project_id))
+    # Индекс перестраивается лениво, если его нет или текст проекта изменился
+    if index is None or index["digest"] != _digest(business_info):
+        index_project(project_id, business_info)
+        index = _indexes[str(project_id)]
+    return index
+
+def build_business_context(project_id: str, business_info: str, question: str, top_k: int = BUSINESS_TOP_K) -> str:
+    """Возвращает часть business_info, релевантную вопросу (небольшие тексты — целиком)"""
+    if not business_info or len(business_info) <= BUSINESS_FULL_TEXT_LIMIT:
+        return business_info
+    index = _get_index(project_id, business_info)
+    chunks = index["chunks"]
+    if len(chunks) <= top_k:
+        return business_info
+    scores = index["matrix"] @ _normalize_rows(embed_text(question) * index["idf"])
+    # Первый фрагмент обычно описывает сам бизнес, поэтому он передаётся всегда
+    scores[0] = np.inf
+    best = np.argsort(-scores)[:top_k]
+    # Сохраняем исходный порядок фрагментов, чтобы текст читался связно
+    return "\n...\n".join(chunks[i] for i in sorted(best.tolist()))
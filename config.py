@@ -12,6 +12,27 @@ def generate_short_link():
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///bot_database.db")
 
+# Пул соединений с БД (живёт всё время работы приложения)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10))
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", 30))  # секунды простоя до проверки соединения
+# Сколько секунд процесс ждёт, пока миграции схемы применяет другой процесс (migrations.py)
+MIGRATION_LOCK_TIMEOUT = float(os.getenv("MIGRATION_LOCK_TIMEOUT", 300))
+
+# Очередь входящих обновлений Telegram (webhook отвечает сразу, обработка — в воркерах)
+UPDATE_QUEUE_WORKERS = int(os.getenv("UPDATE_QUEUE_WORKERS", 8))
+UPDATE_QUEUE_MAXSIZE = int(os.getenv("UPDATE_QUEUE_MAXSIZE", 1000))
+UPDATE_QUEUE_PUT_TIMEOUT = float(os.getenv("UPDATE_QUEUE_PUT_TIMEOUT", 5))  # секунды ожидания места в очереди
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", 10000))  # сколько последних update_id помнить
+
+# Постоянный кэш загруженного контента: извлечённый из файлов текст и результат сжатия через DeepSeek (content_cache.py)
+CONTENT_CACHE_MAX_BYTES = int(os.getenv("CONTENT_CACHE_MAX_BYTES", 50 * 1024 * 1024))  # при превышении удаляются давно не использованные
+
+# Кэш решений о доступности проекта (по telegram_id владельца)
+ACCESS_CACHE_TTL = float(os.getenv("ACCESS_CACHE_TTL", 60))  # секунды
+ACCESS_CACHE_MAX_SIZE = int(os.getenv("ACCESS_CACHE_MAX_SIZE", 10000))
+
 TRIAL_DAYS = int(os.getenv("TRIAL_DAYS", 10))  # 10 дней пробного периода
 TRIAL_PROJECTS = int(os.getenv("TRIAL_PROJECTS", 3))
 PAID_PROJECTS = int(os.getenv("PAID_PROJECTS", 5))
@@ -34,8 +55,85 @@ SETTINGS_BOT_USERNAME = os.getenv("SETTINGS_BOT_USERNAME")
 
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 
+# HTTP-клиент к DeepSeek (один на всё время работы приложения)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))  # секунды
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))  # секунды
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+
+# Потоковые ответы в основном боте
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))  # секунды между правками сообщения
+STREAM_FIRST_MESSAGE_MAX_WAIT = int(os.getenv("STREAM_FIRST_MESSAGE_MAX_WAIT", 200))  # символов до отправки без конца предложения
+
+# Кэш ответов на повторяющиеся вопросы клиентов (по проекту)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 6 * 3600))  # секунды
+RESPONSE_CACHE_MAX_PER_PROJECT = int(os.getenv("RESPONSE_CACHE_MAX_PER_PROJECT", 200))
+# Порог похожести вопросов по n-граммам символов (сравнивает написание, не смысл); 0 — только точное совпадение
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0))
+
+# Поиск релевантных фрагментов business_info вместо передачи всего текста в промпт
+BUSINESS_CHUNK_SIZE = int(os.getenv("BUSINESS_CHUNK_SIZE", 800))  # символов
+BUSINESS_CHUNK_OVERLAP = int(os.getenv("BUSINESS_CHUNK_OVERLAP", 100))  # символов
+BUSINESS_TOP_K = int(os.getenv("BUSINESS_TOP_K", 4))
+BUSINESS_FULL_TEXT_LIMIT = int(os.getenv("BUSINESS_FULL_TEXT_LIMIT", 3000))  # до этого размера текст передаётся целиком
+
+# Отложенная пакетная запись аналитики (message_stat, query_theme, response_rating)
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", 200))  # записей до внеочередной записи
+TELEMETRY_FLUSH_INTERVAL_MS = int(os.getenv("TELEMETRY_FLUSH_INTERVAL_MS", 500))
+TELEMETRY_MAX_PENDING = int(os.getenv("TELEMETRY_MAX_PENDING", 20000))  # сверх этого новые записи отбрасываются
+TELEMETRY_MAX_ATTEMPTS = int(os.getenv("TELEMETRY_MAX_ATTEMPTS", 5))  # после стольких неудачных записей пачка отбрасывается
+
+# Исходящие запросы к Telegram (лимиты на бота и на чат, см. send_scheduler.py)
+SEND_BOT_RATE = float(os.getenv("SEND_BOT_RATE", 25))  # запросов в секунду на бота (лимит Telegram — 30)
+SEND_BOT_BURST = float(os.getenv("SEND_BOT_BURST", 25))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))  # запросов в секунду в один чат
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", 3))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))  # повторов после RetryAfter
+
+# Рассылка ежедневных инсайтов владельцам проектов
+INSIGHTS_SEND_CONCURRENCY = int(os.getenv("INSIGHTS_SEND_CONCURRENCY", 8))  # чатов обрабатывается одновременно
+INSIGHTS_MAX_RETRIES = int(os.getenv("INSIGHTS_MAX_RETRIES", 3))
+
+# Фоновые задачи (job_scheduler.py)
+JOB_LEASE_TTL = float(os.getenv("JOB_LEASE_TTL", 900))  # секунды; после этого зависший запуск считается брошенным
+JOB_MISFIRE_GRACE_TIME = int(os.getenv("JOB_MISFIRE_GRACE_TIME", 300))  # секунды опоздания, при которых запуск ещё выполняется
+
+# Извлечение текста из документов (.pdf, .docx) в пуле процессов
+FILE_EXTRACT_WORKERS = int(os.getenv("FILE_EXTRACT_WORKERS", 2))
+FILE_EXTRACT_TIMEOUT = float(os.getenv("FILE_EXTRACT_TIMEOUT", 30))  # секунды на один файл
+
+# Распознавание голосовых сообщений по частям (transcription.py, движки — asr_backends.py)
+# google — облако, по запросу на чанк; vosk, sphinx — офлайн на CPU в пуле процессов (нужны pip install vosk / pocketsphinx).
+# Несколько через запятую — по порядку: следующий движок пробуется, если предыдущий не справился с чанком
+ASR_BACKEND = os.getenv("ASR_BACKEND", "google")
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", 4))  # одновременных запросов к google на весь сервер
+ASR_PROCESS_WORKERS = int(os.getenv("ASR_PROCESS_WORKERS", 2))  # процессов офлайн-движка (не больше числа ядер)
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", os.path.join(os.path.dirname(__file__), "models", "vosk-model-small-ru"))
+SPHINX_LANGUAGE = os.getenv("SPHINX_LANGUAGE")  # тег языка или каталог модели; по умолчанию — язык сообщения
+TRANSCRIBE_MAX_RETRIES = int(os.getenv("TRANSCRIBE_MAX_RETRIES", 2))
+TRANSCRIBE_BACKOFF_BASE = float(os.getenv("TRANSCRIBE_BACKOFF_BASE", 0.5))  # секунды, удваивается с каждой попыткой
+TRANSCRIBE_TIMEOUT = float(os.getenv("TRANSCRIBE_TIMEOUT", 30))  # секунды на запрос распознавания одного чанка
+
+# Снимок /stats, обновляемый в фоне
+STATS_REFRESH_INTERVAL = float(os.getenv("STATS_REFRESH_INTERVAL", 60))  # секунды
+
 # Google Sheets Analytics
 GOOGLE_SHEETS_WEBHOOK_URL = os.getenv("GOOGLE_SHEETS_WEBHOOK_URL")
+# Отправка аналитики в фоне: по умолчанию строка на запрос (формат, который ждёт webhook Apps Script)
+ANALYTICS_QUEUE_MAXSIZE = int(os.getenv("ANALYTICS_QUEUE_MAXSIZE", 5000))  # при переполнении отбрасываются самые старые
+# Пачки {"rows": [...]} одним запросом — только после обновления скрипта webhook под этот формат
+ANALYTICS_BATCH_PAYLOAD = os.getenv("ANALYTICS_BATCH_PAYLOAD", "0") == "1"
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", 100))  # строк в одном запросе (с ANALYTICS_BATCH_PAYLOAD)
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", 5))  # секунды
+ANALYTICS_MAX_RETRIES = int(os.getenv("ANALYTICS_MAX_RETRIES", 5))
+ANALYTICS_BACKOFF_BASE = float(os.getenv("ANALYTICS_BACKOFF_BASE", 1))  # секунды, удваивается с каждой попыткой
+ANALYTICS_BACKOFF_MAX = float(os.getenv("ANALYTICS_BACKOFF_MAX", 60))  # секунды
+# Каждый процесс пишет в свой файл с pid в имени (analytics_spill.<pid>.jsonl); файлы завершившихся процессов дошлёт живой
+ANALYTICS_SPILL_PATH = os.getenv("ANALYTICS_SPILL_PATH", os.path.join(os.path.dirname(__file__), "analytics_spill.jsonl"))
+ANALYTICS_SPILL_MAX_BYTES = int(os.getenv("ANALYTICS_SPILL_MAX_BYTES", 50 * 1024 * 1024))
 
 # Логируем состояние критических переменных
 logger = logging.getLogger(__name__)
@@ -0,0 +1,91 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import CONTENT_CACHE_MAX_BYTES
+from database import database, ContentCacheEntry
+
+logger = logging.getLogger(__name__)
+
+def file_key(file_unique_id: str) -> str:
+    """Ключ текста, извлечённого из файла Telegram (file_unique_id одинаков у повторно отправленного файла)"""
+    return f"file:{file_unique_id}"
+
+def compressed_key(text: str) -> str:
+    """Ключ сжатой DeepSeek версии текста: тот же текст из другого файла тоже попадает в кэш"""
+    return f"compressed:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+class ContentCache:
+    """Постоянный кэш в SQLite с вытеснением давно не использованных записей (LRU) по общему объёму"""
+
+    def __init__(self, max_bytes: int = CONTENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.stats = {}
+
+    def _kind_stats(self, key: str) -> dict:
+        kind = key.split(":", 1)[0]
+        return self.stats.setdefault(kind, {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0})
+
+    async def get(self, key: str) -> Optional[str]:
+        """Значение по ключу или None; ошибки БД не мешают основной обработке — считаются промахом"""
+        stats = self._kind_stats(key)
+        try:
+            value = await database.fetch_val(select(ContentCacheEntry.value).where(ContentCacheEntry.key == key))
+            if value is not None:
+                await database.execute(
+                    update(ContentCacheEntry).where(ContentCacheEntry.key == key)
+                    .values(last_used_at=datetime.now(timezone.utc))
+                )
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(f"[CACHE] Ошибка чтения кэша контента ({key}): {e}")
+            return None
+        stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    async def put(self, key: str, value: str):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        stats = self._kind_stats(key)
+        now = datetime.now(timezone.utc)
+        query = sqlite_insert(ContentCacheEntry).values(key=key, value=value, size=size, created_at=now, last_used_at=now)
+        try:
+            await database.execute(query.on_conflict_do_update(
+                index_elements=['key'],
+                set_={'value': query.excluded.value, 'size': query.excluded.size, 'last_used_at': query.excluded.last_used_at}
+            ))
+            stats["stores"] += 1
+            await self._evict()
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(f"[CACHE] Ошибка записи в кэш контента ({key}): {e}")
+
+    async def _evict(self):
+        """Удаляет самые давно использованные записи, пока общий объём больше max_bytes"""
+        total = await database.fetch_val(select(func.sum(ContentCacheEntry.size))) or 0
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        rows = await database.fetch_all(
+            select(ContentCacheEntry.key, ContentCacheEntry.size).order_by(ContentCacheEntry.last_used_at)
+        )
+        keys = []
+        for row in rows:
+            if excess <= 0:
+                break
+            keys.append(row['key'])
+            excess -= row['size']
+        await database.execute(ContentCacheEntry.__table__.delete().where(ContentCacheEntry.key.in_(keys)))
+        for key in keys:
+            self._kind_stats(key)["evictions"] += 1
+        logger.info(f"[CACHE] Из кэша контента вытеснено записей: {len(keys)}")
+
+    def metrics(self) -> dict:
+        return {"max_bytes": self.max_bytes, "kinds": self.stats}
+
+content_cache = ContentCache()
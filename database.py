@@ -1,14 +1,19 @@
 import uuid
-from sqlalchemy import insert, create_engine, func, and_, Column, Integer, String, ForeignKey, DateTime, Boolean, Float
+from sqlalchemy import insert, create_engine, func, and_, Column, Integer, String, ForeignKey, DateTime, Boolean, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone, timedelta
-import databases
 from sqlalchemy.sql import select
 from typing import Optional, Dict
 import logging
 from pathlib import Path
 from config import TRIAL_DAYS, generate_short_link
+from db_pool import PooledDatabase
+from migrations import create_tables
+from access_cache import invalidate_access
+from response_cache import invalidate_project_responses
+from business_index import index_project, drop_project_index
+from telemetry_buffer import TelemetryBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +21,8 @@ logger = logging.getLogger(__name__)
 BASE_DIR = Path(__file__).parent
 # Формируем путь к файлу БД в той же папке
 DATABASE_URL = f"sqlite:///{BASE_DIR}/bot_database.db"
-database = databases.Database(DATABASE_URL)
+# Соединения берутся из пула, который открывается при старте приложения (см. base.py)
+database = PooledDatabase(DATABASE_URL)
 
 Base = declarative_base()
 
@@ -29,8 +35,15 @@ class User(Base):
     trial_expired_notified = Column(Boolean, default=False)
     referrer_id = Column(String, nullable=True)  # ID пользователя, который пригласил
     bonus_days = Column(Integer, default=0)  # Дополнительные дни за рефералов
+    trial_ends_at = Column(DateTime, nullable=True)  # start_date + TRIAL_DAYS + bonus_days
+    access_version = Column(Integer, default=0)  # растёт при каждом изменении оплаты и бонусов — сбрасывает кэш доступа во всех процессах
     projects = relationship("Project", back_populates="user")
 
+    # Поиск пользователей с истекающим пробным периодом без просмотра всей таблицы
+    __table_args__ = (
+        Index('ix_user_trial_due', 'paid', 'trial_expired_notified', 'trial_ends_at'),
+    )
+
 # Новая таблица project
 class Project(Base):
     __tablename__ = 'project'
@@ -63,6 +76,12 @@ class MessageStat(Base):
     project_id = Column(String, nullable=True)
     is_trial = Column(Boolean, default=True)
     is_paid = Column(Boolean, default=False)
+    
+    # Индексы для статистики по периодам и по пользователю
+    __table_args__ = (
+        Index('ix_message_stat_datetime', 'datetime'),
+        Index('ix_message_stat_telegram_datetime', 'telegram_id', 'datetime'),
+    )
 
 # Новая таблица Feedback
 class Feedback(Base):
@@ -82,6 +101,11 @@ class Payment(Base):
     amount = Column(Float, nullable=False)
     status = Column(String, default='pending')  # pending, confirmed, rejected
     paid_at = Column(DateTime, default=datetime.now(timezone.utc))
+    
+    # Индекс для поиска последнего платежа пользователя без полного скана таблицы
+    __table_args__ = (
+        Index('ix_payment_telegram_status_paid_at', 'telegram_id', 'status', 'paid_at'),
+    )
 
 # --- Формы ---
 class Form(Base):
@@ -113,6 +137,10 @@ class FormSubmission(Base):
     data_json = Column(String, nullable=False)  # JSON с данными формы
     submitted_at = Column(DateTime, default=datetime.now(timezone.utc))
     form = relationship("Form", back_populates="submissions")
+    
+    __table_args__ = (
+        Index('ix_form_submission_form_telegram', 'form_id', 'telegram_id'),
+    )
 
 # Таблица для рейтинга ответов
 class ResponseRating(Base):
@@ -136,8 +164,9 @@ class ClientProjectHistory(Base):
     visit_count = Column(Integer, default=1)  # Количество посещений
     project = relationship("Project")
     
-    # Уникальный индекс для комбинации клиента и проекта
+    # Индекс для списка проектов клиента, отсортированного по последнему переходу
     __table_args__ = (
+        Index('ix_client_history_client_last_visit', 'client_telegram_id', 'last_visit'),
         {'sqlite_autoincrement': True}
     )
 
@@ -154,12 +183,80 @@ class QueryTheme(Base):
     
     # Индексы для быстрого поиска
     __table_args__ = (
+        Index('ix_query_theme_project_timestamp', 'project_id', 'timestamp'),
         {'sqlite_autoincrement': True}
     )
 
+# --- Агрегаты (rollup) для статистики: обновляются вместе с сырыми записями, пересчитываются rollups.py ---
+class ProjectDailyStat(Base):
+    __tablename__ = 'project_daily_stat'
+    project_id = Column(String, primary_key=True)  # '' для сообщений без проекта
+    day = Column(String, primary_key=True)  # YYYY-MM-DD (UTC)
+    messages = Column(Integer, nullable=False, default=0)
+    replies = Column(Integer, nullable=False, default=0)
+    response_time_sum = Column(Float, nullable=False, default=0)
+    response_time_count = Column(Integer, nullable=False, default=0)
+
+class ProjectDailyUser(Base):
+    __tablename__ = 'project_daily_user'
+    project_id = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)
+    telegram_id = Column(String, primary_key=True)
+
+class DailyActiveUser(Base):
+    __tablename__ = 'daily_active_user'
+    day = Column(String, primary_key=True)
+    telegram_id = Column(String, primary_key=True)
+
+class MessageHourlyStat(Base):
+    __tablename__ = 'message_hourly_stat'
+    hour = Column(String, primary_key=True)  # YYYY-MM-DD HH (UTC)
+    messages = Column(Integer, nullable=False, default=0)
+
+class ThemeHourlyStat(Base):
+    __tablename__ = 'theme_hourly_stat'
+    project_id = Column(String, primary_key=True)
+    hour = Column(String, primary_key=True)  # YYYY-MM-DD HH (UTC)
+    theme = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class RevenueMonthlyStat(Base):
+    __tablename__ = 'revenue_monthly_stat'
+    month = Column(String, primary_key=True)  # YYYY-MM
+    amount = Column(Float, nullable=False, default=0)
+    payments = Column(Integer, nullable=False, default=0)
+
+# Отметки о доставке ежедневных инсайтов: перезапуск рассылки за тот же день не отправляет их повторно
+class InsightsDelivery(Base):
+    __tablename__ = 'insights_delivery'
+    run_day = Column(String, primary_key=True)  # YYYY-MM-DD (UTC)
+    project_id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)  # sent / failed
+    delivered_at = Column(DateTime, nullable=False)
+
+# Аренда фоновых задач: при нескольких воркерах приложения каждый запуск задачи выполняет только один из них
+class JobLease(Base):
+    __tablename__ = 'job_lease'
+    job_id = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)  # токен запуска, захватившего задачу
+    started_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+# Кэш загруженного владельцами контента: текст из файла (по file_unique_id) и его сжатие DeepSeek (по sha256 текста)
+class ContentCacheEntry(Base):
+    __tablename__ = 'content_cache'
+    key = Column(String, primary_key=True)  # file:<file_unique_id> / compressed:<sha256>
+    value = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)  # байт в UTF-8, для ограничения общего объёма
+    created_at = Column(DateTime, nullable=False)
+    last_used_at = Column(DateTime, nullable=False, index=True)
+
 # ВАЖНО: ниже используется синхронный движок только для создания таблиц!
 engine = create_engine(DATABASE_URL.replace("sqlite+aiosqlite", "sqlite"))
-Base.metadata.create_all(bind=engine)
+# create_all — под блокировкой записи: процессы, одновременно стартующие на пустой БД, не мешают друг другу
+create_tables(engine, Base.metadata)
+# create_all не меняет уже существующие таблицы — изменения схемы применяются версионными миграциями
+# (run_migrations) при старте приложения, а не при импорте: импорт не должен менять схему в каждом процессе
 # Это безопасно, так как используется только при старте для миграции схемы.
 
 # CRUD для user
@@ -170,10 +267,12 @@ async def create_user(telegram_id: str, referrer_id: str = None) -> None:
     if not user:
         logging.info(f"[DB] create_user: creating new user {telegram_id} with referrer {referrer_id}")
         # Создаем базовые значения
+        start_date = datetime.now(timezone.utc)
         values = {
             "telegram_id": telegram_id,
             "paid": False,
-            "start_date": datetime.now(timezone.utc),
+            "start_date": start_date,
+            "trial_ends_at": start_date + timedelta(days=TRIAL_DAYS),
             "trial_expired_notified": False
         }
         
@@ -194,13 +293,6 @@ async def create_user(telegram_id: str, referrer_id: str = None) -> None:
         logging.info(f"[DB] create_user: user {telegram_id} created with referrer {referrer_id}")
     else:
         logging.info(f"[DB] create_user: user {telegram_id} already exists, не обновляем paid/start_date")
-    # Диагностика: выводим всех пользователей после создания
-    all_users = await database.fetch_all(select(User))
-    for u in all_users:
-        # Безопасно получаем значения, которые могут отсутствовать
-        referrer_id = getattr(u, 'referrer_id', None)
-        bonus_days = getattr(u, 'bonus_days', 0)
-        logging.info(f"[DB] DEBUG: после create_user: telegram_id={u['telegram_id']}, paid={u['paid']}, start_date={u['start_date']}, trial_expired_notified={u['trial_expired_notified']}, referrer_id={referrer_id}, bonus_days={bonus_days}")
 
 async def get_user(telegram_id: str) -> Optional[dict]:
     logging.info(f"[DB] get_user: telegram_id={telegram_id}")
@@ -233,6 +325,7 @@ async def create_project(telegram_id: str, project_name: str, business_info: str
             telegram_id=telegram_id,
             created_at=datetime.now(timezone.utc)
         ))
+        index_project(project_id, business_info)
         return project_id
     except Exception as e:
         logging.error(f"Error creating project: {e}")
@@ -367,6 +460,8 @@ async def update_project_business_info(project_id: str, new_business_info: str)
         from sqlalchemy import update
         query = update(Project).where(Project.id == project_id).values(business_info=new_business_info)
         await database.execute(query)
+        invalidate_project_responses(project_id)
+        index_project(project_id, new_business_info)
         return True
     except Exception as e:
         logger.error(f"Error updating project business info: {e}")
@@ -385,6 +480,8 @@ async def append_project_business_info(project_id: str, additional_info: str) ->
         updated_info = current_project.get("business_info", "") + "\n\n" + additional_info
         query = update(Project).where(Project.id == project_id).values(business_info=updated_info)
         await database.execute(query)
+        invalidate_project_responses(project_id)
+        index_project(project_id, updated_info)
         return True
     except Exception as e:
         logger.error(f"Error appending project business info: {e}")
@@ -396,18 +493,35 @@ async def delete_project(project_id: str) -> bool:
         from sqlalchemy import delete
         query = delete(Project).where(Project.id == project_id)
         await database.execute(query)
+        invalidate_project_responses(project_id)
+        drop_project_index(project_id)
         return True
     except Exception as e:
         logger.error(f"Error deleting project: {e}")
         return False
 
+def _next_access_version():
+    # У пользователей, созданных до миграции 5, колонка NULL
+    return func.coalesce(User.access_version, 0) + 1
+
+async def get_access_version(telegram_id: str) -> Optional[int]:
+    """Версия доступа пользователя (запрос по первичному ключу); None — пользователя нет"""
+    row = await database.fetch_one(select(User.access_version).where(User.telegram_id == telegram_id))
+    return None if row is None else (row['access_version'] or 0)
+
+async def bump_access_version(telegram_id: str):
+    """Отмечает изменение доступа: решения, закэшированные в любом процессе, больше не используются"""
+    from sqlalchemy import update
+    await database.execute(update(User).where(User.telegram_id == telegram_id).values(access_version=_next_access_version()))
+
 async def set_user_paid(telegram_id: str, paid: bool = True):
     from sqlalchemy import update
-    values = {'paid': paid}
+    values = {'paid': paid, 'access_version': _next_access_version()}
     if paid:
         values['trial_expired_notified'] = False
     query = update(User).where(User.telegram_id == telegram_id).values(**values)
     await database.execute(query)
+    invalidate_access(telegram_id)
 
 async def get_user_by_id(telegram_id: str):
     query = select(User).where(User.telegram_id == telegram_id)
@@ -425,43 +539,14 @@ async def get_user_by_id(telegram_id: str):
     return None
 
 async def get_users_with_expired_trial():
-    from datetime import datetime, timedelta
-    from config import TRIAL_DAYS
-    from sqlalchemy import and_, update
+    """Неоплатившие и ещё не уведомлённые пользователи, у которых истёк пробный период (по индексу trial_ends_at)"""
     now = datetime.now(timezone.utc)
-    logger.info(f"[DB] get_users_with_expired_trial: текущее время UTC = {now}")
-    logger.info(f"[DB] get_users_with_expired_trial: TRIAL_DAYS = {TRIAL_DAYS}")
-    
-    # Получаем всех пользователей и проверяем каждого индивидуально
-    all_users = await database.fetch_all(select(User))
-    logger.info(f"[DB] get_users_with_expired_trial: всего пользователей = {len(all_users)}")
-    
-    expired_users = []
-    for user in all_users:
-        # Безопасно получаем значения, которые могут отсутствовать
-        referrer_id = getattr(user, 'referrer_id', None)
-        bonus_days = getattr(user, 'bonus_days', 0)
-        if bonus_days is None:
-            bonus_days = 0
-        effective_trial_days = TRIAL_DAYS + bonus_days
-        
-        logger.info(f"[DB] USER: telegram_id={user['telegram_id']}, paid={user['paid']}, start_date={user['start_date']}, trial_expired_notified={user['trial_expired_notified']}, referrer_id={referrer_id}, bonus_days={bonus_days}, effective_trial_days={effective_trial_days}")
-        
-        # Проверяем только неоплаченных пользователей, которые еще не были уведомлены
-        if user['paid'] == False and user['trial_expired_notified'] == False:
-            start_date = user['start_date']
-            if start_date.tzinfo is None:
-                start_date = start_date.replace(tzinfo=timezone.utc)
-            
-            time_diff = now - start_date
-            diff_days = time_diff.total_seconds() / 86400
-            
-            logger.info(f"[DB] get_users_with_expired_trial: пользователь {user['telegram_id']} - разница времени: {time_diff}, дней: {diff_days}, эффективный пробный период: {effective_trial_days}")
-            
-            if diff_days >= effective_trial_days:
-                logger.info(f"[DB] get_users_with_expired_trial: пользователь {user['telegram_id']} - пробный период истек")
-                expired_users.append(dict(user))
-    
+    query = select(User).where(and_(
+        User.paid == False,
+        User.trial_expired_notified == False,
+        User.trial_ends_at <= now
+    ))
+    expired_users = [dict(user) for user in await database.fetch_all(query)]
     logger.info(f"[DB] get_users_with_expired_trial: найдено пользователей с истекшим пробным периодом = {len(expired_users)}")
     return expired_users
 
@@ -490,7 +575,7 @@ async def get_user_projects(telegram_id: str) -> list:
 # --- MessageStat ---
 async def log_message_stat(telegram_id, is_command, is_reply, response_time, project_id, is_trial, is_paid):
     logging.info(f"[METRIC] log_message_stat: telegram_id={telegram_id}, is_command={is_command}, is_reply={is_reply}, response_time={response_time}, project_id={project_id}, is_trial={is_trial}, is_paid={is_paid}")
-    query = insert(MessageStat).values(
+    values = dict(
         id=str(uuid.uuid4()),
         telegram_id=telegram_id,
         datetime=datetime.now(timezone.utc),
@@ -501,7 +586,178 @@ async def log_message_stat(telegram_id, is_command, is_reply, response_time, pro
         is_trial=is_trial,
         is_paid=is_paid
     )
-    await database.execute(query)
+    # Запись уходит в буфер и пишется пачкой вместе с агрегатами, не задерживая ответ пользователю
+    await telemetry_buffer.add('message_stat', values)
+
+# --- Агрегаты (rollup) ---
+def _day_key(value) -> str:
+    return _to_utc(value).strftime('%Y-%m-%d')
+
+def _hour_key(value) -> str:
+    return _to_utc(value).strftime('%Y-%m-%d %H')
+
+async def apply_message_rollups(rows: list):
+    """Добавляет записи message_stat (словари) в дневные и почасовые агрегаты; принимает пачку записей"""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    if not rows:
+        return
+    daily = {}
+    project_users = set()
+    active_users = set()
+    hourly = {}
+    for row in rows:
+        project_id = row.get('project_id') or ''
+        day = _day_key(row['datetime'])
+        stat = daily.setdefault((project_id, day), {
+            'project_id': project_id, 'day': day, 'messages': 0, 'replies': 0,
+            'response_time_sum': 0.0, 'response_time_count': 0,
+        })
+        stat['messages'] += 1
+        if row.get('is_reply'):
+            stat['replies'] += 1
+        if row.get('response_time') is not None:
+            stat['response_time_sum'] += row['response_time']
+            stat['response_time_count'] += 1
+        telegram_id = str(row['telegram_id'])
+        project_users.add((project_id, day, telegram_id))
+        active_users.add((day, telegram_id))
+        hour = _hour_key(row['datetime'])
+        hourly[hour] = hourly.get(hour, 0) + 1
+
+    query = sqlite_insert(ProjectDailyStat).values(list(daily.values()))
+    await database.execute(query.on_conflict_do_update(
+        index_elements=['project_id', 'day'],
+        set_={
+            'messages': ProjectDailyStat.messages + query.excluded.messages,
+            'replies': ProjectDailyStat.replies + query.excluded.replies,
+            'response_time_sum': ProjectDailyStat.response_time_sum + query.excluded.response_time_sum,
+            'response_time_count': ProjectDailyStat.response_time_count + query.excluded.response_time_count,
+        }
+    ))
+    await database.execute(sqlite_insert(ProjectDailyUser).values([
+        {'project_id': project_id, 'day': day, 'telegram_id': telegram_id}
+        for project_id, day, telegram_id in project_users
+    ]).on_conflict_do_nothing())
+    await database.execute(sqlite_insert(DailyActiveUser).values([
+        {'day': day, 'telegram_id': telegram_id} for day, telegram_id in active_users
+    ]).on_conflict_do_nothing())
+    query = sqlite_insert(MessageHourlyStat).values([
+        {'hour': hour, 'messages': count} for hour, count in hourly.items()
+    ])
+    await database.execute(query.on_conflict_do_update(
+        index_elements=['hour'],
+        set_={'messages': MessageHourlyStat.messages + query.excluded.messages}
+    ))
+
+async def apply_theme_rollups(rows: list):
+    """Добавляет записи query_theme (словари с project_id, theme, timestamp) в почасовые счётчики тем"""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    if not rows:
+        return
+    counts = {}
+    for row in rows:
+        key = (row['project_id'], _hour_key(row['timestamp']), row['theme'])
+        counts[key] = counts.get(key, 0) + 1
+    query = sqlite_insert(ThemeHourlyStat).values([
+        {'project_id': project_id, 'hour': hour, 'theme': theme, 'count': count}
+        for (project_id, hour, theme), count in counts.items()
+    ])
+    await database.execute(query.on_conflict_do_update(
+        index_elements=['project_id', 'hour', 'theme'],
+        set_={'count': ThemeHourlyStat.count + query.excluded.count}
+    ))
+
+async def apply_revenue_rollup(paid_at, amount: float):
+    """Учитывает подтверждённый платёж в помесячной выручке"""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    query = sqlite_insert(RevenueMonthlyStat).values(month=_to_utc(paid_at).strftime('%Y-%m'), amount=amount, payments=1)
+    await database.execute(query.on_conflict_do_update(
+        index_elements=['month'],
+        set_={
+            'amount': RevenueMonthlyStat.amount + query.excluded.amount,
+            'payments': RevenueMonthlyStat.payments + query.excluded.payments,
+        }
+    ))
+
+async def get_theme_counts(project_id: str, hours: int = 24) -> list:
+    """Темы запросов проекта за последние hours часов из почасовых агрегатов: [(тема, количество)] по убыванию"""
+    since = _hour_key(datetime.now(timezone.utc) - timedelta(hours=hours - 1))
+    total = func.sum(ThemeHourlyStat.count).label('total')
+    query = select(ThemeHourlyStat.theme, total).where(
+        and_(ThemeHourlyStat.project_id == project_id, ThemeHourlyStat.hour >= since)
+    ).group_by(ThemeHourlyStat.theme).order_by(total.desc())
+    rows = await database.fetch_all(query)
+    return [(row['theme'], row['total']) for row in rows]
+
+async def get_theme_counts_by_project(hours: int = 24) -> list:
+    """Темы запросов всех проектов за последние hours часов одним GROUP BY: [{project_id, project_name, telegram_id, themes}]"""
+    since = _hour_key(datetime.now(timezone.utc) - timedelta(hours=hours - 1))
+    total = func.sum(ThemeHourlyStat.count).label('total')
+    query = select(
+        ThemeHourlyStat.project_id, Project.project_name, Project.telegram_id, ThemeHourlyStat.theme, total
+    ).join(Project, Project.id == ThemeHourlyStat.project_id).where(
+        ThemeHourlyStat.hour >= since
+    ).group_by(
+        ThemeHourlyStat.project_id, Project.project_name, Project.telegram_id, ThemeHourlyStat.theme
+    ).order_by(ThemeHourlyStat.project_id, total.desc())
+    projects = {}
+    for row in await database.fetch_all(query):
+        project = projects.setdefault(row['project_id'], {
+            'project_id': row['project_id'],
+            'project_name': row['project_name'],
+            'telegram_id': row['telegram_id'],
+            'themes': [],
+        })
+        project['themes'].append((row['theme'], row['total']))
+    return list(projects.values())
+
+async def get_delivered_insights(run_day: str) -> set:
+    """Проекты, которым инсайты за run_day уже доставлены (или доставка окончательно не удалась)"""
+    rows = await database.fetch_all(select(InsightsDelivery.project_id).where(InsightsDelivery.run_day == run_day))
+    return {row['project_id'] for row in rows}
+
+async def mark_insights_delivered(run_day: str, project_id: str, status: str = 'sent'):
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    query = sqlite_insert(InsightsDelivery).values(
+        run_day=run_day, project_id=project_id, status=status, delivered_at=datetime.now(timezone.utc)
+    )
+    await database.execute(query.on_conflict_do_update(
+        index_elements=['run_day', 'project_id'],
+        set_={'status': query.excluded.status, 'delivered_at': query.excluded.delivered_at}
+    ))
+
+async def prune_insights_deliveries(before_day: str):
+    """Удаляет старые отметки о доставке инсайтов"""
+    await database.execute(InsightsDelivery.__table__.delete().where(InsightsDelivery.run_day < before_day))
+
+# --- Отложенная запись аналитики ---
+# Строк в одном многострочном INSERT: держимся ниже лимита SQLite на число параметров запроса
+# Старые сборки SQLite (до 3.32) допускают не больше 999 параметров в одном запросе
+SQLITE_MAX_VARIABLES = 999
+
+def _chunk_size(*models) -> int:
+    """Строк в многострочном INSERT: параметров (строки × колонки) не больше SQLITE_MAX_VARIABLES
+    в самой широкой из таблиц, куда пишется часть (сама таблица и её агрегаты)"""
+    return max(1, SQLITE_MAX_VARIABLES // max(len(model.__table__.columns) for model in models))
+
+def _chunks(rows: list, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+async def _write_telemetry(batch: dict):
+    """Пишет пачку аналитических записей и их агрегаты одной транзакцией (многострочными INSERT)"""
+    async with database.transaction():
+        for rows in _chunks(batch.get('message_stat', []), _chunk_size(MessageStat, ProjectDailyStat)):
+            await database.execute(insert(MessageStat).values(rows))
+            await apply_message_rollups(rows)
+        for rows in _chunks(batch.get('query_theme', []), _chunk_size(QueryTheme, ThemeHourlyStat)):
+            await database.execute(insert(QueryTheme).values(rows))
+            await apply_theme_rollups(rows)
+        for rows in _chunks(batch.get('response_rating', []), _chunk_size(ResponseRating)):
+            await database.execute(insert(ResponseRating).values(rows))
+
+# Запускается и останавливается вместе с приложением (см. base.py)
+telemetry_buffer = TelemetryBuffer(_write_telemetry)
 
 # --- Feedback ---
 async def add_feedback(telegram_id, username, feedback_text, is_positive=None):
@@ -559,6 +815,61 @@ async def get_payments():
     
     return result
 
+# Длительность оплаченного периода подписки
+SUBSCRIPTION_DAYS = 30
+
+def _to_utc(value):
+    """Приводит дату из БД (datetime или строку) к aware datetime в UTC"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+async def get_last_payment(telegram_id: str, status: Optional[str] = 'confirmed') -> Optional[dict]:
+    """Возвращает последний платёж пользователя (status=None — с любым статусом)"""
+    conditions = [Payment.telegram_id == telegram_id]
+    if status is not None:
+        conditions.append(Payment.status == status)
+    query = select(Payment).where(and_(*conditions)).order_by(Payment.paid_at.desc()).limit(1)
+    row = await database.fetch_one(query)
+    return dict(row) if row else None
+
+async def get_user_payment_counts(telegram_id: str) -> Dict[str, int]:
+    """Количество платежей пользователя по статусам, например {'confirmed': 2, 'pending': 1}"""
+    query = select(Payment.status, func.count(Payment.id)).where(
+        Payment.telegram_id == telegram_id
+    ).group_by(Payment.status)
+    rows = await database.fetch_all(query)
+    return {r[0]: r[1] for r in rows}
+
+async def get_user_subscription(telegram_id: str) -> dict:
+    """Статус подписки пользователя по последнему подтверждённому платежу"""
+    last_payment = await get_last_payment(telegram_id, 'confirmed')
+    if not last_payment:
+        return {
+            "telegram_id": telegram_id,
+            "status": "none",
+            "last_payment": None,
+            "last_paid_at": None,
+            "expires_at": None,
+            "days_since_payment": None,
+            "days_left": 0
+        }
+    last_paid_at = _to_utc(last_payment['paid_at'])
+    days_since_payment = (datetime.now(timezone.utc) - last_paid_at).days
+    return {
+        "telegram_id": telegram_id,
+        "status": "active" if days_since_payment <= SUBSCRIPTION_DAYS else "expired",
+        "last_payment": last_payment,
+        "last_paid_at": last_paid_at,
+        "expires_at": last_paid_at + timedelta(days=SUBSCRIPTION_DAYS),
+        "days_since_payment": days_since_payment,
+        "days_left": max(0, SUBSCRIPTION_DAYS - days_since_payment)
+    }
+
 async def confirm_payment(telegram_id: str):
     """Подтверждает pending платеж пользователя"""
     logging.info(f"[DB] confirm_payment: подтверждение платежа для пользователя {telegram_id}")
@@ -577,7 +888,11 @@ async def confirm_payment(telegram_id: str):
         logging.info(f"[DB] confirm_payment: найден pending платеж: id={pending_payment['id']}, amount={pending_payment['amount']}, paid_at={pending_payment['paid_at']}, status={pending_payment['status']}, telegram_id={pending_payment['telegram_id']}")
         # Обновляем статус на confirmed
         update_query = update(Payment).where(Payment.id == pending_payment['id']).values(status='confirmed')
-        await database.execute(update_query)
+        async with database.transaction():
+            await database.execute(update_query)
+            await apply_revenue_rollup(pending_payment['paid_at'], pending_payment['amount'])
+            await bump_access_version(telegram_id)
+        invalidate_access(telegram_id)
         logging.info(f"[DB] confirm_payment: платеж {pending_payment['id']} для пользователя {telegram_id} обновлён: статус 'pending' -> 'confirmed'")
         return True
     except Exception as e:
@@ -617,7 +932,10 @@ async def reject_payment(telegram_id: str):
         
         # Обновляем статус на rejected
         update_query = update(Payment).where(Payment.id == pending_payment['id']).values(status='rejected')
-        await database.execute(update_query)
+        async with database.transaction():
+            await database.execute(update_query)
+            await bump_access_version(telegram_id)
+        invalidate_access(telegram_id)
         logging.info(f"[DB] reject_payment: платеж {pending_payment['id']} отклонен для пользователя {telegram_id}")
         return True
     except Exception as e:
@@ -632,6 +950,7 @@ async def update_project_welcome_message(project_id: str, new_welcome_message: s
         from sqlalchemy import update
         query = update(Project).where(Project.id == project_id).values(welcome_message=new_welcome_message)
         await database.execute(query)
+        invalidate_project_responses(project_id)
         return True
     except Exception as e:
         logger.error(f"Error updating project welcome message: {e}")
@@ -698,9 +1017,13 @@ async def add_bonus_days_to_referrer(referrer_id: str, bonus_days: int = 10):
     try:
         from sqlalchemy import update
         query = update(User).where(User.telegram_id == referrer_id).values(
-            bonus_days=User.bonus_days + bonus_days
+            bonus_days=User.bonus_days + bonus_days,
+            # Срок окончания пробного периода сдвигается вместе с бонусными днями
+            trial_ends_at=func.datetime(User.trial_ends_at, f'+{int(bonus_days)} days'),
+            access_version=_next_access_version()
         )
         await database.execute(query)
+        invalidate_access(referrer_id)
         logging.info(f"[REFERRAL] add_bonus_days_to_referrer: успешно добавлено {bonus_days} дней рефереру {referrer_id}")
     except Exception as e:
         logging.error(f"[REFERRAL] add_bonus_days_to_referrer: ОШИБКА: {e}")
@@ -971,16 +1294,15 @@ async def get_response_ratings_stats():
 async def log_rating_stat(telegram_id: str, message_id: str, rating: bool, project_id: str = None):
     """Логирует статистику рейтинга для аналитики"""
     try:
-        # Создаем запись в таблице ResponseRating
-        query = insert(ResponseRating).values(
+        # Запись в ResponseRating уходит в буфер аналитики
+        await telemetry_buffer.add('response_rating', dict(
             id=str(uuid.uuid4()),
             telegram_id=telegram_id,
             message_id=message_id,
             rating=rating,
             project_id=project_id,
             created_at=datetime.now(timezone.utc)
-        )
-        await database.execute(query)
+        ))
         
         logging.info(f"[RATING_STAT] Сохранена статистика рейтинга: user={telegram_id}, message={message_id}, rating={'positive' if rating else 'negative'}, project={project_id}")
         return True
@@ -1126,7 +1448,7 @@ async def save_query_theme(project_id: str, user_id: str, original_query: str, t
     """Сохраняет тему запроса для аналитики"""
     logging.info(f"[STATS] save_query_theme: project={project_id}, user={user_id}, theme={theme}")
     try:
-        query = insert(QueryTheme).values(
+        values = dict(
             id=str(uuid.uuid4()),
             project_id=project_id,
             user_id=user_id,
@@ -1134,8 +1456,8 @@ async def save_query_theme(project_id: str, user_id: str, original_query: str, t
             theme=theme,
             timestamp=timestamp
         )
-        await database.execute(query)
-        logging.info(f"[STATS] Тема запроса сохранена: {theme}")
+        await telemetry_buffer.add('query_theme', values)
+        logging.info(f"[STATS] Тема запроса поставлена в запись: {theme}")
         return True
     except Exception as e:
         logging.error(f"[STATS] Ошибка сохранения темы запроса: {e}")
@@ -1171,35 +1493,14 @@ async def get_project_query_statistics(project_id: str, days: int = 7) -> dict:
     """Получает статистику запросов проекта за указанное количество дней"""
     logging.info(f"[STATS] get_project_query_statistics: project={project_id}, days={days}")
     try:
-        from datetime import datetime, timezone, timedelta
-        
-        # Время N дней назад
-        days_ago = datetime.now(timezone.utc) - timedelta(days=days)
-        
-        query = select(QueryTheme).where(
-            and_(
-                QueryTheme.project_id == project_id,
-                QueryTheme.timestamp >= days_ago
-            )
-        ).order_by(QueryTheme.timestamp.desc())
-        
-        rows = await database.fetch_all(query)
-        
-        # Анализируем статистику
-        theme_counts = {}
-        total_queries = len(rows)
-        
-        for row in rows:
-            theme = row['theme']
-            theme_counts[theme] = theme_counts.get(theme, 0) + 1
-        
-        # Сортируем по популярности
-        sorted_themes = sorted(theme_counts.items(), key=lambda x: x[1], reverse=True)
+        # Счётчики тем берутся из почасовых агрегатов, а не из сырых записей
+        theme_counts = await get_theme_counts(project_id, hours=days * 24)
+        total_queries = sum(count for _, count in theme_counts)
         
         result = {
             "total_queries": total_queries,
             "unique_themes": len(theme_counts),
-            "top_themes": sorted_themes[:10],  # Топ-10 тем
+            "top_themes": theme_counts[:10],  # Топ-10 тем
             "period_days": days
         }
         
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+
+import aiosqlite
+import databases
+from databases.backends.sqlite import SQLiteBackend, SQLiteConnection
+from databases.core import DatabaseURL
+
+from config import DB_POOL_SIZE, DB_POOL_MIN_SIZE, DB_POOL_ACQUIRE_TIMEOUT, DB_HEALTHCHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+class PooledSQLitePool:
+    """Пул постоянных aiosqlite-соединений вместо нового соединения на каждый запрос"""
+
+    def __init__(self, url: DatabaseURL, pool_size: int = DB_POOL_SIZE, min_size: int = DB_POOL_MIN_SIZE,
+                 acquire_timeout: float = DB_POOL_ACQUIRE_TIMEOUT, healthcheck_interval: float = DB_HEALTHCHECK_INTERVAL,
+                 **options):
+        self._database = url.database
+        self._options = options
+        self.pool_size = max(1, pool_size)
+        self.min_size = max(0, min(min_size, self.pool_size))
+        self.acquire_timeout = acquire_timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._idle: asyncio.LifoQueue = None
+        self._semaphore: asyncio.Semaphore = None
+        self._last_used = {}
+        self._opened = 0
+        self.stats = {"opened_total": 0, "closed_total": 0, "acquired_total": 0, "healthcheck_failed": 0, "wait_time_total": 0.0}
+
+    def _ensure_primitives(self):
+        # Примитивы создаются лениво, чтобы быть привязанными к рабочему event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.pool_size)
+            self._idle = asyncio.LifoQueue()
+
+    async def _open(self) -> aiosqlite.Connection:
+        connection = await aiosqlite.connect(database=self._database, isolation_level=None, **self._options)
+        # WAL позволяет читателям не блокироваться на время записи
+        await connection.execute("PRAGMA journal_mode=WAL")
+        await connection.execute("PRAGMA busy_timeout=5000")
+        await connection.execute("PRAGMA synchronous=NORMAL")
+        self._opened += 1
+        self.stats["opened_total"] += 1
+        logger.info(f"[DB_POOL] Открыто соединение ({self._opened}/{self.pool_size})")
+        return connection
+
+    async def _close(self, connection: aiosqlite.Connection):
+        self._last_used.pop(id(connection), None)
+        self._opened -= 1
+        self.stats["closed_total"] += 1
+        try:
+            await connection.close()
+        except Exception as e:
+            logger.warning(f"[DB_POOL] Ошибка при закрытии соединения: {e}")
+
+    async def _is_healthy(self, connection: aiosqlite.Connection) -> bool:
+        try:
+            async with connection.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
+            return True
+        except Exception as e:
+            self.stats["healthcheck_failed"] += 1
+            logger.warning(f"[DB_POOL] Соединение не прошло health check: {e}")
+            return False
+
+    async def warm_up(self):
+        """Заранее открывает min_size соединений"""
+        self._ensure_primitives()
+        while self._opened < self.min_size:
+            connection = await self._open()
+            self._last_used[id(connection)] = time.monotonic()
+            self._idle.put_nowait(connection)
+
+    async def acquire(self) -> aiosqlite.Connection:
+        self._ensure_primitives()
+        started = time.monotonic()
+        await asyncio.wait_for(self._semaphore.acquire(), timeout=self.acquire_timeout)
+        self.stats["wait_time_total"] += time.monotonic() - started
+        try:
+            connection = None
+            while not self._idle.empty():
+                candidate = self._idle.get_nowait()
+                idle_for = time.monotonic() - self._last_used.get(id(candidate), 0)
+                if idle_for < self.healthcheck_interval or await self._is_healthy(candidate):
+                    connection = candidate
+                    break
+                await self._close(candidate)
+            if connection is None:
+                connection = await self._open()
+            self.stats["acquired_total"] += 1
+            return connection
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    async def release(self, connection: aiosqlite.Connection) -> None:
+        try:
+            if connection.in_transaction:
+                # Незавершённая транзакция не должна попасть к следующему запросу
+                await connection.rollback()
+            self._last_used[id(connection)] = time.monotonic()
+            self._idle.put_nowait(connection)
+        except Exception as e:
+            logger.warning(f"[DB_POOL] Соединение не возвращено в пул: {e}")
+            await self._close(connection)
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        if self._idle is None:
+            return
+        while not self._idle.empty():
+            await self._close(self._idle.get_nowait())
+
+    def metrics(self) -> dict:
+        idle = self._idle.qsize() if self._idle is not None else 0
+        return {
+            "pool_size": self.pool_size,
+            "opened": self._opened,
+            "idle": idle,
+            "in_use": self._opened - idle,
+            **self.stats,
+        }
+
+class PooledSQLiteBackend(SQLiteBackend):
+    """SQLite-бэкенд databases, использующий PooledSQLitePool"""
+
+    def __init__(self, database_url, **options):
+        pool_options = {
+            key: options.pop(key)
+            for key in ("pool_size", "min_size", "acquire_timeout", "healthcheck_interval")
+            if key in options
+        }
+        super().__init__(database_url, **options)
+        self._pool = PooledSQLitePool(self._database_url, **pool_options, **self._options)
+
+    async def connect(self) -> None:
+        await self._pool.warm_up()
+
+    async def disconnect(self) -> None:
+        await self._pool.close()
+
+    def connection(self) -> SQLiteConnection:
+        return SQLiteConnection(self._pool, self._dialect)
+
+class PooledDatabase(databases.Database):
+    """databases.Database, у которого sqlite обслуживается пулом постоянных соединений"""
+    SUPPORTED_BACKENDS = {**databases.Database.SUPPORTED_BACKENDS, "sqlite": "db_pool:PooledSQLiteBackend"}
+
+async def startup_database(database):
+    """Подключает БД один раз при старте приложения"""
+    if not database.is_connected:
+        await database.connect()
+    healthy = await check_database_health(database)
+    logger.info(f"[DB_POOL] База данных подключена, health={healthy}")
+
+async def shutdown_database(database):
+    """Закрывает все соединения пула при остановке приложения"""
+    if database.is_connected:
+        await database.disconnect()
+    logger.info("[DB_POOL] База данных отключена")
+
+async def check_database_health(database) -> bool:
+    try:
+        return await database.fetch_val("SELECT 1") == 1
+    except Exception as e:
+        logger.error(f"[DB_POOL] Health check не пройден: {e}")
+        return False
+
+def get_pool_metrics(database) -> dict:
+    pool = getattr(database._backend, "_pool", None)
+    if isinstance(pool, PooledSQLitePool):
+        return pool.metrics()
+    return {}
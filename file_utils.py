@@ -1,8 +1,12 @@
 import os
 import re
 import asyncio
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
 import logging
+from config import FILE_EXTRACT_WORKERS, FILE_EXTRACT_TIMEOUT
+from process_pool import create_process_pool, terminate_process_pool
 
 def safe_read_file(content: bytes) -> str:
     try:
@@ -10,33 +14,107 @@ def safe_read_file(content: bytes) -> str:
     except UnicodeDecodeError:
         return content.decode("cp1251", errors="ignore")
 
-def extract_text_from_file(filename: str, content: bytes) -> str:
+def _extract_pdf(content: bytes, max_length: Optional[int]) -> str:
+    from io import BytesIO
+    import PyPDF2
+    reader = PyPDF2.PdfReader(BytesIO(content))
+    text = []
+    total = 0
+    # Страницы разбираются по одной: дальше лимита не идём, даже если в PDF сотни страниц
+    for page in reader.pages:
+        page_text = page.extract_text() or ""
+        text.append(page_text)
+        total += len(page_text) + 1
+        if max_length is not None and total > max_length:
+            break
+    return "\n".join(text)
+
+def _extract_docx(content: bytes, max_length: Optional[int]) -> str:
+    from io import BytesIO
+    from docx import Document
+    doc = Document(BytesIO(content))
+    text = []
+    total = 0
+    for p in doc.paragraphs:
+        text.append(p.text)
+        total += len(p.text) + 1
+        if max_length is not None and total > max_length:
+            break
+    return "\n".join(text)
+
+def extract_text_from_file(filename: str, content: bytes, max_length: Optional[int] = None) -> str:
+    """Извлекает текст из файла; при заданном max_length останавливается, как только текст стал длиннее,
+    и возвращает не больше max_length + 1 символов (по длине результата вызывающий видит превышение)"""
     logging.info(f"[FILE_UTILS] extract_text_from_file: filename={filename}")
     ext = os.path.splitext(filename)[1].lower()
     if ext == ".txt":
-        return safe_read_file(content)
+        text = safe_read_file(content)
     elif ext == ".docx":
-        from io import BytesIO
-        from docx import Document
-        doc = Document(BytesIO(content))
-        return "\n".join([p.text for p in doc.paragraphs])
+        text = _extract_docx(content, max_length)
     elif ext == ".pdf":
-        from io import BytesIO
-        import PyPDF2
-        reader = PyPDF2.PdfReader(BytesIO(content))
-        text = []
-        for page in reader.pages:
-            text.append(page.extract_text() or "")
-        return "\n".join(text)
+        text = _extract_pdf(content, max_length)
     else:
         raise ValueError("Неподдерживаемый формат файла. Поддерживаются: .txt, .docx, .pdf")
+    if max_length is not None and len(text) > max_length:
+        text = text[:max_length + 1]
     logging.info(f"[FILE_UTILS] extract_text_from_file: done for {filename}")
+    return text
 
-async def extract_text_from_file_async(filename: str, content: bytes) -> str:
-    """Асинхронная версия extract_text_from_file"""
-    # Используем asyncio.to_thread для выполнения синхронной функции в отдельном потоке
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, extract_text_from_file, filename, content)
+# Разбор документов идёт в отдельных процессах: PyPDF2 держит GIL и иначе останавливает event loop
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_semaphore: Optional[asyncio.Semaphore] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Воркеры не импортируют приложение (server.py) — см. process_pool
+        _pool = create_process_pool(FILE_EXTRACT_WORKERS)
+    return _pool
+
+def _terminate_pool():
+    """Убивает процессы пула (зависший разбор иначе не прервать) и сбрасывает пул"""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        terminate_process_pool(pool)
+
+async def extract_text_from_file_async(filename: str, content: bytes, max_length: Optional[int] = None,
+                                       timeout: float = FILE_EXTRACT_TIMEOUT) -> str:
+    """Асинхронная версия extract_text_from_file: разбор в пуле процессов с ограничением по времени"""
+    global _pool_semaphore
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".txt":
+        # Декодирование текста дешёвое, отдельный процесс не нужен
+        return extract_text_from_file(filename, content, max_length)
+    if _pool_semaphore is None:
+        _pool_semaphore = asyncio.Semaphore(FILE_EXTRACT_WORKERS)
+    # Семафор держит не больше FILE_EXTRACT_WORKERS файлов в работе, поэтому таймаут не съедается ожиданием в очереди пула
+    async with _pool_semaphore:
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = _get_pool()
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(pool, extract_text_from_file, filename, content, max_length), timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                logging.error(f"[FILE_UTILS] Разбор {filename} не уложился в {timeout} с, процессы пула перезапускаются")
+                if pool is _pool:
+                    _terminate_pool()
+                raise TimeoutError(f"Файл обрабатывается слишком долго (более {timeout:.0f} с)")
+            except BrokenProcessPool:
+                # Пул перезапущен из-за чужого зависшего файла (или процесс упал) — повторяем один раз в новом
+                if pool is _pool:
+                    _terminate_pool()
+                if attempt:
+                    raise
+
+async def shutdown_extraction_pool():
+    """Останавливает пул процессов разбора (при остановке приложения)"""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
 
 def extract_assertions(text: str) -> list:
     """Простая функция: каждое предложение — отдельное утверждение."""
@@ -0,0 +1,136 @@
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.util import ref_to_obj
+from sqlalchemy import and_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import JOB_LEASE_TTL, JOB_MISFIRE_GRACE_TIME
+from database import database, JobLease
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор процесса приложения (для отладки аренды при нескольких воркерах)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+async def acquire_lease(job_id: str, min_gap: float, ttl: float = JOB_LEASE_TTL) -> str:
+    """Захватывает задачу на время запуска; возвращает токен или None, если её уже выполняет (или выполнил) другой воркер"""
+    now = datetime.now(timezone.utc)
+    token = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    query = sqlite_insert(JobLease).values(
+        job_id=job_id, owner=token, started_at=now, expires_at=now + timedelta(seconds=ttl)
+    )
+    # Захват возможен, только если прошлый запуск завершён (или аренда истекла) и был не в этом же окне расписания:
+    # так один и тот же плановый запуск не выполнится дважды на разных воркерах
+    await database.execute(query.on_conflict_do_update(
+        index_elements=['job_id'],
+        set_={'owner': query.excluded.owner, 'started_at': query.excluded.started_at, 'expires_at': query.excluded.expires_at},
+        where=and_(JobLease.expires_at <= now, JobLease.started_at <= now - timedelta(seconds=min_gap))
+    ))
+    owner = await database.fetch_val(select(JobLease.owner).where(JobLease.job_id == job_id))
+    return token if owner == token else None
+
+async def release_lease(job_id: str, token: str):
+    await database.execute(
+        update(JobLease).where(and_(JobLease.job_id == job_id, JobLease.owner == token))
+        .values(expires_at=datetime.now(timezone.utc))
+    )
+
+class JobScheduler:
+    """Единый планировщик фоновых задач: расписание в памяти каждого воркера, один исполнитель на запуск
+    (аренда в БД), метрики по задачам"""
+
+    def __init__(self):
+        # Хранилище в памяти: APScheduler 3 не поддерживает общее постоянное хранилище у нескольких планировщиков
+        # (каждый воркер переписывал бы строки задач и next_run_time), а синхронный движок блокировал бы event loop.
+        # Что запуск выполнит только один воркер, обеспечивает acquire_lease
+        self.scheduler = AsyncIOScheduler(
+            job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': JOB_MISFIRE_GRACE_TIME},
+            timezone=timezone.utc,
+        )
+        self.scheduler.add_listener(self._on_event, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+        self.stats = {}
+
+    def _job_stats(self, job_id: str) -> dict:
+        return self.stats.setdefault(job_id, {
+            "runs": 0, "failures": 0, "skipped_lease": 0, "overlaps": 0, "missed": 0,
+            "duration_last": 0.0, "duration_total": 0.0, "duration_max": 0.0,
+            "last_started_at": None, "last_error": None,
+        })
+
+    def _on_event(self, event):
+        stats = self._job_stats(event.job_id)
+        if event.code == EVENT_JOB_MAX_INSTANCES:
+            # Предыдущий запуск в этом воркере ещё не закончился к следующему сроку
+            stats["overlaps"] += 1
+            logger.warning(f"[JOBS] {event.job_id}: предыдущий запуск ещё выполняется, текущий пропущен")
+        else:
+            stats["missed"] += 1
+
+    def add_job(self, job_id: str, func_ref: str, trigger: str, min_gap: float, **trigger_args):
+        """Регистрирует задачу; func_ref — 'модуль:функция', min_gap — минимальный интервал между запусками в секундах"""
+        self.scheduler.add_job(
+            run_job, trigger, id=job_id, name=func_ref, args=[job_id, func_ref, min_gap],
+            replace_existing=True, **trigger_args
+        )
+
+    def start(self):
+        """Запускает планировщик (вызывается из lifespan приложения, после подключения БД)"""
+        if not self.scheduler.running:
+            self.scheduler.start()
+            jobs = ", ".join(f"{job.id} ({job.next_run_time})" for job in self.scheduler.get_jobs())
+            logger.info(f"[JOBS] Планировщик запущен ({WORKER_ID}): {jobs}")
+
+    def stop(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+            logger.info("[JOBS] Планировщик остановлен")
+
+    async def execute(self, job_id: str, func_ref: str, min_gap: float):
+        stats = self._job_stats(job_id)
+        token = await acquire_lease(job_id, min_gap)
+        if token is None:
+            stats["skipped_lease"] += 1
+            logger.info(f"[JOBS] {job_id}: выполняется или уже выполнен другим воркером, пропуск")
+            return
+        started = time.monotonic()
+        stats["last_started_at"] = datetime.now(timezone.utc).isoformat()
+        try:
+            await ref_to_obj(func_ref)()
+            stats["runs"] += 1
+        except Exception as e:
+            stats["failures"] += 1
+            stats["last_error"] = repr(e)
+            logger.error(f"[JOBS] {job_id}: ошибка выполнения: {e}", exc_info=True)
+        finally:
+            duration = time.monotonic() - started
+            stats["duration_last"] = duration
+            stats["duration_total"] += duration
+            stats["duration_max"] = max(stats["duration_max"], duration)
+            await release_lease(job_id, token)
+
+    def metrics(self) -> dict:
+        jobs = {job.id: job for job in self.scheduler.get_jobs()} if self.scheduler.running else {}
+        result = {}
+        for job_id in sorted(set(jobs) | set(self.stats)):
+            stats = self._job_stats(job_id)
+            finished = stats["runs"] + stats["failures"]
+            job = jobs.get(job_id)
+            result[job_id] = {
+                **stats,
+                "duration_avg": stats["duration_total"] / finished if finished else 0.0,
+                "next_run_time": job.next_run_time.isoformat() if job and job.next_run_time else None,
+            }
+        return {"worker": WORKER_ID, "running": self.scheduler.running, "jobs": result}
+
+job_scheduler = JobScheduler()
+
+async def run_job(job_id: str, func_ref: str, min_gap: float):
+    """Точка входа всех задач планировщика: захват аренды, выполнение, метрики"""
+    await job_scheduler.execute(job_id, func_ref, min_gap)
@@ -0,0 +1,106 @@
+import json
+import logging
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from config import (
+    DEEPSEEK_API_KEY, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY, LLM_CONNECT_TIMEOUT, LLM_HTTP2
+)
+
+logger = logging.getLogger(__name__)
+
+DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+
+# Общий клиент: TCP/TLS-соединения к api.deepseek.com переиспользуются между запросами
+_client: Optional[httpx.AsyncClient] = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def get_llm_client() -> httpx.AsyncClient:
+    """Возвращает общий httpx-клиент, создавая его при первом обращении"""
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = LLM_HTTP2 and _http2_available()
+        _client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(30.0, connect=LLM_CONNECT_TIMEOUT),
+            headers={"Content-Type": "application/json"},
+        )
+        logger.info(f"[LLM] HTTP-клиент создан (http2={http2}, max_connections={LLM_MAX_CONNECTIONS})")
+    return _client
+
+async def close_llm_client():
+    """Закрывает общий клиент при остановке приложения"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("[LLM] HTTP-клиент закрыт")
+    _client = None
+
+async def deepseek_chat(messages: list, temperature: float = 0.7, max_tokens: Optional[int] = None,
+                        timeout: float = 30.0) -> httpx.Response:
+    """Отправляет запрос к DeepSeek chat completions через общий клиент"""
+    payload = {
+        "model": "deepseek-chat",
+        "messages": messages,
+        "temperature": temperature,
+    }
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    return await get_llm_client().post(
+        DEEPSEEK_API_URL,
+        headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}"},
+        json=payload,
+        timeout=httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT),
+    )
+
+async def deepseek_chat_stream(messages: list, temperature: float = 0.7, max_tokens: Optional[int] = None,
+                               timeout: float = 30.0) -> AsyncIterator[str]:
+    """Стримит ответ DeepSeek (SSE) и отдаёт текстовые фрагменты по мере генерации"""
+    payload = {
+        "model": "deepseek-chat",
+        "messages": messages,
+        "temperature": temperature,
+        "stream": True,
+    }
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    async with get_llm_client().stream(
+        "POST",
+        DEEPSEEK_API_URL,
+        headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Accept": "text/event-stream"},
+        json=payload,
+        timeout=httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT),
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                logger.warning(f"[LLM] Некорректный SSE-фрагмент: {data[:200]}")
+                continue
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
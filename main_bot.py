@@ -1,20 +1,29 @@
 from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
 from aiogram import Bot, types
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram import Router, Dispatcher
 from database import (
-    get_project_by_start_param, log_message_stat, get_user_by_id, get_project_form, 
-    record_project_visit, get_client_projects, get_client_current_project, get_project_by_id, get_payments, get_project_by_short_link
+    database, get_project_by_start_param, log_message_stat, get_user_by_id, get_project_form, 
+    record_project_visit, get_client_projects, get_client_current_project, get_project_by_id, get_user_subscription, get_access_version, get_project_by_short_link
 )
 from aiogram.filters import Command
 import logging
+from config import MAIN_BOT_TOKEN, TRIAL_DAYS, LLM_STREAMING
 import httpx
-from config import DEEPSEEK_API_KEY, MAIN_BOT_TOKEN, TRIAL_DAYS
 import time
 from datetime import datetime, timezone, timedelta
 from form_auto_fill import create_form_preview_keyboard, create_form_preview_message, create_form_fill_keyboard, create_form_submission_summary
 from typing import Optional
 import re
+from update_queue import UpdateQueue, UpdateQueueFull
+from update_dispatch import UpdateDispatcher
+from llm_client import deepseek_chat, deepseek_chat_stream
+from stream_reply import StreamingReply
+from access_cache import get_access, set_access
+from response_cache import get_cached_response, store_response, content_version
+from business_index import build_business_context
+from send_scheduler import SendScheduler
 
 router = APIRouter()
 
@@ -24,6 +33,8 @@ class FormStates:
 
 # Основной бот
 main_bot = Bot(token=MAIN_BOT_TOKEN)
+# Все исходящие запросы бота проходят через общий планировщик с лимитами Telegram
+main_bot.session.middleware(SendScheduler("main"))
 storage = MemoryStorage()
 main_dispatcher = Dispatcher(storage=storage)
 
@@ -114,7 +125,7 @@ async def save_query_statistics(project_id: str, user_id: int, original_query: s
 async def send_daily_insights_to_owner(project_id: str):
     """Отправляет ежедневные инсайты владельцу проекта"""
     try:
-        from database import get_project_by_id, get_daily_themes
+        from database import get_project_by_id, get_theme_counts
         from settings_bot import settings_bot
         
         # Получаем информацию о проекте
@@ -122,27 +133,19 @@ async def send_daily_insights_to_owner(project_id: str):
         if not project:
             return
         
-        # Получаем темы за последние 24 часа
-        themes = await get_daily_themes(project_id)
+        # Темы за последние 24 часа, уже отсортированные по популярности
+        sorted_themes = await get_theme_counts(project_id)
         
-        if not themes:
+        if not sorted_themes:
             return
         
-        # Анализируем локально
-        theme_counts = {}
-        for theme in themes:
-            theme_counts[theme['theme']] = theme_counts.get(theme['theme'], 0) + 1
-        
-        # Сортируем по популярности
-        sorted_themes = sorted(theme_counts.items(), key=lambda x: x[1], reverse=True)
-        
         # Формируем отчет
         report = f"📊 **Ежедневная статистика проекта {project.get('project_name', 'Неизвестный')}:**\n\n"
         for theme, count in sorted_themes[:5]:  # Только топ-5
             theme_display = theme.replace('_', ' ').title()
             report += f"• {theme_display}: {count} запросов\n"
         
-        report += f"\n📈 Всего запросов: {len(themes)}"
+        report += f"\n📈 Всего запросов: {sum(count for _, count in sorted_themes)}"
         report += f"\n🕐 Период: последние 24 часа"
         
         # Отправляем владельцу проекта
@@ -158,44 +161,28 @@ async def send_daily_insights_to_owner(project_id: str):
     except Exception as e:
         logging.error(f"[INSIGHTS] Ошибка отправки инсайтов: {e}")
 
-async def check_project_accessibility(project: dict) -> bool:
-    """Проверяет доступность проекта (trial/paid период)"""
-    try:
-        user = await get_user_by_id(project["telegram_id"])
-        if not user:
-            return False
-        
-        current_time = datetime.now(timezone.utc)
-        
-        if user["paid"]:
-            # Для оплаченных пользователей
-            payments = await get_payments()
-            user_payments = [p for p in payments if str(p['telegram_id']) == project["telegram_id"] and p['status'] == 'confirmed']
-            
-            if not user_payments:
-                return False
-                
-            last_payment = max(user_payments, key=lambda x: x['paid_at'])
-            
-            # Преобразуем дату платежа
-            paid_at = last_payment['paid_at']
-            if isinstance(paid_at, str):
-                paid_at = paid_at.replace('Z', '+00:00') if 'Z' in paid_at else paid_at
-                last_payment_date = datetime.fromisoformat(paid_at)
-            else:
-                last_payment_date = paid_at
-            
-            # Делаем оба datetime aware
-            if last_payment_date.tzinfo is None:
-                last_payment_date = last_payment_date.replace(tzinfo=timezone.utc)
-            
-            return (current_time - last_payment_date).days <= 30
-            
-        else:
-            # Для trial пользователей
-            if not user.get('start_date'):
-                return False
-                
+async def get_project_access(project: dict) -> dict:
+    """Возвращает решение о доступе к проекту владельца (с кэшем по telegram_id)"""
+    owner_id = str(project["telegram_id"])
+    # Версия читается каждый раз (запрос по первичному ключу): оплату мог изменить другой воркер
+    version = await get_access_version(owner_id)
+    cached = get_access(owner_id, version)
+    if cached is not None:
+        return cached
+    
+    valid_until = None
+    user = await get_user_by_id(owner_id)
+    if not user:
+        decision = {"accessible": False, "paid": False}
+    elif user["paid"]:
+        # Для оплаченных пользователей — один запрос последнего подтверждённого платежа
+        subscription = await get_user_subscription(owner_id)
+        decision = {"accessible": subscription["status"] == "active", "paid": True}
+        valid_until = subscription["expires_at"]
+    else:
+        # Для trial пользователей
+        accessible = False
+        if user.get('start_date'):
             start_date = user["start_date"]
             if isinstance(start_date, str):
                 start_date = start_date.replace('Z', '+00:00') if 'Z' in start_date else start_date
@@ -205,8 +192,19 @@ async def check_project_accessibility(project: dict) -> bool:
                 start_date = start_date.replace(tzinfo=timezone.utc)
             
             trial_end = start_date + timedelta(days=TRIAL_DAYS)
-            return current_time < trial_end
-            
+            accessible = datetime.now(timezone.utc) < trial_end
+            valid_until = trial_end
+        decision = {"accessible": accessible, "paid": False}
+    
+    # Истечение пробного периода или подписки записью в БД не сопровождается — решение живёт не дольше него
+    set_access(owner_id, version, decision, valid_until if decision["accessible"] else None)
+    return decision
+
+async def check_project_accessibility(project: dict) -> bool:
+    """Проверяет доступность проекта (trial/paid период)"""
+    try:
+        access = await get_project_access(project)
+        return access["accessible"]
     except Exception as e:
         logging.error(f"[MAIN_BOT] Error checking project accessibility: {e}")
         return False
@@ -330,73 +328,87 @@ async def handle_message(message: types.Message):
             return
     
     # Проверяем доступность проекта
-    if not await check_project_accessibility(current_project):
+    try:
+        access = await get_project_access(current_project)
+    except Exception as e:
+        logging.error(f"[MAIN_BOT] Error checking project accessibility: {e}")
+        access = {"accessible": False, "paid": False}
+    if not access["accessible"]:
         await message.answer("❌ Проект временно недоступен. Свяжитесь с владельцем для продления подписки.")
         return
     
     start_time = time.time()
     
     try:
-        # Формируем промпт для AI
-        business_info = current_project.get("business_info", "Информация о бизнесе не указана")
-        prompt = f"{role_base}\n\nИнформация о бизнесе:\n{business_info}\n\nВопрос клиента: {message.text}"
-        await message.bot.send_chat_action(message.chat.id, "typing")
-        # Получаем ответ от AI
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "deepseek-chat",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                    "max_tokens": 1000
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                ai_response = response.json()["choices"][0]["message"]["content"]
-                
-                # Извлекаем тему из ответа AI
-                theme = extract_theme_from_response(ai_response)
-                if theme:
-                    await save_query_statistics(current_project["id"], message.from_user.id, message.text, theme, datetime.now(timezone.utc))
-                    logging.info(f"[MAIN_BOT] Theme extracted: {theme}")
-                    # Убираем аналитический блок из ответа пользователю
-                    ai_response = ai_response.split('[АНАЛИТИКА:')[0].strip()
-                
-                # Проверяем, есть ли форма у проекта
-                form = await get_project_form(current_project["id"])
-                if form:
-                    # Добавляем предложение оформить заявку
-                    ai_response += "\n\n📝 Хотите оформить заявку? У нас есть удобная форма для сбора информации."
-                
-                # Создаем клавиатуру меню проекта
-                keyboard = create_project_menu_keyboard(current_project["id"], bool(form))
-                
-                await message.answer(ai_response, reply_markup=keyboard)
-                
-                # Логируем статистику
-                user = await get_user_by_id(current_project["telegram_id"])
-                response_time = time.time() - start_time
-                await log_message_stat(
-                    telegram_id=message.from_user.id,
-                    is_command=False,
-                    is_reply=True,
-                    response_time=response_time,
-                    project_id=current_project["id"],
-                    is_trial=not user["paid"] if user else True,
-                    is_paid=user["paid"] if user else False
-                )
-                
-            else:
+        reply = None
+        # Повторяющиеся вопросы (цена, доставка, гарантия...) отвечаем из кэша без запроса к AI
+        # Версия — по данным проекта: после правки business_info старые ответы не отдаёт ни один воркер
+        cache_version = content_version(current_project)
+        cached = get_cached_response(current_project["id"], cache_version, message.text)
+        if cached is not None:
+            ai_response = cached["answer"]
+            theme = cached["theme"]
+            logging.info(f"[MAIN_BOT] Response cache hit for project {current_project['id']}")
+        else:
+            # Формируем промпт для AI
+            business_info = current_project.get("business_info") or "Информация о бизнесе не указана"
+            # В промпт идут только фрагменты, релевантные вопросу (небольшие тексты — целиком)
+            business_info = build_business_context(current_project["id"], business_info, message.text)
+            prompt = f"{role_base}\n\nИнформация о бизнесе:\n{business_info}\n\nВопрос клиента: {message.text}"
+            await message.bot.send_chat_action(message.chat.id, "typing")
+            # Получаем ответ от AI: в потоковом режиме первое предложение уходит клиенту сразу
+            llm_messages = [{"role": "user", "content": prompt}]
+            try:
+                if LLM_STREAMING:
+                    reply = StreamingReply(message)
+                    ai_response = await reply.feed(
+                        deepseek_chat_stream(llm_messages, temperature=0.7, max_tokens=1000, timeout=30.0)
+                    )
+                else:
+                    response = await deepseek_chat(llm_messages, temperature=0.7, max_tokens=1000, timeout=30.0)
+                    response.raise_for_status()
+                    ai_response = response.json()["choices"][0]["message"]["content"]
+            except httpx.HTTPStatusError as e:
                 await message.answer("❌ Извините, произошла ошибка при обработке вашего вопроса. Попробуйте позже.")
-                logging.error(f"[MAIN_BOT] AI API error: {response.status_code} - {response.text}")
-                
+                logging.error(f"[MAIN_BOT] AI API error: {e.response.status_code} - {e.response.text}")
+                return
+            
+            # Извлекаем тему из ответа AI
+            theme = extract_theme_from_response(ai_response)
+            # Убираем аналитический блок из ответа пользователю
+            ai_response = ai_response.split('[АНАЛИТИКА:')[0].strip()
+            store_response(current_project["id"], cache_version, message.text, ai_response, theme)
+        
+        if theme:
+            await save_query_statistics(current_project["id"], message.from_user.id, message.text, theme, datetime.now(timezone.utc))
+            logging.info(f"[MAIN_BOT] Theme extracted: {theme}")
+        
+        # Проверяем, есть ли форма у проекта
+        form = await get_project_form(current_project["id"])
+        if form:
+            # Добавляем предложение оформить заявку
+            ai_response += "\n\n📝 Хотите оформить заявку? У нас есть удобная форма для сбора информации."
+        
+        # Создаем клавиатуру меню проекта
+        keyboard = create_project_menu_keyboard(current_project["id"], bool(form))
+        
+        if reply is not None:
+            await reply.finish(ai_response, reply_markup=keyboard)
+        else:
+            await message.answer(ai_response, reply_markup=keyboard)
+        
+        # Логируем статистику (флаг оплаты берём из уже полученного решения о доступе)
+        response_time = time.time() - start_time
+        await log_message_stat(
+            telegram_id=message.from_user.id,
+            is_command=False,
+            is_reply=True,
+            response_time=response_time,
+            project_id=current_project["id"],
+            is_trial=not access["paid"],
+            is_paid=access["paid"]
+        )
+        
     except Exception as e:
         await message.answer("❌ Произошла ошибка при обработке сообщения. Попробуйте позже.")
         logging.error(f"[MAIN_BOT] Error processing message: {e}")
@@ -479,7 +491,7 @@ async def handle_callback(callback: types.CallbackQuery):
 async def show_project_insights(callback: types.CallbackQuery, project_id: str):
     """Показывает инсайты проекта"""
     try:
-        from database import get_project_by_id, get_daily_themes
+        from database import get_project_by_id, get_theme_counts
         
         # Получаем информацию о проекте
         project = await get_project_by_id(project_id)
@@ -487,10 +499,10 @@ async def show_project_insights(callback: types.CallbackQuery, project_id: str):
             await callback.answer("❌ Проект не найден")
             return
         
-        # Получаем темы за последние 24 часа
-        themes = await get_daily_themes(project_id)
+        # Темы за последние 24 часа, уже отсортированные по популярности
+        sorted_themes = await get_theme_counts(project_id)
         
-        if not themes:
+        if not sorted_themes:
             await callback.message.edit_text(
                 f"📊 **Инсайты проекта {project.get('project_name', 'Неизвестный')}**\n\n"
                 "За последние 24 часа нет данных для анализа.",
@@ -499,14 +511,6 @@ async def show_project_insights(callback: types.CallbackQuery, project_id: str):
             )
             return
         
-        # Анализируем темы
-        theme_counts = {}
-        for theme in themes:
-            theme_counts[theme['theme']] = theme_counts.get(theme['theme'], 0) + 1
-        
-        # Сортируем по популярности
-        sorted_themes = sorted(theme_counts.items(), key=lambda x: x[1], reverse=True)
-        
         # Формируем отчет
         report = f"📊 **Инсайты проекта {project.get('project_name', 'Неизвестный')}**\n\n"
         report += "**Топ темы за последние 24 часа:**\n"
@@ -514,7 +518,7 @@ async def show_project_insights(callback: types.CallbackQuery, project_id: str):
             theme_display = theme.replace('_', ' ').title()
             report += f"• {theme_display}: {count} запросов\n"
         
-        report += f"\n📈 **Всего запросов:** {len(themes)}"
+        report += f"\n📈 **Всего запросов:** {sum(count for _, count in sorted_themes)}"
         report += f"\n🕐 **Период:** последние 24 часа"
         
         # Создаем клавиатуру с кнопкой возврата к меню
@@ -601,6 +605,17 @@ async def webhook_status():
     return {"status": "webhook endpoint is available", "method": "GET"}
 
 # Webhook endpoint для основного бота
+# Отбрасывает повторные доставки и не даёт обновлениям одного чата обрабатываться параллельно
+main_update_dispatcher = UpdateDispatcher("main", main_dispatcher, main_bot)
+
+async def process_main_update(update: types.Update):
+    """Обрабатывает одно обновление основного бота (вызывается воркером очереди)"""
+    await main_update_dispatcher.feed(update)
+    logging.info(f"[MAIN_BOT] Update {update.update_id} processed successfully")
+
+# Очередь обновлений: webhook отвечает Telegram сразу, обработка идёт в воркерах
+main_update_queue = UpdateQueue("main", process_main_update)
+
 @router.post("/webhook/main")
 async def main_bot_webhook(request: Request):
     """Webhook endpoint для основного бота"""
@@ -613,12 +628,15 @@ async def main_bot_webhook(request: Request):
         from aiogram.types import Update
         update = Update(**update_data)
         
-        # Обрабатываем обновление
-        logging.info(f"[MAIN_BOT] Processing update with dispatcher")
-        await main_dispatcher.feed_update(main_bot, update)
-        logging.info(f"[MAIN_BOT] Update processed successfully")
+        # Ставим обновление в очередь и сразу отвечаем Telegram
+        await main_update_queue.put(update)
+        logging.info(f"[MAIN_BOT] Update {update.update_id} queued")
         
         return {"status": "ok"}
+    except UpdateQueueFull as e:
+        # Не 2xx — Telegram повторит доставку позже
+        logging.warning(f"[MAIN_BOT] Update queue is full: {e}")
+        return JSONResponse(status_code=503, content={"status": "error", "message": "busy"})
     except Exception as e:
         logging.error(f"[MAIN_BOT] Webhook error: {e}")
         logging.error(f"[MAIN_BOT] Request body: {await request.body() if hasattr(request, 'body') else 'N/A'}")
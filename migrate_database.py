@@ -2,6 +2,7 @@
 """
 Скрипт миграции базы данных для изменения архитектуры проекта.
 Убирает поле token и добавляет welcome_message и bot_link.
+Последующие изменения схемы — версионные миграции в migrations.py, они применяются после этой.
 """
 
 import asyncio
@@ -138,3 +139,8 @@ async def migrate_database():
 
 if __name__ == "__main__":
     asyncio.run(migrate_database())
+    # Версионные миграции (индексы и т.д.) поверх перестроенной схемы
+    from database import engine, Base
+    from migrations import run_migrations
+    applied = run_migrations(engine, Base.metadata)
+    print(f"✅ Версионные миграции: {applied or 'новых нет'}")
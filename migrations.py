@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Версионные миграции схемы БД.
+Каждая миграция применяется один раз; номер применённой версии хранится в таблице schema_version.
+Новые изменения схемы добавляются в конец списка MIGRATIONS.
+"""
+
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import text, bindparam
+
+from config import TRIAL_DAYS, MIGRATION_LOCK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+def _create_indexes(table_name: str, *index_names: str):
+    """Миграция, создающая объявленные в модели индексы (без пересоздания таблицы)"""
+    def migrate(connection, metadata):
+        table = metadata.tables[table_name]
+        for index in table.indexes:
+            if not index_names or index.name in index_names:
+                index.create(bind=connection, checkfirst=True)
+    return migrate
+
+def _apply_all(*steps):
+    def migrate(connection, metadata):
+        for step in steps:
+            step(connection, metadata)
+    return migrate
+
+def _add_column(table_name: str, column_name: str):
+    """Миграция, добавляющая объявленную в модели колонку в существующую таблицу"""
+    def migrate(connection, metadata):
+        existing = {row[1] for row in connection.execute(text(f'PRAGMA table_info("{table_name}")'))}
+        if column_name not in existing:
+            column = metadata.tables[table_name].c[column_name]
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN {column_name} {column_type}'))
+    return migrate
+
+def _backfill_trial_ends_at(connection, metadata):
+    user = metadata.tables['user']
+    rows = connection.execute(
+        user.select().with_only_columns(user.c.telegram_id, user.c.start_date, user.c.bonus_days)
+        .where(user.c.trial_ends_at.is_(None))
+    ).fetchall()
+    updates = [
+        {"key": row.telegram_id, "trial_ends_at": row.start_date + timedelta(days=TRIAL_DAYS + (row.bonus_days or 0))}
+        for row in rows if row.start_date is not None
+    ]
+    if updates:
+        connection.execute(
+            user.update().where(user.c.telegram_id == bindparam("key")).values(trial_ends_at=bindparam("trial_ends_at")),
+            updates
+        )
+    logger.info(f"[MIGRATIONS] trial_ends_at заполнен для {len(updates)} пользователей")
+
+def _backfill_rollups(connection, metadata):
+    # Таблицы агрегатов уже созданы create_all, здесь только заполняем их историей
+    from rollups import backfill_rollups
+    backfill_rollups(connection)
+
+# (версия, описание, функция(connection, metadata))
+MIGRATIONS = [
+    (1, "payment: индекс (telegram_id, status, paid_at)",
+     _create_indexes('payment', 'ix_payment_telegram_status_paid_at')),
+    (2, "индексы горячих таблиц: message_stat, query_theme, client_project_history, form_submission",
+     _apply_all(
+         _create_indexes('message_stat', 'ix_message_stat_datetime', 'ix_message_stat_telegram_datetime'),
+         _create_indexes('query_theme', 'ix_query_theme_project_timestamp'),
+         _create_indexes('client_project_history', 'ix_client_history_client_last_visit'),
+         _create_indexes('form_submission', 'ix_form_submission_form_telegram'),
+     )),
+    (3, "агрегаты статистики: заполнение из сырых данных", _backfill_rollups),
+    (4, "user.trial_ends_at: колонка, индекс и заполнение из start_date + TRIAL_DAYS + bonus_days",
+     _apply_all(
+         _add_column('user', 'trial_ends_at'),
+         _create_indexes('user', 'ix_user_trial_due'),
+         _backfill_trial_ends_at,
+     )),
+    (5, "user.access_version: версия решения о доступе для кэша в каждом процессе",
+     _add_column('user', 'access_version')),
+]
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+
+def get_applied_versions(connection) -> set:
+    _ensure_version_table(connection)
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_version"))}
+
+@contextmanager
+def write_lock(engine):
+    """Соединение в транзакции с блокировкой записи БД: схему меняет только один процесс за раз"""
+    with engine.connect() as connection:
+        # Параллельно стартующий процесс ждёт, пока другой меняет схему, а не падает с "database is locked"
+        connection.exec_driver_sql(f"PRAGMA busy_timeout = {int(MIGRATION_LOCK_TIMEOUT * 1000)}")
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: проверка состояния схемы и её изменение атомарны между процессами
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        yield connection
+        connection.commit()
+
+def create_tables(engine, metadata):
+    """create_all под блокировкой записи: иначе процессы, стартующие на пустой БД, падают с «table already exists»"""
+    with write_lock(engine) as connection:
+        metadata.create_all(bind=connection)
+
+def _apply_migration(engine, metadata, version: int, description: str, migrate) -> bool:
+    """Применяет одну миграцию под блокировкой записи; False — её уже применил другой процесс"""
+    with write_lock(engine) as connection:
+        if connection.execute(text("SELECT 1 FROM schema_version WHERE version = :version"), {"version": version}).first():
+            return False
+        migrate(connection, metadata)
+        connection.execute(
+            text("INSERT INTO schema_version (version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+            {"version": version, "description": description, "applied_at": datetime.now(timezone.utc)}
+        )
+    return True
+
+def run_migrations(engine, metadata) -> list:
+    """Применяет недостающие миграции по порядку, каждую в своей транзакции; возвращает применённые версии.
+    Вызывается при старте приложения (base.startup_event) и из migrate_database.py, не при импорте database"""
+    with engine.begin() as connection:
+        applied = get_applied_versions(connection)
+    newly_applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        if not _apply_migration(engine, metadata, version, description, migrate):
+            logger.info(f"[MIGRATIONS] Миграция {version} уже применена другим процессом")
+            continue
+        newly_applied.append(version)
+        logger.info(f"[MIGRATIONS] Применена миграция {version}: {description}")
+    return newly_applied
+
+if __name__ == "__main__":
+    # Импорт database создаёт таблицы, миграции применяются явно
+    from database import engine, Base
+    run_migrations(engine, Base.metadata)
+    with engine.begin() as connection:
+        versions = sorted(get_applied_versions(connection))
+    print(f"✅ Схема БД актуальна, применённые версии: {versions}")
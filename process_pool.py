@@ -0,0 +1,42 @@
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing.context import SpawnContext, SpawnProcess
+
+# Дочерний процесс spawn (и forkserver, даже без preload) перед запуском импортирует главный модуль родителя
+# как __mp_main__. Приложение запускается как `python server.py`, так что каждый воркер импортировал бы всё
+# приложение: create_all и миграции БД, ботов, plotly — и так при каждом пересоздании пула после таймаута.
+# Поэтому на время запуска воркера главным модулем объявляется этот модуль: он импортирует только
+# стандартную библиотеку, а задачи подтягивают лишь свои модули (file_utils, asr_backends).
+_main_swap_lock = threading.Lock()
+
+@contextmanager
+def _lightweight_main():
+    """Подменяет __main__ этим модулем, пока multiprocessing собирает данные для запуска дочернего процесса"""
+    with _main_swap_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+class _WorkerProcess(SpawnProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        with _lightweight_main():
+            return SpawnProcess._Popen(process_obj)
+
+class _WorkerContext(SpawnContext):
+    Process = _WorkerProcess
+
+def create_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Пул процессов для CPU-задач: воркеры не наследуют потоки и соединения родителя и не импортируют приложение"""
+    return ProcessPoolExecutor(max_workers=max(1, workers), mp_context=_WorkerContext())
+
+def terminate_process_pool(pool: ProcessPoolExecutor):
+    """Убивает процессы пула: у ProcessPoolExecutor нет публичного способа прервать зависшую задачу"""
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
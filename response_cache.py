@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_PER_PROJECT, RESPONSE_CACHE_SIMILARITY
+)
+from text_embeddings import normalize_text, embed_text
+
+logger = logging.getLogger(__name__)
+
+# Короче этого вопросы сравниваются только точно: у коротких строк n-граммы слишком шумные
+MIN_SIMILARITY_LENGTH = 8
+
+def content_version(project: dict) -> str:
+    """Версия данных проекта, от которых зависят ответы: после правки старые ответы недоступны в любом процессе"""
+    content = f"{project.get('business_info') or ''}\0{project.get('welcome_message') or ''}"
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+class _ProjectResponses:
+    """Ответы одного проекта: точный словарь + матрица векторов для поиска похожих по написанию вопросов"""
+
+    def __init__(self, version: str):
+        # Ответы построены по этой версии данных проекта; ответы другой версии не отдаются
+        self.version = version
+        self.entries = OrderedDict()  # нормализованный вопрос -> запись
+        self._keys = []
+        self._matrix = None
+
+    def _rebuild(self):
+        self._keys = list(self.entries.keys())
+        self._matrix = np.vstack([self.entries[k]["vector"] for k in self._keys]) if self._keys else None
+
+    def drop_expired(self, now: float):
+        expired = [k for k, entry in self.entries.items() if entry["expires_at"] < now]
+        for key in expired:
+            del self.entries[key]
+        if expired:
+            self._matrix = None
+
+    def put(self, key: str, entry: dict):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > RESPONSE_CACHE_MAX_PER_PROJECT:
+            self.entries.popitem(last=False)
+        self._matrix = None
+
+    def most_similar(self, vector: np.ndarray):
+        if self._matrix is None:
+            self._rebuild()
+        if self._matrix is None:
+            return None, 0.0
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        return self._keys[best], float(scores[best])
+
+_NUMBER_RE = re.compile(r"\d+")
+
+def _numbers(key: str) -> list:
+    """Числа в вопросе: «iphone 14» и «iphone 15» похожи по написанию, но это разные вопросы"""
+    return _NUMBER_RE.findall(key)
+
+_projects = {}
+stats = {"hits_exact": 0, "hits_similar": 0, "misses": 0, "invalidations": 0}
+
+def get_cached_response(project_id: str, version: str, question: str) -> Optional[dict]:
+    """Ищет готовый ответ на вопрос для данной версии проекта: сначала точное совпадение,
+    затем (если RESPONSE_CACHE_SIMILARITY > 0) вопрос, похожий по написанию"""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    key = normalize_text(question)
+    project = _projects.get(str(project_id))
+    if not key or project is None or project.version != version:
+        stats["misses"] += 1
+        return None
+    project.drop_expired(time.monotonic())
+    entry = project.entries.get(key)
+    if entry is not None:
+        project.entries.move_to_end(key)
+        stats["hits_exact"] += 1
+        return entry
+    if RESPONSE_CACHE_SIMILARITY > 0 and len(key) >= MIN_SIMILARITY_LENGTH:
+        similar_key, score = project.most_similar(embed_text(key))
+        # Похожесть по n-граммам символов — это похожесть написания, а не смысла: числа должны совпадать точно
+        if similar_key is not None and score >= RESPONSE_CACHE_SIMILARITY and _numbers(similar_key) == _numbers(key):
+            stats["hits_similar"] += 1
+            logger.info(f"[RESPONSE_CACHE] Похожий вопрос для проекта {project_id}: score={score:.3f}")
+            return project.entries[similar_key]
+    stats["misses"] += 1
+    return None
+
+def store_response(project_id: str, version: str, question: str, answer: str, theme: Optional[str] = None):
+    """Сохраняет ответ (без аналитического блока) и его тему; ответы прежней версии проекта отбрасываются"""
+    if not RESPONSE_CACHE_ENABLED or not answer:
+        return
+    key = normalize_text(question)
+    if not key:
+        return
+    project = _projects.get(str(project_id))
+    if project is None or project.version != version:
+        project = _projects[str(project_id)] = _ProjectResponses(version)
+    project.put(key, {
+        "answer": answer,
+        "theme": theme,
+        "vector": embed_text(key),
+        "expires_at": time.monotonic() + RESPONSE_CACHE_TTL,
+    })
+
+def invalidate_project_responses(project_id: str):
+    """Сбрасывает ответы проекта в этом процессе; остальные процессы перестают их отдавать по смене content_version"""
+    if _projects.pop(str(project_id), None) is not None:
+        stats["invalidations"] += 1
+        logger.info(f"[RESPONSE_CACHE] Кэш ответов проекта {project_id} сброшен")
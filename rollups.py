@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Пересчёт агрегатов (rollup) статистики из сырых таблиц message_stat, query_theme и payment.
+В работе агрегаты обновляются инкрементально (log_message_stat, save_query_theme, confirm_payment);
+этот пересчёт нужен для исторических данных и восстановления после ручных правок БД.
+
+Запуск: python rollups.py
+"""
+
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# (таблица агрегата, запрос, заполняющий её из сырых данных)
+BACKFILL_STATEMENTS = [
+    ("project_daily_stat", """
+        INSERT INTO project_daily_stat (project_id, day, messages, replies, response_time_sum, response_time_count)
+        SELECT COALESCE(project_id, ''), date(datetime), COUNT(*),
+               SUM(CASE WHEN is_reply THEN 1 ELSE 0 END),
+               COALESCE(SUM(response_time), 0), COUNT(response_time)
+        FROM message_stat WHERE datetime IS NOT NULL
+        GROUP BY COALESCE(project_id, ''), date(datetime)
+    """),
+    ("project_daily_user", """
+        INSERT INTO project_daily_user (project_id, day, telegram_id)
+        SELECT DISTINCT COALESCE(project_id, ''), date(datetime), telegram_id
+        FROM message_stat WHERE datetime IS NOT NULL
+    """),
+    ("daily_active_user", """
+        INSERT INTO daily_active_user (day, telegram_id)
+        SELECT DISTINCT date(datetime), telegram_id
+        FROM message_stat WHERE datetime IS NOT NULL
+    """),
+    ("message_hourly_stat", """
+        INSERT INTO message_hourly_stat (hour, messages)
+        SELECT strftime('%Y-%m-%d %H', datetime), COUNT(*)
+        FROM message_stat WHERE datetime IS NOT NULL
+        GROUP BY strftime('%Y-%m-%d %H', datetime)
+    """),
+    ("theme_hourly_stat", """
+        INSERT INTO theme_hourly_stat (project_id, hour, theme, count)
+        SELECT project_id, strftime('%Y-%m-%d %H', timestamp), theme, COUNT(*)
+        FROM query_theme WHERE timestamp IS NOT NULL
+        GROUP BY project_id, strftime('%Y-%m-%d %H', timestamp), theme
+    """),
+    ("revenue_monthly_stat", """
+        INSERT INTO revenue_monthly_stat (month, amount, payments)
+        SELECT strftime('%Y-%m', paid_at), SUM(amount), COUNT(*)
+        FROM payment WHERE status = 'confirmed' AND paid_at IS NOT NULL
+        GROUP BY strftime('%Y-%m', paid_at)
+    """),
+]
+
+def backfill_rollups(connection) -> dict:
+    """Полностью пересчитывает агрегаты на синхронном соединении SQLAlchemy (в транзакции вызывающего)"""
+    counts = {}
+    for table, statement in BACKFILL_STATEMENTS:
+        connection.execute(text(f"DELETE FROM {table}"))
+        connection.execute(text(statement))
+        counts[table] = connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+        logger.info(f"[ROLLUPS] {table}: {counts[table]} строк")
+    return counts
+
+if __name__ == "__main__":
+    # Во время пересчёта приложение лучше остановить: записи, пришедшие в процессе, могут не попасть в агрегаты
+    from database import engine
+    print("🔄 Пересчитываю агрегаты статистики...")
+    with engine.begin() as connection:
+        result = backfill_rollups(connection)
+    for table, count in result.items():
+        print(f"  {table}: {count}")
+    print("✅ Агрегаты пересчитаны")
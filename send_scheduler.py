@@ -0,0 +1,197 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import SEND_BOT_RATE, SEND_BOT_BURST, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: интерактивные ответы всегда уходят раньше массовых рассылок
+INTERACTIVE = 0
+BROADCAST = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BROADCAST: "broadcast"}
+
+# Чатов без отправок дольше этого времени (секунды) не храним
+CHAT_BUCKET_IDLE_TTL = 300
+CHAT_BUCKET_PRUNE_THRESHOLD = 10000
+
+# Планировщики по имени бота (для метрик и остановки)
+_schedulers = {}
+
+_send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+@contextmanager
+def broadcast_priority():
+    """Отправки внутри блока (и в созданных в нём задачах) идут в полосе массовых рассылок"""
+    token = _send_priority.set(BROADCAST)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+_retry_after_by_caller: ContextVar[bool] = ContextVar("retry_after_by_caller", default=False)
+
+@contextmanager
+def caller_handles_retry_after():
+    """Внутри блока RetryAfter сразу уходит вызывающему (лимиты всё равно приостанавливаются):
+    повторы делает один слой, а не планировщик и вызывающий друг поверх друга"""
+    token = _retry_after_by_caller.set(True)
+    try:
+        yield
+    finally:
+        _retry_after_by_caller.reset(token)
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # Для чатов: запросы в один чат идут строго по очереди, чтобы сообщения не переставлялись
+        self.lock = asyncio.Lock()
+
+    def wait_time(self) -> float:
+        """Сколько секунд ждать до появления токена (0 — можно отправлять)"""
+        now = time.monotonic()
+        if self.paused_until > now:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """RetryAfter от Telegram: не отправлять ничего seconds секунд"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        # Токены начинают копиться только после паузы, иначе сразу после неё ушла бы целая пачка запросов
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+class SendScheduler(BaseRequestMiddleware):
+    """Middleware сессии бота: ограничивает исходящие запросы по боту и по чату, с приоритетом интерактивных"""
+
+    def __init__(self, name: str, bot_rate: float = SEND_BOT_RATE, bot_burst: float = SEND_BOT_BURST,
+                 chat_rate: float = SEND_CHAT_RATE, chat_burst: float = SEND_CHAT_BURST,
+                 max_retries: int = SEND_MAX_RETRIES):
+        self.name = name
+        self.bot_bucket = TokenBucket(bot_rate, bot_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._sequence = itertools.count()
+        self.stats = {
+            lane: {"requests": 0, "waiting": 0, "queue_delay_total": 0.0, "queue_delay_max": 0.0, "retry_after": 0}
+            for lane in LANE_NAMES.values()
+        }
+        _schedulers[name] = self
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > CHAT_BUCKET_PRUNE_THRESHOLD:
+                border = time.monotonic() - CHAT_BUCKET_IDLE_TTL
+                self._chat_buckets = {
+                    k: b for k, b in self._chat_buckets.items() if b.updated > border or b.lock.locked()
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _ensure_dispatcher(self):
+        # Очередь и задача создаются лениво, в рабочем event loop
+        if self._dispatcher is None or self._dispatcher.done():
+            self._queue = asyncio.PriorityQueue()
+            self._dispatcher = asyncio.create_task(self._dispatch(), name=f"{self.name}-send-scheduler")
+
+    async def _dispatch(self):
+        """Выдаёт токены бота по очереди приоритетов: первым — самый приоритетный из ожидающих"""
+        while True:
+            item = await self._queue.get()
+            wait = self.bot_bucket.wait_time()
+            if wait > 0:
+                # Пока ждём токен, мог прийти более приоритетный запрос — возвращаем и выбираем заново
+                self._queue.put_nowait(item)
+                await asyncio.sleep(wait)
+                continue
+            future = item[2]
+            if future.done():
+                # Запрос отменён, пока ждал очереди
+                continue
+            self.bot_bucket.consume()
+            future.set_result(None)
+
+    async def _acquire(self, chat_bucket: Optional[TokenBucket], lane: int):
+        if chat_bucket is not None:
+            while (wait := chat_bucket.wait_time()) > 0:
+                await asyncio.sleep(wait)
+            chat_bucket.consume()
+        self._ensure_dispatcher()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((lane, next(self._sequence), future))
+        await future
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+        lane = _send_priority.get()
+        stats = self.stats[LANE_NAMES[lane]]
+        max_retries = 0 if _retry_after_by_caller.get() else self.max_retries
+        async with (chat_bucket.lock if chat_bucket is not None else nullcontext()):
+            for attempt in range(max_retries + 1):
+                enqueued_at = time.monotonic()
+                stats["waiting"] += 1
+                try:
+                    await self._acquire(chat_bucket, lane)
+                finally:
+                    stats["waiting"] -= 1
+                delay = time.monotonic() - enqueued_at
+                stats["requests"] += 1
+                stats["queue_delay_total"] += delay
+                stats["queue_delay_max"] = max(stats["queue_delay_max"], delay)
+                try:
+                    return await make_request(bot, method)
+                except TelegramRetryAfter as e:
+                    stats["retry_after"] += 1
+                    # Flood control касается всего бота: приостанавливаем и общий лимит, и чат
+                    self.bot_bucket.pause(e.retry_after)
+                    if chat_bucket is not None:
+                        chat_bucket.pause(e.retry_after)
+                    if attempt == max_retries:
+                        raise
+                    logger.warning(f"[SEND] {self.name}: RetryAfter {e.retry_after} с для {type(method).__name__} (чат {chat_id}), повтор {attempt + 1}")
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    def metrics(self) -> dict:
+        lanes = {}
+        for lane, stats in self.stats.items():
+            lanes[lane] = {
+                **stats,
+                "queue_delay_avg": stats["queue_delay_total"] / stats["requests"] if stats["requests"] else 0.0,
+            }
+        return {"lanes": lanes, "chats_tracked": len(self._chat_buckets), "queue_depth": self._queue.qsize() if self._queue else 0}
+
+def get_send_metrics() -> dict:
+    return {name: scheduler.metrics() for name, scheduler in _schedulers.items()}
+
+async def stop_send_schedulers():
+    for scheduler in _schedulers.values():
+        await scheduler.stop()
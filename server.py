@@ -1,64 +1,45 @@
 from base import app
 from fastapi.responses import JSONResponse, HTMLResponse
-from fastapi import Request
-from config import PORT, SERVER_URL, MAIN_BOT_TOKEN
-from database import database, get_feedbacks, get_payments, get_user_by_id, get_users_with_expired_trial, get_projects_by_user, get_user_projects, log_message_stat, add_feedback, MessageStat, User, Payment, get_response_ratings_stats
+from fastapi import APIRouter, Request
+from contextlib import asynccontextmanager
+from config import PORT
+from database import database, telemetry_buffer, get_feedbacks, get_user_by_id, get_users_with_expired_trial, get_projects_by_user, get_user_projects, log_message_stat, add_feedback, MessageStat, User, Payment, get_response_ratings_stats
 from sqlalchemy.sql import func
 from datetime import datetime, timedelta, timezone
 import uvicorn
 from settings_bot import (
-    set_settings_webhook,
     router as settings_router,
-    SETTINGS_BOT_TOKEN,
-    SETTINGS_WEBHOOK_URL
+    settings_update_queue,
+    settings_update_dispatcher
 )
 from main_bot import (
-    set_main_bot_webhook,
     remove_main_bot_webhook,
-    router as main_bot_router
+    router as main_bot_router,
+    main_update_queue,
+    main_update_dispatcher
 )
+from db_pool import get_pool_metrics
+from stats_engine import collect_stats
+from response_cache import stats as response_cache_stats
+from analytics import analytics
+from send_scheduler import get_send_metrics
+from job_scheduler import job_scheduler
+from transcription import transcriber
+from content_cache import content_cache
+from stats_snapshot import StatsSnapshot
 import logging
 from sqlalchemy import select
 import plotly.graph_objs as go
 import plotly.io as pio
-
-@app.on_event("startup")
-async def startup_event():
-    try:
-        logging.info(f"[ENV] SERVER_URL={SERVER_URL}")
-        logging.info(f"[ENV] SETTINGS_BOT_TOKEN={SETTINGS_BOT_TOKEN}, SETTINGS_WEBHOOK_URL={SETTINGS_WEBHOOK_URL}")
-        logging.info(f"[ENV] MAIN_BOT_TOKEN={'Настроен' if MAIN_BOT_TOKEN else 'НЕ НАСТРОЕН'}")
-        
-        # Устанавливаем webhook для settings бота
-        logging.info("[STARTUP] Setting settings bot webhook...")
-        await set_settings_webhook()
-        print("[STARTUP] Settings bot webhook set!")
-        
-        # Устанавливаем webhook для основного бота
-        logging.info("[STARTUP] Setting main bot webhook...")
-        await set_main_bot_webhook()
-        print("[STARTUP] Main bot webhook set!")
-        
-        logging.info("[STARTUP] All webhooks set successfully!")
-        
-    except Exception as e:
-        print(f"[STARTUP] Failed to set webhooks: {e}")
-        logging.error(f"[STARTUP] Failed to set webhooks: {e}")
-        raise
+from plotly.offline import get_plotlyjs_version
 
 @app.middleware("http")
 async def db_session_middleware(request: Request, call_next):
     logging.info(f"[MIDDLEWARE] {request.method} {request.url.path} from {request.client.host if request.client else 'unknown'}")
-    logging.info("[MIDDLEWARE] Перед database.connect()")
-    await database.connect()
-    logging.info("[MIDDLEWARE] После database.connect()")
+    # Пул соединений открыт при старте приложения, здесь только передаём его в запрос
     request.state.db = database
-    logging.info("[MIDDLEWARE] Перед call_next")
     response = await call_next(request)
     logging.info(f"[MIDDLEWARE] После call_next, статус: {response.status_code}")
-    logging.info("[MIDDLEWARE] Перед database.disconnect()")
-    await database.disconnect()
-    logging.info("[MIDDLEWARE] После database.disconnect()")
     return response
 
 @app.api_route("/", methods=["GET", "HEAD"])
@@ -66,98 +47,22 @@ async def super():
     logging.info("[HANDLER] Получен запрос на / (корень)")
     return JSONResponse(content={"message": f"Сервер работает!"}, status_code=200)
 
-@app.get("/stats")
-async def get_stats(request: Request):
-    logging.info(f"[API] /stats called from {request.client.host if hasattr(request, 'client') else 'unknown'}")
-    # Общее количество пользователей
-    total_users = await database.fetch_val(func.count(User.telegram_id).select())
-    # Новые пользователи за сегодня
-    today = datetime.now(timezone.utc).date()
-    new_users_today = await database.fetch_val(
-        func.count(User.telegram_id).select().where(func.date(User.start_date) == today)
-    )
-    # DAU (уникальные пользователи за сегодня)
-    dau = await database.fetch_val(
-        func.count(func.distinct(MessageStat.telegram_id)).select().where(func.date(MessageStat.datetime) == today)
-    )
-    # Всего сообщений
-    total_messages = await database.fetch_val(func.count(MessageStat.id).select())
-    # Среднее сообщений на пользователя
-    avg_msg_per_user = (total_messages / total_users) if total_users else 0
-    # Пиковые часы активности
-    hour_select = select(
-        func.strftime('%H', MessageStat.datetime).label('hour'),
-        func.count(MessageStat.id).label('cnt')
-    ).group_by(func.strftime('%H', MessageStat.datetime))
-    rows = await database.fetch_all(hour_select)
-    hour_counts = {}
-    for r in rows:
-        hour = r[0]
-        cnt = r[1]
-        hour_counts[hour] = cnt
-    peak_hours = sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)[:3]
-    # Среднее время ответа
-    avg_response_time = await database.fetch_val(func.avg(MessageStat.response_time).select().where(MessageStat.response_time != None))
-    # Конверсия из триала в оплату
-    paid_users = await database.fetch_val(func.count(User.telegram_id).select().where(User.paid == True))
-    expired_trial_users = await database.fetch_val(func.count(User.telegram_id).select().where(User.paid == False, User.start_date < datetime.now(timezone.utc) - timedelta(days=14)))
-    conversion = (paid_users / (paid_users + expired_trial_users) * 100) if (paid_users + expired_trial_users) else 0
-    # Среднее количество ботов на пользователя
-    all_projects = await database.fetch_all(func.count().select().select_from(User).join(MessageStat, User.telegram_id == MessageStat.telegram_id))
-    avg_bots_per_user = (len(all_projects) / total_users) if total_users else 0
-    # Количество платящих
-    paid_count = paid_users
-    # Общая выручка
-    payments = await get_payments()
-    total_revenue = sum(p['amount'] for p in payments)
-    # ARPU
-    arpu = (total_revenue / paid_count) if paid_count else 0
-    # LTV (реальный средний срок жизни клиента в месяцах)
-    from collections import defaultdict
-    user_payments = defaultdict(list)
-    for p in payments:
-        user_payments[p['telegram_id']].append(p['paid_at'])
-    lifetimes = []
-    for telegram_id, dates in user_payments.items():
-        if len(dates) > 1:
-            # Сортируем даты
-            dates_sorted = sorted([d if not isinstance(d, str) else datetime.fromisoformat(d) for d in dates])
-            lifetime_days = (dates_sorted[-1] - dates_sorted[0]).days
-            lifetime_months = lifetime_days / 30
-            if lifetime_months < 1:
-                lifetime_months = 1  # Минимум 1 месяц, если пользователь платил более одного раза
-            lifetimes.append(lifetime_months)
-        else:
-            lifetimes.append(1)  # Если только один платёж, считаем 1 месяц
-    avg_lifetime_months = sum(lifetimes) / len(lifetimes) if lifetimes else 0
-    ltv = arpu * avg_lifetime_months
-    # Activity Rate
-    activity_rate = (dau / total_users * 100) if total_users else 0
-    # Удержание (Retention)
-    # Для MVP: считаем как (платящих сейчас / плативших когда-либо)
-    retention = (paid_count / paid_count * 100) if paid_count else 100
-    
-    # Статистика рейтингов ответов
-    rating_stats = await get_response_ratings_stats()
-    
-    stats = {
-        "total_users": total_users,
-        "new_users_today": new_users_today,
-        "dau": dau,
-        "total_messages": total_messages,
-        "avg_msg_per_user": avg_msg_per_user,
-        "peak_hours": peak_hours,
-        "avg_response_time": avg_response_time,
-        "conversion_trial_to_paid": conversion,
-        "avg_bots_per_user": avg_bots_per_user,
-        "total_revenue": total_revenue,
-        "arpu": arpu,
-        "ltv": ltv,
-        "activity_rate": activity_rate,
-        "retention": retention,
-        "response_ratings": rating_stats
-    }
-    logging.info(f"[API] /stats: total_users={total_users}, dau={dau}, total_messages={total_messages}")
+def render_stats_html(stats: dict) -> str:
+    """Строит HTML-страницу статистики с графиками Plotly"""
+    total_users = stats["total_users"]
+    new_users_today = stats["new_users_today"]
+    dau = stats["dau"]
+    total_messages = stats["total_messages"]
+    avg_msg_per_user = stats["avg_msg_per_user"]
+    peak_hours = stats["peak_hours"]
+    avg_response_time = stats["avg_response_time"]
+    conversion = stats["conversion_trial_to_paid"]
+    avg_bots_per_user = stats["avg_bots_per_user"]
+    total_revenue = stats["total_revenue"]
+    arpu = stats["arpu"]
+    ltv = stats["ltv"]
+    activity_rate = stats["activity_rate"]
+    retention = stats["retention"]
     # Форматируем значения для HTML (None -> '—')
     avg_msg_per_user_str = f"{avg_msg_per_user:.2f}" if avg_msg_per_user is not None else "—"
     avg_response_time_str = f"{avg_response_time:.2f} сек" if avg_response_time is not None else "—"
@@ -176,136 +81,160 @@ async def get_stats(request: Request):
     dislikes_str = str(rating_stats.get("dislikes", 0))
     like_percentage_str = f"{rating_stats.get('like_percentage', 0):.1f}%" if rating_stats.get('like_percentage') else "—"
     
-    if "text/html" in request.headers.get("accept", ""):
-        logging.info("[API] /stats: returning HTML page")
-        # --- Plotly графики ---
-        # 1. DAU по дням (за последние 14 дней)
-        from sqlalchemy import desc
-        days = [(datetime.now(timezone.utc).date() - timedelta(days=i)) for i in range(13, -1, -1)]
-        dau_per_day = []
-        for d in days:
-            cnt = await database.fetch_val(
-                func.count(func.distinct(MessageStat.telegram_id)).select().where(func.date(MessageStat.datetime) == d)
-            )
-            dau_per_day.append(cnt or 0)
-        fig_dau = go.Figure(go.Bar(x=[d.strftime('%d.%m') for d in days], y=dau_per_day, marker_color='#1f77b4'))
-        fig_dau.update_layout(
-            title='DAU (уникальные пользователи по дням)',
-            template='plotly_dark',
-            plot_bgcolor='#222',
-            paper_bgcolor='#222',
-            font_color='#fff',
-            margin=dict(l=30, r=30, t=60, b=30)
-        )
-        dau_html = pio.to_html(fig_dau, full_html=False, include_plotlyjs='cdn')
-        # 2. Сообщения по часам (heatmap)
-        hour_counts_full = [0]*24
-        for h, c in hour_counts.items():
-            try:
-                hour_int = int(h)
-                hour_counts_full[hour_int] = c
-            except:
-                pass
-        fig_hours = go.Figure(go.Bar(x=[f"{h:02d}:00" for h in range(24)], y=hour_counts_full, marker_color='#e45756'))
-        fig_hours.update_layout(
-            title='Распределение сообщений по часам суток',
+    # --- Plotly графики ---
+    # 1. DAU по дням (за последние 14 дней)
+    days = [day for day, _ in stats["dau_series"]]
+    dau_per_day = [users_count for _, users_count in stats["dau_series"]]
+    fig_dau = go.Figure(go.Bar(x=[datetime.fromisoformat(d).strftime('%d.%m') for d in days], y=dau_per_day, marker_color='#1f77b4'))
+    fig_dau.update_layout(
+        title='DAU (уникальные пользователи по дням)',
+        template='plotly_dark',
+        plot_bgcolor='#222',
+        paper_bgcolor='#222',
+        font_color='#fff',
+        margin=dict(l=30, r=30, t=60, b=30)
+    )
+    dau_html = pio.to_html(fig_dau, full_html=False, include_plotlyjs=False)
+    # 2. Сообщения по часам (heatmap)
+    hour_counts_full = stats["hourly_histogram"]
+    fig_hours = go.Figure(go.Bar(x=[f"{h:02d}:00" for h in range(24)], y=hour_counts_full, marker_color='#e45756'))
+    fig_hours.update_layout(
+        title='Распределение сообщений по часам суток',
+        template='plotly_dark',
+        plot_bgcolor='#222',
+        paper_bgcolor='#222',
+        font_color='#fff',
+        margin=dict(l=30, r=30, t=60, b=30)
+    )
+    hours_html = pio.to_html(fig_hours, full_html=False, include_plotlyjs=False)
+    # 3. Выручка по месяцам (если есть платежи)
+    if stats["revenue_by_month"]:
+        months = [month for month, _ in stats["revenue_by_month"]]
+        values = [amount for _, amount in stats["revenue_by_month"]]
+        fig_rev = go.Figure(go.Bar(x=months, y=values, marker_color='#72b7b2'))
+        fig_rev.update_layout(
+            title='Выручка по месяцам',
             template='plotly_dark',
             plot_bgcolor='#222',
             paper_bgcolor='#222',
             font_color='#fff',
             margin=dict(l=30, r=30, t=60, b=30)
         )
-        hours_html = pio.to_html(fig_hours, full_html=False, include_plotlyjs=False)
-        # 3. Выручка по месяцам (если есть платежи)
-        payments = await get_payments()
-        if payments:
-            from collections import defaultdict
-            revenue_by_month = defaultdict(float)
-            for p in payments:
-                dt = p['paid_at']
-                if isinstance(dt, str):
-                    dt = datetime.fromisoformat(dt)
-                key = dt.strftime('%Y-%m')
-                revenue_by_month[key] += p['amount']
-            months = sorted(revenue_by_month.keys())
-            values = [revenue_by_month[m] for m in months]
-            fig_rev = go.Figure(go.Bar(x=months, y=values, marker_color='#72b7b2'))
-            fig_rev.update_layout(
-                title='Выручка по месяцам',
-                template='plotly_dark',
-                plot_bgcolor='#222',
-                paper_bgcolor='#222',
-                font_color='#fff',
-                margin=dict(l=30, r=30, t=60, b=30)
-            )
-            rev_html = pio.to_html(fig_rev, full_html=False, include_plotlyjs=False)
-        else:
-            rev_html = ''
-        # --- HTML dark theme ---
-        html = f"""
-        <html lang='ru'>
-        <head>
-            <meta charset='utf-8'>
-            <title>Статистика бота</title>
-            <script src='https://cdn.plot.ly/plotly-latest.min.js'></script>
-            <style>
-                body {{ font-family: 'Segoe UI', Arial, sans-serif; background: #181c24; color: #fff; margin: 0; padding: 0; }}
-                .container {{ max-width: 900px; margin: 40px auto; background: #232733; border-radius: 16px; box-shadow: 0 4px 24px #0008; padding: 32px; }}
-                h1 {{ text-align: center; color: #4fc3f7; margin-bottom: 32px; }}
-                table {{ width: 100%; border-collapse: collapse; margin-top: 16px; }}
-                th, td {{ padding: 12px 10px; text-align: left; }}
-                th {{ background: #232733; color: #4fc3f7; font-size: 1.1em; }}
-                tr:nth-child(even) {{ background: #232733; }}
-                tr:hover {{ background: #2a2e3a; }}
-                .desc {{ color: #aaa; font-size: 0.95em; }}
-                .charts {{ margin: 40px 0 0 0; }}
-                .charts > div {{ margin-bottom: 40px; }}
-            </style>
-        </head>
-        <body>
-        <div class='container'>
-            <h1>📊 Статистика Telegram-бота</h1>
-            <table>
-                <tr><th>Показатель</th><th>Значение</th></tr>
-                <tr><td>👥 Всего пользователей</td><td>{total_users}</td></tr>
-                <tr><td>🆕 Новых сегодня</td><td>{new_users_today}</td></tr>
-                <tr><td>🗓️ DAU (уникальных за сегодня)</td><td>{dau}</td></tr>
-                <tr><td>💬 Всего сообщений</td><td>{total_messages}</td></tr>
-                <tr><td>💬 Среднее сообщений на пользователя</td><td>{avg_msg_per_user_str}</td></tr>
-                <tr><td>⏰ Пиковые часы активности</td><td>{', '.join([f'{h}:00 ({c} сообщений)' for h, c in peak_hours]) if peak_hours else 'Нет данных'}</td></tr>
-                <tr><td>⏱️ Среднее время ответа</td><td>{avg_response_time_str}</td></tr>
-                <tr><td>🔄 Конверсия из триала в оплату</td><td>{conversion_str}</td></tr>
-                <tr><td>🤖 Среднее число проектов на пользователя</td><td>{avg_bots_per_user_str}</td></tr>
-                <tr><td>💸 Общая выручка</td><td>{total_revenue_str}</td></tr>
-                <tr><td>💰 ARPU (средний доход на пользователя)</td><td>{arpu_str}</td></tr>
-                <tr><td>📈 LTV (пожизненная ценность клиента)</td><td>{ltv_str}</td></tr>
-                <tr><td>🔥 Activity Rate</td><td>{activity_rate_str}</td></tr>
-                <tr><td>🔁 Retention (удержание)</td><td>{retention_str}</td></tr>
-                <tr><td>👍 Всего оценок ответов</td><td>{total_ratings_str}</td></tr>
-                <tr><td>👍 Лайки</td><td>{likes_str}</td></tr>
-                <tr><td>👎 Дизлайки</td><td>{dislikes_str}</td></tr>
-                <tr><td>📊 Процент лайков</td><td>{like_percentage_str}</td></tr>
-            </table>
-            <div class='desc' style='margin-top:24px;'>
-                <b>Пояснения:</b><br>
-                <b>DAU</b> — Daily Active Users, уникальные пользователи за сегодня.<br>
-                <b>ARPU</b> — средний доход на пользователя.<br>
-                <b>LTV</b> — пожизненная ценность клиента.<br>
-                <b>Retention</b> — удержание платящих пользователей.<br>
-                <b>Activity Rate</b> — доля активных пользователей за сутки.<br>
-            </div>
-            <div class='charts'>
-                <div>{dau_html}</div>
-                <div>{hours_html}</div>
-                {f'<div>{rev_html}</div>' if rev_html else ''}
-            </div>
-        </div>
-        </body></html>
-        """
-        return HTMLResponse(content=html)
+        rev_html = pio.to_html(fig_rev, full_html=False, include_plotlyjs=False)
     else:
-        logging.info("[API] /stats: returning JSON")
-        return stats
+        rev_html = ''
+    # --- HTML dark theme ---
+    html = f"""
+    <html lang='ru'>
+    <head>
+        <meta charset='utf-8'>
+        <title>Статистика бота</title>
+        <!-- plotly.js подключается один раз, версия совпадает с установленным plotly -->
+        <script src='https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js'></script>
+        <style>
+            body {{ font-family: 'Segoe UI', Arial, sans-serif; background: #181c24; color: #fff; margin: 0; padding: 0; }}
+            .container {{ max-width: 900px; margin: 40px auto; background: #232733; border-radius: 16px; box-shadow: 0 4px 24px #0008; padding: 32px; }}
+            h1 {{ text-align: center; color: #4fc3f7; margin-bottom: 32px; }}
+            table {{ width: 100%; border-collapse: collapse; margin-top: 16px; }}
+            th, td {{ padding: 12px 10px; text-align: left; }}
+            th {{ background: #232733; color: #4fc3f7; font-size: 1.1em; }}
+            tr:nth-child(even) {{ background: #232733; }}
+            tr:hover {{ background: #2a2e3a; }}
+            .desc {{ color: #aaa; font-size: 0.95em; }}
+            .charts {{ margin: 40px 0 0 0; }}
+            .charts > div {{ margin-bottom: 40px; }}
+        </style>
+    </head>
+    <body>
+    <div class='container'>
+        <h1>📊 Статистика Telegram-бота</h1>
+        <table>
+            <tr><th>Показатель</th><th>Значение</th></tr>
+            <tr><td>👥 Всего пользователей</td><td>{total_users}</td></tr>
+            <tr><td>🆕 Новых сегодня</td><td>{new_users_today}</td></tr>
+            <tr><td>🗓️ DAU (уникальных за сегодня)</td><td>{dau}</td></tr>
+            <tr><td>💬 Всего сообщений</td><td>{total_messages}</td></tr>
+            <tr><td>💬 Среднее сообщений на пользователя</td><td>{avg_msg_per_user_str}</td></tr>
+            <tr><td>⏰ Пиковые часы активности</td><td>{', '.join([f'{h}:00 ({c} сообщений)' for h, c in peak_hours]) if peak_hours else 'Нет данных'}</td></tr>
+            <tr><td>⏱️ Среднее время ответа</td><td>{avg_response_time_str}</td></tr>
+            <tr><td>🔄 Конверсия из триала в оплату</td><td>{conversion_str}</td></tr>
+            <tr><td>🤖 Среднее число проектов на пользователя</td><td>{avg_bots_per_user_str}</td></tr>
+            <tr><td>💸 Общая выручка</td><td>{total_revenue_str}</td></tr>
+            <tr><td>💰 ARPU (средний доход на пользователя)</td><td>{arpu_str}</td></tr>
+            <tr><td>📈 LTV (пожизненная ценность клиента)</td><td>{ltv_str}</td></tr>
+            <tr><td>🔥 Activity Rate</td><td>{activity_rate_str}</td></tr>
+            <tr><td>🔁 Retention (удержание)</td><td>{retention_str}</td></tr>
+            <tr><td>👍 Всего оценок ответов</td><td>{total_ratings_str}</td></tr>
+            <tr><td>👍 Лайки</td><td>{likes_str}</td></tr>
+            <tr><td>👎 Дизлайки</td><td>{dislikes_str}</td></tr>
+            <tr><td>📊 Процент лайков</td><td>{like_percentage_str}</td></tr>
+        </table>
+        <div class='desc' style='margin-top:24px;'>
+            <b>Пояснения:</b><br>
+            <b>DAU</b> — Daily Active Users, уникальные пользователи за сегодня.<br>
+            <b>ARPU</b> — средний доход на пользователя.<br>
+            <b>LTV</b> — пожизненная ценность клиента.<br>
+            <b>Retention</b> — удержание платящих пользователей.<br>
+            <b>Activity Rate</b> — доля активных пользователей за сутки.<br>
+        </div>
+        <div class='charts'>
+            <div>{dau_html}</div>
+            <div>{hours_html}</div>
+            {f'<div>{rev_html}</div>' if rev_html else ''}
+        </div>
+    </div>
+    </body></html>
+    """
+    return html
+
+stats_snapshot = StatsSnapshot(collect_stats, render_stats_html)
+
+@asynccontextmanager
+async def stats_lifespan(app):
+    # Фоновое обновление снимка /stats живёт вместе с приложением (после подключения БД)
+    stats_snapshot.start()
+    try:
+        yield
+    finally:
+        await stats_snapshot.stop()
+
+stats_router = APIRouter(lifespan=stats_lifespan)
+
+@stats_router.get("/stats")
+async def get_stats(request: Request):
+    logging.info(f"[API] /stats called from {request.client.host if hasattr(request, 'client') else 'unknown'}")
+    # Снимок статистики обновляется в фоне, сам запрос к БД не обращается
+    snapshot = await stats_snapshot.get()
+    if "text/html" in request.headers.get("accept", ""):
+        logging.info("[API] /stats: returning HTML page")
+        return snapshot.response(request, html=True)
+    logging.info("[API] /stats: returning JSON")
+    return snapshot.response(request, html=False)
+
+app.include_router(stats_router)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики очередей обновлений, пула БД и кэшей"""
+    return {
+        "update_queues": {
+            "main": main_update_queue.metrics(),
+            "settings": settings_update_queue.metrics(),
+        },
+        "update_dispatch": {
+            "main": main_update_dispatcher.metrics(),
+            "settings": settings_update_dispatcher.metrics(),
+        },
+        "db_pool": get_pool_metrics(database),
+        "response_cache": response_cache_stats,
+        "stats_snapshot": stats_snapshot.metrics(),
+        "telemetry_buffer": telemetry_buffer.metrics(),
+        "analytics_shipper": analytics.metrics(),
+        "telegram_send": get_send_metrics(),
+        "jobs": job_scheduler.metrics(),
+        "transcription": transcriber.metrics(),
+        "content_cache": content_cache.metrics(),
+    }
 
 @app.get("/feedbacks")
 async def get_feedbacks_api():
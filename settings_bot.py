@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Request, Form
+from fastapi.responses import JSONResponse
 from aiogram import Bot, types
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram import Router, Dispatcher
@@ -18,7 +19,6 @@ from settings_payment import handle_pay_command, handle_pay_callback, handle_pay
 from settings_middleware import trial_middleware
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 import logging
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import traceback
 import time
 import datetime
@@ -30,7 +30,10 @@ from aiogram.filters import StateFilter
 from settings_forms import settings_forms_router
 from settings_states import ExtendedSettingsStates
 import settings_forms
-from database import get_payments
+from database import get_user_subscription, get_user_payment_counts, database
+from update_queue import UpdateQueue, UpdateQueueFull
+from update_dispatch import UpdateDispatcher
+from send_scheduler import SendScheduler, broadcast_priority
 
 router = APIRouter()
 
@@ -38,6 +41,8 @@ SETTINGS_WEBHOOK_PATH = "/webhook/settings"
 SETTINGS_WEBHOOK_URL = f"{SERVER_URL}{SETTINGS_WEBHOOK_PATH}"
 
 settings_bot = Bot(token=SETTINGS_BOT_TOKEN)
+# Все исходящие запросы бота проходят через общий планировщик с лимитами Telegram
+settings_bot.session.middleware(SendScheduler("settings"))
 settings_storage = MemoryStorage()
 settings_router = Router()
 
@@ -54,9 +59,12 @@ auto_register_handlers(settings_forms_router, settings_forms)
 settings_dp = Dispatcher(storage=settings_storage)
 settings_dp.include_router(settings_router)
 
-scheduler = AsyncIOScheduler()
-
 async def check_expired_trials():
+    # Массовые уведомления идут в полосе низкого приоритета
+    with broadcast_priority():
+        await _notify_expired_trials()
+
+async def _notify_expired_trials():
     users = await get_users_with_expired_trial()
     logging.info(f"[TRIAL] Найдено пользователей с истекшим trial: {len(users)}")
     for user in users:
@@ -87,20 +95,18 @@ async def check_expired_trials():
             logging.error(f"[TRIAL] Ошибка при обработке пользователя {telegram_id}: {e}")
 
 async def check_expired_paid_month():
+    with broadcast_priority():
+        await _notify_expired_paid_month()
+
+async def _notify_expired_paid_month():
     users = await get_users_with_expired_paid_month()
     logging.info(f"[PAID_MONTH] Найдено пользователей с истекшим первым оплачиваемым месяцем: {len(users)}")
     for user in users:
         telegram_id = user.get('telegram_id')
         logging.info(f"[PAID_MONTH] Проверяю пользователя: {user}")
         try:
-            # Определяем правильную сумму для следующего платежа
-            from config import PAYMENT_AMOUNT
-            from database import get_payments
-            
-            payments = await get_payments()
-            user_payments = [p for p in payments if str(p['telegram_id']) == telegram_id and p['status'] == 'confirmed']
-            
             # Для продления подписки всегда используем полную сумму
+            from config import PAYMENT_AMOUNT
             payment_amount = PAYMENT_AMOUNT
             
             pay_kb = InlineKeyboardMarkup(
@@ -120,9 +126,7 @@ async def check_expired_paid_month():
         except Exception as e:
             logging.error(f"[PAID_MONTH] Ошибка при отправке уведомления: {e}")
 
-scheduler.add_job(check_expired_trials, 'interval', minutes=1)
-scheduler.add_job(check_expired_paid_month, 'interval', hours=1)
-scheduler.start()
+# check_expired_trials и check_expired_paid_month запускаются планировщиком задач приложения (см. base.py)
 
 # --- Middleware для перехвата команд, если trial истёк ---
 async def trial_middleware(message: types.Message, state: FSMContext, handler):
@@ -474,20 +478,17 @@ async def handle_start_feedback(callback_query: types.CallbackQuery, state: FSMC
 
 async def handle_pay_command(message: types.Message, state: FSMContext):
     """Обработчик команды оплаты"""
-    from database import get_payments
+    from database import get_user_payment_counts
     from config import DISCOUNT_PAYMENT_AMOUNT, PAYMENT_AMOUNT
     
     telegram_id = str(message.from_user.id)
     logging.info(f"[PAYMENT-DEBUG] handle_pay_command: telegram_id from message = {telegram_id}")
-    payments = await get_payments()
-    logging.info(f"[PAYMENT-DEBUG] handle_pay_command: all payments count = {len(payments)}")
-    all_user_payments = [p for p in payments if str(p['telegram_id']) == telegram_id]
-    logging.info(f"[PAYMENT-DEBUG] handle_pay_command: user payments for {telegram_id}: {all_user_payments}")
-    confirmed_payments = [p for p in all_user_payments if p['status'] == 'confirmed']
-    logging.info(f"[PAYMENT-DEBUG] handle_pay_command: confirmed payments for {telegram_id}: {confirmed_payments}")
+    payment_counts = await get_user_payment_counts(telegram_id)
+    logging.info(f"[PAYMENT-DEBUG] handle_pay_command: payment counts for {telegram_id}: {payment_counts}")
+    confirmed_count = payment_counts.get('confirmed', 0)
     card = random.choice([PAYMENT_CARD_NUMBER1, PAYMENT_CARD_NUMBER2, PAYMENT_CARD_NUMBER3])
-    logging.info(f"[PAYMENT] Пользователь {telegram_id}: всего платежей={len(all_user_payments)}, подтверждённых={len(confirmed_payments)}")
-    if len(confirmed_payments) == 0:
+    logging.info(f"[PAYMENT] Пользователь {telegram_id}: всего платежей={sum(payment_counts.values())}, подтверждённых={confirmed_count}")
+    if confirmed_count == 0:
         payment_text = f"💳 **Оплата подписки**\n\nДля оплаты переведите {DISCOUNT_PAYMENT_AMOUNT} рублей на карту:\n`{card}`\n\nПосле оплаты отправьте чек сюда (фото/скриншот)."
         logging.info(f"[PAYMENT] Пользователь {telegram_id}: предлагается сумма {DISCOUNT_PAYMENT_AMOUNT}")
     else:
@@ -974,6 +975,17 @@ async def handle_confirm_delete(callback_query: types.CallbackQuery, state: FSMC
         await callback_query.message.edit_text("Произошла ошибка при удалении проекта")
         await state.clear()
 
+# Отбрасывает повторные доставки и не даёт обновлениям одного чата обрабатываться параллельно
+settings_update_dispatcher = UpdateDispatcher("settings", settings_dp, settings_bot)
+
+async def process_settings_update(update: types.Update):
+    """Обрабатывает одно обновление settings бота (вызывается воркером очереди)"""
+    await settings_update_dispatcher.feed(update)
+    logger.info(f"Update {update.update_id} processed successfully")
+
+# Очередь обновлений: webhook отвечает Telegram сразу, обработка идёт в воркерах
+settings_update_queue = UpdateQueue("settings", process_settings_update)
+
 @router.post(SETTINGS_WEBHOOK_PATH)
 async def process_settings_webhook(request: Request):
     logger.info("Received webhook call for settings bot")
@@ -981,9 +993,13 @@ async def process_settings_webhook(request: Request):
         update_data = await request.json()
         logger.info(f"Update data: {update_data}")
         update = types.Update.model_validate(update_data)
-        await settings_dp.feed_update(settings_bot, update)
-        logger.info("Update processed successfully")
+        await settings_update_queue.put(update)
+        logger.info(f"Update {update.update_id} queued")
         return {"ok": True}
+    except UpdateQueueFull as e:
+        # Не 2xx — Telegram повторит доставку позже
+        logger.warning(f"Settings update queue is full: {e}")
+        return JSONResponse(status_code=503, content={"ok": False, "error": "busy"})
     except Exception as e:
         logger.error(f"Error in process_settings_webhook: {e}\n{traceback.format_exc()}")
         return {"ok": False, "error": str(e), "trace": traceback.format_exc()}
@@ -1042,15 +1058,13 @@ async def handle_show_data(callback_query: types.CallbackQuery, state: FSMContex
 
 @settings_router.callback_query(lambda c: c.data == "pay_trial")
 async def handle_pay_trial(callback_query: types.CallbackQuery, state: FSMContext):
-    from database import get_payments
     from config import DISCOUNT_PAYMENT_AMOUNT, PAYMENT_AMOUNT
     telegram_id = str(callback_query.from_user.id)
-    payments = await get_payments()
-    all_user_payments = [p for p in payments if str(p['telegram_id']) == telegram_id]
-    confirmed_payments = [p for p in all_user_payments if p['status'] == 'confirmed']
+    payment_counts = await get_user_payment_counts(telegram_id)
+    confirmed_count = payment_counts.get('confirmed', 0)
     card = random.choice([PAYMENT_CARD_NUMBER1, PAYMENT_CARD_NUMBER2, PAYMENT_CARD_NUMBER3])
-    logging.info(f"[PAYMENT] Пользователь {telegram_id}: всего платежей={len(all_user_payments)}, подтверждённых={len(confirmed_payments)} (pay_trial)")
-    if len(confirmed_payments) == 0:
+    logging.info(f"[PAYMENT] Пользователь {telegram_id}: всего платежей={sum(payment_counts.values())}, подтверждённых={confirmed_count} (pay_trial)")
+    if confirmed_count == 0:
         await callback_query.message.answer(
             f"Для оплаты переведите {DISCOUNT_PAYMENT_AMOUNT} рублей на карту: {card}\n\nПосле оплаты отправьте чек сюда (фото/скриншот)."
         )
@@ -1368,12 +1382,11 @@ async def handle_projects_command(message: types.Message, state: FSMContext, tel
 async def handle_pay_subscription(callback_query: types.CallbackQuery, state: FSMContext):
     from config import DISCOUNT_PAYMENT_AMOUNT, PAYMENT_AMOUNT
     telegram_id = str(callback_query.from_user.id)
-    payments = await get_payments()
-    all_user_payments = [p for p in payments if str(p['telegram_id']) == telegram_id]
-    confirmed_payments = [p for p in all_user_payments if p['status'] == 'confirmed']
+    payment_counts = await get_user_payment_counts(telegram_id)
+    confirmed_count = payment_counts.get('confirmed', 0)
     card = random.choice([PAYMENT_CARD_NUMBER1, PAYMENT_CARD_NUMBER2, PAYMENT_CARD_NUMBER3])
-    logging.info(f"[PAYMENT] Пользователь {telegram_id}: всего платежей={len(all_user_payments)}, подтверждённых={len(confirmed_payments)} (pay_subscription)")
-    if len(confirmed_payments) == 0:
+    logging.info(f"[PAYMENT] Пользователь {telegram_id}: всего платежей={sum(payment_counts.values())}, подтверждённых={confirmed_count} (pay_subscription)")
+    if confirmed_count == 0:
         await callback_query.message.answer(
             f"Для оплаты переведите {DISCOUNT_PAYMENT_AMOUNT} рублей на карту: {card}\n\nПосле оплаты отправьте чек сюда (фото/скриншот)."
         )
@@ -1432,23 +1445,11 @@ async def get_days_left_text(telegram_id: str) -> str:
         logging.info(f"[DAYS_LEFT] get_days_left_text: user not found, returning empty string")
         return ""
     if user.get("paid"):
-        payments = await get_payments()
-        confirmed = [p for p in payments if str(p['telegram_id']) == telegram_id and p['status'] == 'confirmed']
-        logging.info(f"[DAYS_LEFT] get_days_left_text: confirmed payments: {confirmed}")
-        if confirmed:
-            last_paid = max(confirmed, key=lambda p: p['paid_at'])
-            from datetime import datetime, timezone
-            paid_at = last_paid['paid_at']
-            logging.info(f"[DAYS_LEFT] get_days_left_text: paid_at raw: {paid_at} (type: {type(paid_at)})")
-            if isinstance(paid_at, str):
-                from dateutil.parser import parse
-                paid_at = parse(paid_at)
-                logging.info(f"[DAYS_LEFT] get_days_left_text: paid_at parsed: {paid_at} (type: {type(paid_at)})")
-            now = datetime.now(timezone.utc)
-            days_left = 30 - (now - paid_at).days
-            logging.info(f"[DAYS_LEFT] get_days_left_text: now={now}, days_left={days_left}")
-            if days_left < 0:
-                days_left = 0
+        subscription = await get_user_subscription(telegram_id)
+        logging.info(f"[DAYS_LEFT] get_days_left_text: subscription: status={subscription['status']}, last_paid_at={subscription['last_paid_at']}")
+        if subscription["last_payment"]:
+            days_left = subscription["days_left"]
+            logging.info(f"[DAYS_LEFT] get_days_left_text: days_left={days_left}")
             result = f"До конца оплаченного периода: {days_left} дней.\n"
             logging.info(f"[DAYS_LEFT] get_days_left_text: result='{result}'")
             return result
@@ -1,33 +1,32 @@
 import logging
 import time
 from file_utils import extract_text_from_file_async
-import httpx
-from pydub import AudioSegment
+from llm_client import deepseek_chat
+from audio_pipeline import transcribe_voice
+from content_cache import content_cache, file_key, compressed_key
 
 async def process_business_file_with_deepseek(file_content: str) -> str:
-    from config import DEEPSEEK_API_KEY
+    # Тот же текст уже сжимали (повторная загрузка прайса) — не ждём минуту LLM
+    cache_key = compressed_key(file_content)
+    cached = await content_cache.get(cache_key)
+    if cached is not None:
+        logging.info("[CACHE] Сжатый текст взят из кэша, Deepseek не вызывается")
+        return cached
     try:
-        url = "https://api.deepseek.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": "Ты - эксперт по анализу и сжатию информации. Твоя задача - извлечь из данных ключевую информацию, убрать лишние детали, символы, смайлики и т.д. и представить её в самом компактном виде без потери смысла для использования минимально необходимого количества токенов"},
-                {"role": "user", "content": f"Обработай {file_content}"}
-            ],
-            "temperature": 0.3
-        }
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            resp = await client.post(url, headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-        return data["choices"][0]["message"]["content"]
+        messages = [
+            {"role": "system", "content": "Ты - эксперт по анализу и сжатию информации. Твоя задача - извлечь из данных ключевую информацию, убрать лишние детали, символы, смайлики и т.д. и представить её в самом компактном виде без потери смысла для использования минимально необходимого количества токенов"},
+            {"role": "user", "content": f"Обработай {file_content}"}
+        ]
+        resp = await deepseek_chat(messages, temperature=0.3, timeout=60.0)
+        resp.raise_for_status()
+        data = resp.json()
+        result = data["choices"][0]["message"]["content"]
     except Exception as e:
         logging.error(f"Ошибка при обработке файла через Deepseek: {e}")
+        # Исходный текст вместо сжатого в кэш не попадает: следующая загрузка попробует снова
         return file_content
+    await content_cache.put(cache_key, result)
+    return result
 
 def clean_markdown(text: str) -> str:
     import re
@@ -57,13 +56,24 @@ def clean_business_text(text: str) -> str:
 
 async def get_text_from_message(message, bot, max_length=4096) -> str:
     text_content = None
-    if message.document:
+    media = message.document or message.voice
+    # Повторно отправленный файл или голосовое: текст уже извлекали — не скачиваем и не разбираем заново
+    cache_key = file_key(media.file_unique_id) if media else None
+    cached = None
+    # Текст с пропущенными чанками распознавания не кэшируется: иначе повторная отправка навсегда получит неполный текст
+    complete = True
+    if cache_key:
+        cached = text_content = await content_cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"[CACHE] Текст {cache_key} взят из кэша")
+    elif message.document:
         try:
             file_info = await bot.get_file(message.document.file_id)
             file_path = file_info.file_path
             file_content = await bot.download_file(file_path)
             filename = message.document.file_name
-            text_content = await extract_text_from_file_async(filename, file_content.read())
+            # Разбор останавливается сразу за лимитом: длиннее max_length текст всё равно будет отклонён
+            text_content = await extract_text_from_file_async(filename, file_content.read(), max_length=max_length)
         except Exception as e:
             raise RuntimeError(f"Ошибка при обработке файла: {e}")
     elif message.text:
@@ -73,23 +83,18 @@ async def get_text_from_message(message, bot, max_length=4096) -> str:
             file_info = await bot.get_file(message.voice.file_id)
             file_path = file_info.file_path
             file_content = await bot.download_file(file_path)
-            import speech_recognition as sr
-            import tempfile
-            recognizer = sr.Recognizer()
-            with tempfile.NamedTemporaryFile(suffix='.ogg') as temp_ogg, tempfile.NamedTemporaryFile(suffix='.wav') as temp_wav:
-                temp_ogg.write(file_content.read())
-                temp_ogg.flush()
-                audio = AudioSegment.from_file(temp_ogg.name)
-                audio.export(temp_wav.name, format='wav')
-                temp_wav.flush()
-                with sr.AudioFile(temp_wav.name) as source:
-                    audio_data = recognizer.record(source)
-                text_content = recognizer.recognize_google(audio_data, language='ru-RU')
+            # Декодирование в память и распознавание по частям — без временных файлов и вне event loop
+            text_content, failed_chunks = await transcribe_voice(file_content.read(), language='ru-RU')
+            complete = not failed_chunks
             logging.info(f"[VOICE] Распознанный текст из голосового сообщения: {text_content}")
         except Exception as e:
             raise RuntimeError(f"Ошибка при распознавании голоса: {e}")
     if not text_content:
         raise RuntimeError("Пожалуйста, отправьте файл, текст или голосовое сообщение с информацией о бизнесе.")
     if len(text_content) > max_length:
-        raise ValueError(f"❌ Данные слишком большие!\n\nРазмер: {len(text_content)} символов\nМаксимальный размер: {max_length} символов\n\nПожалуйста, сократите или разделите на части.")
-    return clean_business_text(text_content) 
\ No newline at end of file
+        size = f"более {max_length}" if message.document else len(text_content)
+        raise ValueError(f"❌ Данные слишком большие!\n\nРазмер: {size} символов\nМаксимальный размер: {max_length} символов\n\nПожалуйста, сократите или разделите на части.")
+    if cache_key and cached is None and complete:
+        # Кэшируем только полностью извлечённый текст (длиннее лимита разбор обрывается)
+        await content_cache.put(cache_key, text_content)
+    return clean_business_text(text_content)
\ No newline at end of file
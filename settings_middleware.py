@@ -15,7 +15,7 @@ async def clear_asking_bot_cache(token: str):
 async def trial_middleware(message, state, handler):
     user = await get_user_by_id(str(message.from_user.id))
     if user:
-        from database import get_payments
+        from database import get_last_payment
         from datetime import datetime, timezone, timedelta
         if not user['paid']:
             start_date = user['start_date']
@@ -43,10 +43,9 @@ async def trial_middleware(message, state, handler):
                 return
         else:
             # Проверка истечения платного месяца
-            payments = await get_payments()
-            user_payments = [p for p in payments if str(p['telegram_id']) == str(user['telegram_id'])]
-            if user_payments:
-                last_paid = max(p['paid_at'] for p in user_payments)
+            last_payment = await get_last_payment(str(user['telegram_id']), status=None)
+            if last_payment:
+                last_paid = last_payment['paid_at']
                 if isinstance(last_paid, str):
                     from dateutil.parser import parse
                     last_paid = parse(last_paid)
@@ -1,5 +1,5 @@
 from config import PAYMENT_AMOUNT, PAYMENT_CARD_NUMBER1, PAYMENT_CARD_NUMBER2, PAYMENT_CARD_NUMBER3, MAIN_TELEGRAM_ID, PAID_PROJECTS
-from database import set_user_paid, get_user_projects, get_payments, log_payment
+from database import set_user_paid, get_user_projects, get_last_payment, get_user_payment_counts, log_payment
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
 import random
@@ -46,28 +46,24 @@ async def forward_check_with_notice(message, notice_text=None):
             raise notice_error
         
         # Отправляем стоимость текущей и предпоследней оплаты ОТДЕЛЬНЫМИ SMS-сообщениями
-        logging.info(f"[PAYMENT] forward_check_with_notice: получаем список платежей...")
+        logging.info(f"[PAYMENT] forward_check_with_notice: получаем платежи пользователя...")
         try:
-            payments = await get_payments()
-            logging.info(f"[PAYMENT] forward_check_with_notice: ✅ получено {len(payments)} платежей из БД")
+            payment_counts = await get_user_payment_counts(telegram_id)
+            logging.info(f"[PAYMENT] forward_check_with_notice: ✅ платежи пользователя по статусам: {payment_counts}")
         except Exception as payments_error:
             logging.error(f"[PAYMENT] forward_check_with_notice: ❌ ОШИБКА при получении платежей: {payments_error}")
             # Не поднимаем исключение, продолжаем обработку
-            payments = []
+            payment_counts = {}
         
-        user_payments = [p for p in payments if str(p['telegram_id']) == telegram_id]
-        logging.info(f"[PAYMENT] forward_check_with_notice: найдено {len(user_payments)} платежей для пользователя {telegram_id}")
+        user_payments_count = sum(payment_counts.values())
+        logging.info(f"[PAYMENT] forward_check_with_notice: найдено {user_payments_count} платежей для пользователя {telegram_id}")
         
-        user_payments_sorted = sorted(user_payments, key=lambda p: p['paid_at'])
-        logging.info(f"[PAYMENT] forward_check_with_notice: отсортировано {len(user_payments_sorted)} платежей")
-        
-        if user_payments_sorted:
+        if user_payments_count:
             # Определяем правильную сумму для следующего платежа
             from config import DISCOUNT_PAYMENT_AMOUNT, PAYMENT_AMOUNT
             
             # Подсчитываем количество подтвержденных платежей
-            confirmed_payments = [p for p in user_payments_sorted if p['status'] == 'confirmed']
-            payment_count = len(confirmed_payments)
+            payment_count = payment_counts.get('confirmed', 0)
             
             if payment_count == 0:
                 # Первый платеж - используем скидочную сумму
@@ -95,8 +91,8 @@ async def forward_check_with_notice(message, notice_text=None):
                 raise amount_error
             
             # Показываем информацию о предыдущих платежах
-            if len(confirmed_payments) > 0:
-                last_confirmed = confirmed_payments[-1]
+            last_confirmed = await get_last_payment(telegram_id, 'confirmed') if payment_count > 0 else None
+            if last_confirmed:
                 prev_amount = last_confirmed['amount']
                 logging.info(f"[PAYMENT] forward_check_with_notice: последний подтвержденный платеж = {prev_amount}")
                 
@@ -116,11 +112,8 @@ async def forward_check_with_notice(message, notice_text=None):
             try:
                 from config import DISCOUNT_PAYMENT_AMOUNT, PAYMENT_AMOUNT
                 
-                # Получаем все платежи пользователя для определения типа платежа
-                all_payments = await get_payments()
-                user_all_payments = [p for p in all_payments if str(p['telegram_id']) == telegram_id]
-                
-                if len(user_all_payments) == 0:
+                # Платежей у пользователя нет — это первый платеж
+                if user_payments_count == 0:
                     # Первый платеж - используем скидочную сумму
                     payment_amount = DISCOUNT_PAYMENT_AMOUNT
                     logging.info(f"[PAYMENT] forward_check_with_notice: первый платеж пользователя, сумма = {payment_amount}")
@@ -0,0 +1,146 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, func, case, and_, cast, Integer
+
+from database import (
+    database, User, Project, Payment, ProjectDailyStat, DailyActiveUser, MessageHourlyStat, RevenueMonthlyStat,
+    get_response_ratings_stats
+)
+
+logger = logging.getLogger(__name__)
+
+DAU_CHART_DAYS = 14
+TRIAL_EXPIRED_AFTER_DAYS = 14
+
+def _day_start(day) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+async def get_user_summary(today) -> dict:
+    """Пользователи одним запросом: всего, новые за сегодня, платящие, с истёкшим триалом"""
+    today_start = _day_start(today)
+    trial_border = datetime.now(timezone.utc) - timedelta(days=TRIAL_EXPIRED_AFTER_DAYS)
+    query = select(
+        func.count(User.telegram_id).label('total_users'),
+        func.sum(case((and_(User.start_date >= today_start, User.start_date < today_start + timedelta(days=1)), 1), else_=0)).label('new_users_today'),
+        func.sum(case((User.paid == True, 1), else_=0)).label('paid_users'),
+        func.sum(case((and_(User.paid == False, User.start_date < trial_border), 1), else_=0)).label('expired_trial_users'),
+    )
+    row = await database.fetch_one(query)
+    return {key: row[key] or 0 for key in ('total_users', 'new_users_today', 'paid_users', 'expired_trial_users')}
+
+async def get_message_summary(today) -> dict:
+    """Сообщения из дневных агрегатов: всего, среднее время ответа, DAU за сегодня"""
+    row = await database.fetch_one(select(
+        func.sum(ProjectDailyStat.messages).label('total_messages'),
+        func.sum(ProjectDailyStat.response_time_sum).label('response_time_sum'),
+        func.sum(ProjectDailyStat.response_time_count).label('response_time_count'),
+    ))
+    dau = await database.fetch_val(
+        select(func.count()).select_from(DailyActiveUser).where(DailyActiveUser.day == today.isoformat())
+    )
+    response_time_count = row['response_time_count'] or 0
+    return {
+        'total_messages': row['total_messages'] or 0,
+        'avg_response_time': (row['response_time_sum'] / response_time_count) if response_time_count else None,
+        'dau': dau or 0,
+    }
+
+async def get_dau_series(today, days: int = DAU_CHART_DAYS) -> list:
+    """DAU по дням за последние days дней одним GROUP BY; дни без сообщений — нули"""
+    first_day = today - timedelta(days=days - 1)
+    query = select(
+        DailyActiveUser.day,
+        func.count().label('users')
+    ).where(DailyActiveUser.day >= first_day.isoformat()).group_by(DailyActiveUser.day)
+    rows = await database.fetch_all(query)
+    by_day = {row['day']: row['users'] for row in rows}
+    series = []
+    for i in range(days):
+        d = first_day + timedelta(days=i)
+        series.append((d, by_day.get(d.isoformat(), 0)))
+    return series
+
+async def get_hourly_histogram() -> list:
+    """Количество сообщений по часам суток (24 значения) из почасовых агрегатов"""
+    hour = func.substr(MessageHourlyStat.hour, 12, 2).label('hour')
+    rows = await database.fetch_all(select(hour, func.sum(MessageHourlyStat.messages).label('cnt')).group_by(hour))
+    histogram = [0] * 24
+    for row in rows:
+        if row['hour']:
+            histogram[int(row['hour'])] = row['cnt']
+    return histogram
+
+async def get_revenue_summary() -> dict:
+    """Выручка по подтверждённым платежам: всего, по месяцам и средний срок жизни платящего клиента"""
+    rows = await database.fetch_all(
+        select(RevenueMonthlyStat.month, RevenueMonthlyStat.amount).order_by(RevenueMonthlyStat.month)
+    )
+    revenue_by_month = [(row['month'], row['amount'] or 0) for row in rows]
+
+    # Срок жизни: от первого до последнего платежа, в месяцах (минимум 1 месяц), усреднённый по клиентам
+    per_user = select(
+        Payment.telegram_id,
+        func.count(Payment.id).label('payments'),
+        func.min(Payment.paid_at).label('first_paid'),
+        func.max(Payment.paid_at).label('last_paid'),
+    ).where(Payment.status == 'confirmed').group_by(Payment.telegram_id).subquery()
+    lifetime_days = cast(func.julianday(per_user.c.last_paid) - func.julianday(per_user.c.first_paid), Integer)
+    lifetime_months = case(
+        (per_user.c.payments > 1, func.max(1.0, lifetime_days / 30.0)),
+        else_=1.0
+    )
+    row = await database.fetch_one(select(
+        func.avg(lifetime_months).label('avg_lifetime_months'),
+        func.count().label('paying_users'),
+    ).select_from(per_user))
+    return {
+        'total_revenue': sum(amount for _, amount in revenue_by_month),
+        'revenue_by_month': revenue_by_month,
+        'avg_lifetime_months': row['avg_lifetime_months'] or 0,
+        'paying_users': row['paying_users'] or 0,
+    }
+
+async def get_project_count() -> int:
+    return await database.fetch_val(select(func.count(Project.id))) or 0
+
+async def collect_stats() -> dict:
+    """Собирает все показатели /stats несколькими запросами к агрегатам (rollup-таблицам)"""
+    today = datetime.now(timezone.utc).date()
+    users = await get_user_summary(today)
+    messages = await get_message_summary(today)
+    revenue = await get_revenue_summary()
+    hourly = await get_hourly_histogram()
+    dau_series = await get_dau_series(today)
+    project_count = await get_project_count()
+    rating_stats = await get_response_ratings_stats()
+
+    total_users = users['total_users']
+    paid_users = users['paid_users']
+    expired_trial_users = users['expired_trial_users']
+    arpu = (revenue['total_revenue'] / paid_users) if paid_users else 0
+    peak_hours = sorted(
+        ((f"{hour:02d}", count) for hour, count in enumerate(hourly) if count),
+        key=lambda x: x[1], reverse=True
+    )[:3]
+    return {
+        "total_users": total_users,
+        "new_users_today": users['new_users_today'],
+        "dau": messages['dau'],
+        "total_messages": messages['total_messages'],
+        "avg_msg_per_user": (messages['total_messages'] / total_users) if total_users else 0,
+        "peak_hours": peak_hours,
+        "avg_response_time": messages['avg_response_time'],
+        "conversion_trial_to_paid": (paid_users / (paid_users + expired_trial_users) * 100) if (paid_users + expired_trial_users) else 0,
+        "avg_bots_per_user": (project_count / total_users) if total_users else 0,
+        "total_revenue": revenue['total_revenue'],
+        "arpu": arpu,
+        "ltv": arpu * revenue['avg_lifetime_months'],
+        "activity_rate": (messages['dau'] / total_users * 100) if total_users else 0,
+        # Удержание: платящих сейчас / плативших когда-либо
+        "retention": (paid_users / revenue['paying_users'] * 100) if revenue['paying_users'] else 100,
+        "response_ratings": rating_stats,
+        "dau_series": [(d.isoformat(), users_count) for d, users_count in dau_series],
+        "hourly_histogram": hourly,
+        "revenue_by_month": revenue['revenue_by_month'],
+    }
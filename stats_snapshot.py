@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from config import STATS_REFRESH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+class _Snapshot:
+    """Готовые тела ответов /stats и их валидаторы (ETag, Last-Modified)"""
+
+    def __init__(self, data: dict, json_body: bytes, digest: str, last_modified: datetime):
+        self.data = data
+        self.json_body = json_body
+        self.digest = digest
+        self.last_modified = last_modified.replace(microsecond=0)
+        self.html_body: Optional[bytes] = None
+
+    def _etag(self, html: bool) -> str:
+        return f'"{self.digest[:16]}-{"html" if html else "json"}"'
+
+    def _not_modified(self, request: Request, etag: str) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # If-None-Match важнее If-Modified-Since (RFC 9110)
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def response(self, request: Request, html: bool) -> Response:
+        """Ответ со снимком или 304, если у клиента уже актуальная версия"""
+        etag = self._etag(html)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+            "Vary": "Accept",
+        }
+        if self._not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        if html:
+            return Response(content=self.html_body, media_type="text/html; charset=utf-8", headers=headers)
+        return Response(content=self.json_body, media_type="application/json", headers=headers)
+
+class StatsSnapshot:
+    """Снимок статистики, обновляемый в фоне; запросы /stats отдают его без обращения к БД"""
+
+    def __init__(self, build: Callable[[], Awaitable[dict]], render_html: Callable[[dict], str],
+                 interval: float = STATS_REFRESH_INTERVAL):
+        self.build = build
+        self.render_html = render_html
+        self.interval = interval
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"refreshes": 0, "changes": 0, "failures": 0, "build_time_last": 0.0, "render_time_last": 0.0}
+
+    async def refresh(self) -> _Snapshot:
+        """Пересчитывает данные; HTML перестраивается только если данные изменились"""
+        async with self._lock:
+            started = time.monotonic()
+            data = jsonable_encoder(await self.build())
+            json_body = json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")
+            digest = hashlib.sha1(json_body).hexdigest()
+            self.stats["refreshes"] += 1
+            self.stats["build_time_last"] = time.monotonic() - started
+            if self._snapshot is not None and self._snapshot.digest == digest:
+                return self._snapshot
+            snapshot = _Snapshot(data, json_body, digest, datetime.now(timezone.utc))
+            started = time.monotonic()
+            # Plotly строит страницу заметное время — выносим из event loop
+            snapshot.html_body = (await asyncio.to_thread(self.render_html, data)).encode("utf-8")
+            self.stats["render_time_last"] = time.monotonic() - started
+            self.stats["changes"] += 1
+            self._snapshot = snapshot
+            return snapshot
+
+    async def get(self) -> _Snapshot:
+        """Текущий снимок; при первом обращении строится синхронно"""
+        if self._snapshot is None:
+            return await self.refresh()
+        return self._snapshot
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Остаётся предыдущий снимок, следующая попытка — через interval
+                self.stats["failures"] += 1
+                logger.error(f"[STATS] Ошибка обновления снимка статистики: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Запускает фоновое обновление (вызывается при старте приложения)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="stats-snapshot-refresh")
+            logger.info(f"[STATS] Фоновое обновление снимка статистики каждые {self.interval:.0f} с")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "interval": self.interval,
+            "last_modified": snapshot.last_modified.isoformat() if snapshot else None,
+            **self.stats,
+        }
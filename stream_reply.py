@@ -0,0 +1,73 @@
+import logging
+import re
+import time
+from typing import AsyncIterator, Optional
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+
+from config import STREAM_EDIT_INTERVAL, STREAM_FIRST_MESSAGE_MAX_WAIT
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_MARKER = "[АНАЛИТИКА:"
+_SENTENCE_END = re.compile(r'[.!?…](\s|$)|\n')
+
+def visible_part(raw_text: str) -> str:
+    """Возвращает часть ответа, которую можно показать пользователю.
+
+    Всё, начиная с маркера аналитики, отрезается; если текст заканчивается
+    началом маркера (например, "[АНА"), этот хвост придерживается до следующего фрагмента.
+    """
+    marker_pos = raw_text.find(ANALYTICS_MARKER)
+    if marker_pos != -1:
+        return raw_text[:marker_pos]
+    for length in range(min(len(ANALYTICS_MARKER) - 1, len(raw_text)), 0, -1):
+        if ANALYTICS_MARKER.startswith(raw_text[-length:]):
+            return raw_text[:-length]
+    return raw_text
+
+class StreamingReply:
+    """Отправляет ответ первым предложением и дописывает его правками не чаще STREAM_EDIT_INTERVAL"""
+
+    def __init__(self, message: types.Message, edit_interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.edit_interval = edit_interval
+        self.raw_text = ""
+        self.sent: Optional[types.Message] = None
+        self.shown_text = ""
+        self._last_edit = 0.0
+
+    async def feed(self, chunks: AsyncIterator[str]) -> str:
+        """Читает фрагменты ответа, обновляя сообщение; возвращает полный сырой текст"""
+        async for chunk in chunks:
+            self.raw_text += chunk
+            visible = visible_part(self.raw_text).strip()
+            if not visible or visible == self.shown_text:
+                continue
+            if self.sent is None:
+                # Первое сообщение — как только готово первое предложение
+                if _SENTENCE_END.search(visible) or len(visible) >= STREAM_FIRST_MESSAGE_MAX_WAIT:
+                    self.sent = await self.message.answer(visible)
+                    self.shown_text = visible
+                    self._last_edit = time.monotonic()
+            elif time.monotonic() - self._last_edit >= self.edit_interval:
+                await self._edit(visible)
+        return self.raw_text
+
+    async def finish(self, text: str, reply_markup=None):
+        """Выводит итоговый текст (и клавиатуру) одной отправкой или правкой"""
+        if self.sent is None:
+            self.sent = await self.message.answer(text, reply_markup=reply_markup)
+            self.shown_text = text
+        else:
+            await self._edit(text, reply_markup=reply_markup)
+
+    async def _edit(self, text: str, reply_markup=None):
+        try:
+            await self.sent.edit_text(text, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            # "message is not modified" и подобные ошибки не должны ронять ответ
+            logger.warning(f"[STREAM] Не удалось отредактировать сообщение: {e}")
+        self.shown_text = text
+        self._last_edit = time.monotonic()
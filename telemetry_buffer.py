@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from config import TELEMETRY_BATCH_SIZE, TELEMETRY_FLUSH_INTERVAL_MS, TELEMETRY_MAX_PENDING, TELEMETRY_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+class TelemetryBuffer:
+    """Буфер аналитических записей: копит строки и пишет их пачкой в одной транзакции (write-behind)"""
+
+    def __init__(self, write: Callable[[dict], Awaitable[None]], batch_size: int = TELEMETRY_BATCH_SIZE,
+                 flush_interval_ms: int = TELEMETRY_FLUSH_INTERVAL_MS, max_pending: int = TELEMETRY_MAX_PENDING,
+                 max_attempts: int = TELEMETRY_MAX_ATTEMPTS):
+        # write получает {вид записи: [словари значений]} и сам открывает транзакцию
+        self.write = write
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max(self.batch_size, max_pending)
+        self.max_attempts = max(1, max_attempts)
+        self._pending = {}
+        self._size = 0
+        # Пачка, которую не удалось записать: повторяется отдельно от новых записей, с паузой, не больше max_attempts раз
+        self._failed: Optional[dict] = None
+        self._failed_size = 0
+        self._failed_attempts = 0
+        self._retry_at = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {
+            "added_total": 0, "written_total": 0, "dropped_total": 0, "flushes": 0, "flush_failures": 0, "batches_dropped": 0,
+            "flush_time_last": 0.0, "flush_time_max": 0.0, "batch_size_max": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def _ensure_primitives(self):
+        # Примитивы создаются лениво, чтобы быть привязанными к рабочему event loop
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+
+    async def add(self, kind: str, values: dict):
+        """Ставит запись в буфер; без запущенного фонового цикла записывает сразу"""
+        if not self.running:
+            await self.write({kind: [values]})
+            self.stats["added_total"] += 1
+            self.stats["written_total"] += 1
+            return
+        if self._size + self._failed_size >= self.max_pending:
+            # БД не успевает или недоступна — аналитика не должна съесть всю память
+            self.stats["dropped_total"] += 1
+            if self.stats["dropped_total"] % 1000 == 1:
+                logger.warning(f"[TELEMETRY] Буфер переполнен ({self._size}), записи отбрасываются: всего {self.stats['dropped_total']}")
+            return
+        self._pending.setdefault(kind, []).append(values)
+        self._size += 1
+        self.stats["added_total"] += 1
+        if self._size >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Записывает накопленное одной транзакцией; сначала — ранее не записанную пачку, если пора её повторить"""
+        self._ensure_primitives()
+        async with self._flush_lock:
+            if self._failed is not None:
+                if time.monotonic() < self._retry_at and not self._stopping:
+                    return 0
+                batch, size = self._failed, self._failed_size
+            elif self._size:
+                batch, size = self._pending, self._size
+                self._pending, self._size = {}, 0
+            else:
+                return 0
+            started = time.monotonic()
+            try:
+                await self.write(batch)
+            except Exception as e:
+                self.stats["flush_failures"] += 1
+                self._failed_attempts = self._failed_attempts + 1 if self._failed is not None else 1
+                if self._failed_attempts >= self.max_attempts:
+                    # Пачка с «ядовитой» записью не должна повторяться вечно и держать место в буфере
+                    logger.error(f"[TELEMETRY] Пачка из {size} записей не записана за {self._failed_attempts} попыток и отброшена: {e}", exc_info=True)
+                    self.stats["dropped_total"] += size
+                    self.stats["batches_dropped"] += 1
+                    self._failed, self._failed_size, self._failed_attempts = None, 0, 0
+                    return 0
+                delay = min(60.0, self.flush_interval * 2 ** self._failed_attempts)
+                logger.error(f"[TELEMETRY] Ошибка записи пачки из {size} записей (попытка {self._failed_attempts}), повтор через {delay:.1f} с: {e}", exc_info=True)
+                self._failed, self._failed_size = batch, size
+                self._retry_at = time.monotonic() + delay
+                return 0
+            self._failed, self._failed_size, self._failed_attempts = None, 0, 0
+            elapsed = time.monotonic() - started
+            self.stats["flushes"] += 1
+            self.stats["written_total"] += size
+            self.stats["flush_time_last"] = elapsed
+            self.stats["flush_time_max"] = max(self.stats["flush_time_max"], elapsed)
+            self.stats["batch_size_max"] = max(self.stats["batch_size_max"], size)
+            return size
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Запускает фоновую запись (вызывается при старте приложения, после подключения БД)"""
+        if self.running:
+            return
+        self._ensure_primitives()
+        self._stopping = False
+        self._task = asyncio.create_task(self._loop(), name="telemetry-flush")
+        logger.info(f"[TELEMETRY] Пакетная запись аналитики: до {self.batch_size} записей или каждые {self.flush_interval * 1000:.0f} мс")
+
+    async def stop(self):
+        """Останавливает фоновый цикл и дописывает остаток (до закрытия БД)"""
+        if not self.running:
+            return
+        # Не отменяем задачу: прерванная посреди транзакции пачка была бы потеряна
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # Не записанная ранее пачка и новые записи пишутся отдельными транзакциями
+        written = 0
+        while self._failed is not None or self._size:
+            flushed = await self.flush()
+            if not flushed:
+                break
+            written += flushed
+        if self._size + self._failed_size:
+            logger.error(f"[TELEMETRY] При остановке не записано {self._size + self._failed_size} записей аналитики")
+        logger.info(f"[TELEMETRY] Буфер аналитики остановлен, дописано {written} записей")
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": self._size + self._failed_size,
+            "failed_batch_attempts": self._failed_attempts,
+            "pending_by_kind": {kind: len(rows) for kind, rows in self._pending.items()},
+            **self.stats,
+        }
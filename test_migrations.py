@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Тесты версионных миграций: повторный запуск и одновременный запуск из нескольких потоков
+"""
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, Index, create_engine, inspect, text
+
+import migrations
+from migrations import create_tables, get_applied_versions, run_migrations
+
+def make_metadata(with_extra: bool) -> MetaData:
+    metadata = MetaData()
+    columns = [Column("id", Integer, primary_key=True), Column("name", String)]
+    if with_extra:
+        columns.append(Column("extra", Integer))
+    Table("item", metadata, *columns, Index("ix_item_name", "name"))
+    return metadata
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    # Старая схема: таблица без колонки extra и без индекса
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY, name VARCHAR)"))
+        connection.execute(text("INSERT INTO item (id, name) VALUES (1, 'a')"))
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Подменяет список миграций тестовым; возвращает счётчик применений каждой миграции"""
+    counter = {1: 0, 2: 0, 3: 0}
+
+    def counted(version, migrate):
+        def step(connection, metadata):
+            counter[version] += 1
+            # Держим блокировку подольше, чтобы параллельные запуски точно пересеклись
+            time.sleep(0.05)
+            migrate(connection, metadata)
+        return step
+
+    def backfill(connection, metadata):
+        connection.execute(text("UPDATE item SET extra = id * 10 WHERE extra IS NULL"))
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        (1, "item.extra", counted(1, migrations._add_column("item", "extra"))),
+        (2, "item: индекс по name", counted(2, migrations._create_indexes("item", "ix_item_name"))),
+        (3, "item.extra: заполнение", counted(3, backfill)),
+    ])
+    return counter
+
+def test_migrations_apply_once(engine, calls):
+    metadata = make_metadata(with_extra=True)
+    create_tables(engine, metadata)
+    assert run_migrations(engine, metadata) == [1, 2, 3]
+    assert run_migrations(engine, metadata) == []
+    assert calls == {1: 1, 2: 1, 3: 1}
+    with engine.connect() as connection:
+        assert get_applied_versions(connection) == {1, 2, 3}
+        assert connection.execute(text("SELECT extra FROM item WHERE id = 1")).scalar() == 10
+    assert "ix_item_name" in {index["name"] for index in inspect(engine).get_indexes("item")}
+
+def test_new_migration_is_applied_on_next_run(engine, calls, monkeypatch):
+    """Миграция, добавленная в конец списка, применяется при следующем запуске; старые не повторяются"""
+    metadata = make_metadata(with_extra=True)
+    create_tables(engine, metadata)
+    all_migrations = migrations.MIGRATIONS
+    monkeypatch.setattr(migrations, "MIGRATIONS", all_migrations[:2])
+    assert run_migrations(engine, metadata) == [1, 2]
+    monkeypatch.setattr(migrations, "MIGRATIONS", all_migrations)
+    assert run_migrations(engine, metadata) == [3]
+    assert calls == {1: 1, 2: 1, 3: 1}
+
+def test_concurrent_runs_apply_each_migration_once(tmp_path, calls):
+    """Процессы, стартующие одновременно на пустой БД, не падают и применяют каждую миграцию ровно один раз"""
+    path = tmp_path / "concurrent.db"
+    metadata = make_metadata(with_extra=True)
+    results, errors = [], []
+    barrier = threading.Barrier(4)
+
+    def worker():
+        # У каждого «процесса» свой движок и свои соединения
+        engine = create_engine(f"sqlite:///{path}")
+        try:
+            barrier.wait()
+            create_tables(engine, metadata)
+            results.append(run_migrations(engine, metadata))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            engine.dispose()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert calls == {1: 1, 2: 1, 3: 1}
+    assert sorted(version for applied in results for version in applied) == [1, 2, 3]
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT version FROM schema_version ORDER BY version")).fetchall()
+    engine.dispose()
+    assert [row[0] for row in rows] == [1, 2, 3]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Тесты ограничения исходящих запросов: token bucket и повторы при RetryAfter
+"""
+
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import send_scheduler
+from send_scheduler import TokenBucket, SendScheduler, caller_handles_retry_after
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(send_scheduler.time, "monotonic", fake)
+    return fake
+
+def test_bucket_allows_burst_then_waits(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        assert bucket.wait_time() == 0
+        bucket.consume()
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+def test_bucket_refills_at_rate_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.consume()
+    clock.now += 1
+    assert bucket.wait_time() == 0
+    assert bucket.tokens == pytest.approx(2)
+    clock.now += 60
+    bucket.wait_time()
+    assert bucket.tokens == pytest.approx(3)
+
+def test_bucket_pause_blocks_and_empties(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.pause(7)
+    assert bucket.wait_time() == pytest.approx(7)
+    # Более короткая пауза не сокращает уже назначенную
+    bucket.pause(1)
+    assert bucket.wait_time() == pytest.approx(7)
+    clock.now += 7
+    # После паузы токены копятся заново, с нуля
+    assert bucket.wait_time() == pytest.approx(0.1)
+
+def _retry_after(retry_after: int) -> TelegramRetryAfter:
+    method = SendMessage(chat_id=1, text="x")
+    return TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=retry_after)
+
+def test_scheduler_retries_retry_after():
+    """Планировщик сам повторяет запрос после RetryAfter"""
+    async def scenario():
+        scheduler = SendScheduler("test-retry", bot_rate=1000, bot_burst=10, chat_rate=1000, chat_burst=10, max_retries=2)
+        calls = []
+
+        async def make_request(bot, method):
+            calls.append(method)
+            if len(calls) == 1:
+                raise _retry_after(0)
+            return "sent"
+
+        try:
+            result = await scheduler(make_request, None, SendMessage(chat_id=1, text="x"))
+        finally:
+            await scheduler.stop()
+        return result, len(calls), scheduler.metrics()
+
+    result, calls, metrics = asyncio.run(scenario())
+    assert result == "sent"
+    assert calls == 2
+    assert metrics["lanes"]["interactive"]["retry_after"] == 1
+
+def test_caller_handles_retry_after():
+    """Внутри caller_handles_retry_after планировщик не повторяет запрос, а отдаёт RetryAfter вызывающему"""
+    async def scenario():
+        scheduler = SendScheduler("test-caller", bot_rate=1000, bot_burst=10, chat_rate=1000, chat_burst=10, max_retries=3)
+        calls = []
+
+        async def make_request(bot, method):
+            calls.append(method)
+            raise _retry_after(5)
+
+        try:
+            with caller_handles_retry_after():
+                with pytest.raises(TelegramRetryAfter):
+                    await scheduler(make_request, None, SendMessage(chat_id=1, text="x"))
+        finally:
+            await scheduler.stop()
+        return len(calls), scheduler.bot_bucket.wait_time()
+
+    calls, bot_wait = asyncio.run(scenario())
+    assert calls == 1
+    # Лимит бота всё равно приостановлен на время RetryAfter
+    assert bot_wait > 4
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Тесты буфера аналитики: пакетная запись, повтор неудачной пачки и её отбрасывание
+"""
+
+import asyncio
+
+import pytest
+
+import telemetry_buffer
+from telemetry_buffer import TelemetryBuffer
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(telemetry_buffer.time, "monotonic", fake)
+    return fake
+
+class FlakyWriter:
+    """Запись, которая падает первые failures раз"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.batches = []
+
+    async def __call__(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        self.batches.append({kind: list(rows) for kind, rows in batch.items()})
+
+def make_buffer(write, **kwargs) -> TelemetryBuffer:
+    # Длинный интервал: фоновый цикл не вмешивается, пачки пишет сам тест через flush
+    kwargs.setdefault("batch_size", 100)
+    return TelemetryBuffer(write, flush_interval_ms=10000, max_pending=1000, **kwargs)
+
+def test_without_loop_rows_are_written_immediately():
+    writer = FlakyWriter(0)
+    buffer = make_buffer(writer)
+    asyncio.run(buffer.add("message_stat", {"id": 1}))
+    assert writer.batches == [{"message_stat": [{"id": 1}]}]
+
+def test_rows_are_written_in_one_batch(clock):
+    async def scenario():
+        writer = FlakyWriter(0)
+        buffer = make_buffer(writer)
+        buffer.start()
+        await buffer.add("message_stat", {"id": 1})
+        await buffer.add("query_theme", {"id": 2})
+        await buffer.add("message_stat", {"id": 3})
+        written = await buffer.flush()
+        await buffer.stop()
+        return written, writer.batches
+
+    written, batches = asyncio.run(scenario())
+    assert written == 3
+    assert batches == [{"message_stat": [{"id": 1}, {"id": 3}], "query_theme": [{"id": 2}]}]
+
+def test_failed_batch_is_retried_after_backoff_before_new_rows(clock):
+    """Неудачная пачка повторяется после паузы и пишется раньше новых записей, отдельной транзакцией"""
+    async def scenario():
+        writer = FlakyWriter(1)
+        buffer = make_buffer(writer, max_attempts=5)
+        buffer.start()
+        await buffer.add("message_stat", {"id": 1})
+        assert await buffer.flush() == 0
+        await buffer.add("message_stat", {"id": 2})
+        # Пауза перед повтором ещё не прошла
+        assert await buffer.flush() == 0
+        assert buffer.metrics()["pending"] == 2
+        clock.now += 60
+        assert await buffer.flush() == 1
+        assert await buffer.flush() == 1
+        await buffer.stop()
+        return writer.batches, buffer.metrics()
+
+    batches, metrics = asyncio.run(scenario())
+    assert batches == [{"message_stat": [{"id": 1}]}, {"message_stat": [{"id": 2}]}]
+    assert metrics["written_total"] == 2
+    assert metrics["flush_failures"] == 1
+    assert metrics["dropped_total"] == 0
+    assert metrics["failed_batch_attempts"] == 0
+
+def test_batch_is_dropped_after_max_attempts(clock):
+    """Пачка, которая не записалась за max_attempts попыток, отбрасывается и не блокирует новые записи"""
+    async def scenario():
+        writer = FlakyWriter(3)
+        buffer = make_buffer(writer, max_attempts=3)
+        buffer.start()
+        await buffer.add("message_stat", {"id": 1})
+        await buffer.add("message_stat", {"id": 2})
+        for _ in range(3):
+            assert await buffer.flush() == 0
+            clock.now += 60
+        dropped = buffer.metrics()
+        await buffer.add("message_stat", {"id": 3})
+        assert await buffer.flush() == 1
+        await buffer.stop()
+        return dropped, writer.batches
+
+    dropped, batches = asyncio.run(scenario())
+    assert dropped["batches_dropped"] == 1
+    assert dropped["dropped_total"] == 2
+    assert dropped["pending"] == 0
+    assert batches == [{"message_stat": [{"id": 3}]}]
+
+def test_stop_writes_failed_batch_and_rest(clock):
+    """При остановке ранее не записанная пачка и новые записи дописываются без ожидания паузы"""
+    async def scenario():
+        writer = FlakyWriter(1)
+        buffer = make_buffer(writer)
+        buffer.start()
+        await buffer.add("message_stat", {"id": 1})
+        await buffer.flush()
+        await buffer.add("message_stat", {"id": 2})
+        await buffer.stop()
+        return writer.batches, buffer.metrics()
+
+    batches, metrics = asyncio.run(scenario())
+    assert batches == [{"message_stat": [{"id": 1}]}, {"message_stat": [{"id": 2}]}]
+    assert metrics["pending"] == 0
+
+def test_overflow_drops_new_rows(clock):
+    async def scenario():
+        writer = FlakyWriter(0)
+        buffer = TelemetryBuffer(writer, batch_size=2, flush_interval_ms=10000, max_pending=2)
+        buffer.start()
+        # add не уступает управление event loop, так что фоновый цикл не успевает записать пачку между вызовами
+        for row_id in range(3):
+            await buffer.add("message_stat", {"id": row_id})
+        metrics = buffer.metrics()
+        await buffer.stop()
+        return metrics, writer.batches
+
+    metrics, batches = asyncio.run(scenario())
+    assert metrics["pending"] == 2
+    assert metrics["dropped_total"] == 1
+    assert batches == [{"message_stat": [{"id": 0}, {"id": 1}]}]
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Тесты дедупликации повторных доставок обновлений
+"""
+
+from update_dispatch import UpdateDeduplicator
+
+def test_repeated_update_is_detected():
+    dedup = UpdateDeduplicator(window=10)
+    assert dedup.check_and_mark(1) is False
+    assert dedup.check_and_mark(2) is False
+    assert dedup.check_and_mark(1) is True
+    assert dedup.check_and_mark(2) is True
+
+def test_oldest_update_is_evicted():
+    """Окно ограничено: самый давний update_id вытесняется"""
+    dedup = UpdateDeduplicator(window=3)
+    for update_id in (1, 2, 3, 4):
+        assert dedup.check_and_mark(update_id) is False
+    assert len(dedup._seen) == 3
+    assert dedup.check_and_mark(1) is False
+    assert dedup.check_and_mark(4) is True
+
+def test_repeat_refreshes_recency():
+    """Повторная доставка продлевает жизнь update_id в окне (LRU, а не FIFO)"""
+    dedup = UpdateDeduplicator(window=3)
+    for update_id in (1, 2, 3):
+        dedup.check_and_mark(update_id)
+    assert dedup.check_and_mark(1) is True
+    dedup.check_and_mark(4)
+    assert dedup.check_and_mark(1) is True
+    assert dedup.check_and_mark(2) is False
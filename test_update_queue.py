@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Тесты очереди обновлений: порядок внутри чата, параллельность между чатами, переполнение
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from aiogram import types
+
+from update_queue import UpdateQueue, UpdateQueueFull, get_update_chat_id
+
+def make_update(update_id: int, chat_id: int) -> types.Update:
+    return types.Update(update_id=update_id, message=types.Message(
+        message_id=update_id, date=datetime.now(), chat=types.Chat(id=chat_id, type="private"), text=str(update_id)
+    ))
+
+def test_chat_id_from_message():
+    assert get_update_chat_id(make_update(1, 42)) == 42
+
+def test_updates_of_one_chat_are_processed_in_order():
+    """Обновления одного чата обрабатываются строго по очереди, даже при нескольких воркерах"""
+    async def scenario():
+        processed = []
+        running = set()
+
+        async def handler(update):
+            chat_id = update.message.chat.id
+            assert chat_id not in running, "два обновления одного чата обрабатываются одновременно"
+            running.add(chat_id)
+            # Обработка с разной длительностью: без сериализации по чату порядок бы перемешался
+            await asyncio.sleep(0.01 * (update.update_id % 3))
+            running.discard(chat_id)
+            processed.append((chat_id, update.update_id))
+
+        queue = UpdateQueue("test", handler, workers=4, maxsize=100, put_timeout=1)
+        queue.start()
+        for update_id in range(1, 13):
+            await queue.put(make_update(update_id, chat_id=update_id % 2))
+        await queue.stop()
+        return processed, queue.metrics()
+
+    processed, metrics = asyncio.run(scenario())
+    for chat_id in (0, 1):
+        ids = [update_id for chat, update_id in processed if chat == chat_id]
+        assert ids == sorted(ids)
+        assert len(ids) == 6
+    assert metrics["processed_total"] == 12
+    assert metrics["depth"] == 0
+    assert metrics["chats_pending"] == 0
+
+def test_slow_chat_does_not_block_other_chats():
+    """Пока обновление одного чата висит, воркеры обрабатывают остальные чаты"""
+    async def scenario():
+        release = asyncio.Event()
+        processed = []
+
+        async def handler(update):
+            if update.message.chat.id == 1:
+                await release.wait()
+            processed.append(update.update_id)
+
+        queue = UpdateQueue("test", handler, workers=2, maxsize=100, put_timeout=1)
+        queue.start()
+        await queue.put(make_update(1, chat_id=1))
+        await queue.put(make_update(2, chat_id=1))
+        for update_id in range(3, 8):
+            await queue.put(make_update(update_id, chat_id=update_id))
+        await asyncio.sleep(0.05)
+        before_release = list(processed)
+        release.set()
+        await queue.stop()
+        return before_release, processed
+
+    before_release, processed = asyncio.run(scenario())
+    assert before_release == [3, 4, 5, 6, 7]
+    assert processed[-2:] == [1, 2]
+
+def test_failing_handler_does_not_stop_the_chat():
+    async def scenario():
+        processed = []
+
+        async def handler(update):
+            if update.update_id == 1:
+                raise RuntimeError("boom")
+            processed.append(update.update_id)
+
+        queue = UpdateQueue("test", handler, workers=1, maxsize=10, put_timeout=1)
+        queue.start()
+        await queue.put(make_update(1, chat_id=5))
+        await queue.put(make_update(2, chat_id=5))
+        await queue.stop()
+        return processed, queue.metrics()
+
+    processed, metrics = asyncio.run(scenario())
+    assert processed == [2]
+    assert metrics["failed_total"] == 1
+    assert metrics["processed_total"] == 1
+
+def test_put_raises_when_queue_is_full():
+    """При переполнении put ждёт put_timeout и выбрасывает UpdateQueueFull (webhook отвечает 503)"""
+    async def scenario():
+        # Воркеры не запущены — очередь не разбирается
+        queue = UpdateQueue("test", lambda update: None, workers=1, maxsize=2, put_timeout=0.05)
+        await queue.put(make_update(1, chat_id=1))
+        await queue.put(make_update(2, chat_id=2))
+        with pytest.raises(UpdateQueueFull):
+            await queue.put(make_update(3, chat_id=3))
+        return queue.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["depth"] == 2
+    assert metrics["rejected_total"] == 1
+    assert metrics["enqueued_total"] == 2
+
+def test_put_waits_for_space():
+    """Если место освободилось за put_timeout, обновление принимается"""
+    async def scenario():
+        processed = []
+
+        async def handler(update):
+            processed.append(update.update_id)
+
+        queue = UpdateQueue("test", handler, workers=1, maxsize=1, put_timeout=1)
+        await queue.put(make_update(1, chat_id=1))
+        put = asyncio.create_task(queue.put(make_update(2, chat_id=2)))
+        await asyncio.sleep(0.05)
+        assert not put.done()
+        queue.start()
+        await put
+        await queue.stop()
+        return processed
+
+    assert asyncio.run(scenario()) == [1, 2]
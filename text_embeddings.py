@@ -0,0 +1,42 @@
+import re
+import zlib
+
+import numpy as np
+
+# Размер хэшированного пространства признаков (символьные n-граммы)
+EMBEDDING_DIM = 512
+NGRAM_SIZE = 3
+
+_PUNCTUATION = re.compile(r'[^\w\s]', re.UNICODE)
+_SPACES = re.compile(r'\s+')
+
+def normalize_text(text: str) -> str:
+    """Приводит текст к виду для сравнения: нижний регистр, ё→е, без пунктуации и лишних пробелов"""
+    text = (text or "").lower().replace('ё', 'е')
+    text = _PUNCTUATION.sub(' ', text)
+    return _SPACES.sub(' ', text).strip()
+
+def embed_text(text: str) -> np.ndarray:
+    """Строит L2-нормированный вектор хэшированных символьных n-грамм (без внешних моделей)"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in normalize_text(text).split():
+        padded = f" {word} "
+        if len(padded) <= NGRAM_SIZE:
+            grams = [padded]
+        else:
+            grams = [padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)]
+        for gram in grams:
+            # crc32 стабилен между процессами, в отличие от встроенного hash()
+            vector[zlib.crc32(gram.encode('utf-8')) % EMBEDDING_DIM] += 1.0
+    # Сублинейный вес: повторяющиеся n-граммы не должны забивать остальные
+    np.log1p(vector, out=vector)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+def embed_texts(texts: list) -> np.ndarray:
+    """Матрица векторов (по строке на текст)"""
+    if not texts:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.vstack([embed_text(text) for text in texts])
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import random
+import time
+from typing import List, Optional, Tuple
+
+import speech_recognition as sr
+
+from asr_backends import AsrBackend, create_backends
+from config import ASR_BACKEND, TRANSCRIBE_MAX_RETRIES, TRANSCRIBE_BACKOFF_BASE
+
+logger = logging.getLogger(__name__)
+
+class TranscriptionEngine:
+    """Распознавание аудио по частям: чанки идут параллельно, текст собирается в исходном порядке"""
+
+    def __init__(self, backends: Optional[List[AsrBackend]] = None, max_retries: int = TRANSCRIBE_MAX_RETRIES,
+                 backoff_base: float = TRANSCRIBE_BACKOFF_BASE):
+        # Движки пробуются по порядку: следующий — если предыдущий не справился с чанком
+        self.backends = backends or create_backends(ASR_BACKEND)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.stats = {
+            "messages": 0, "chunks": 0, "chunks_empty": 0, "chunks_failed": 0, "retries": 0, "fallbacks": 0,
+            "in_flight": 0, "chunk_time_max": 0.0, "message_time_last": 0.0, "message_time_max": 0.0,
+        }
+
+    async def _recognize(self, index: int, chunk: sr.AudioData, language: str) -> str:
+        last_error = None
+        for backend in self.backends:
+            if last_error is not None:
+                self.stats["fallbacks"] += 1
+            try:
+                return await backend.recognize(chunk, language)
+            except Exception as e:
+                last_error = e
+                if len(self.backends) > 1:
+                    logger.warning(f"[VOICE] Чанк {index}: движок {backend.name} не справился ({e})")
+        raise last_error
+
+    async def _recognize_with_retry(self, index: int, chunk: sr.AudioData, language: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            self.stats["in_flight"] += 1
+            try:
+                text = await self._recognize(index, chunk, language)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.stats["chunks_failed"] += 1
+                    raise
+                self.stats["retries"] += 1
+                delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"[VOICE] Чанк {index}: ошибка распознавания ({e}), повтор {attempt + 1} через {delay:.1f} с")
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                self.stats["in_flight"] -= 1
+                self.stats["chunk_time_max"] = max(self.stats["chunk_time_max"], time.monotonic() - started)
+            if not text:
+                self.stats["chunks_empty"] += 1
+            return text
+
+    async def transcribe(self, chunks: List[sr.AudioData], language: str = 'ru-RU') -> str:
+        """Распознаёт чанки параллельно и склеивает текст по порядку; чанк, не распознанный после повторов, пропускается"""
+        text, _ = await self.transcribe_with_failures(chunks, language)
+        return text
+
+    async def transcribe_with_failures(self, chunks: List[sr.AudioData], language: str = 'ru-RU') -> Tuple[str, int]:
+        """То же, что transcribe, плюс число пропущенных чанков: текст с пропусками нельзя кэшировать как полный"""
+        started = time.monotonic()
+        self.stats["messages"] += 1
+        self.stats["chunks"] += len(chunks)
+        results = await asyncio.gather(
+            *(self._recognize_with_retry(i, chunk, language) for i, chunk in enumerate(chunks)),
+            return_exceptions=True
+        )
+        errors = [(i, r) for i, r in enumerate(results) if isinstance(r, BaseException)]
+        for i, error in errors:
+            logger.error(f"[VOICE] Ошибка при обработке чанка {i}: {error}")
+        if errors and len(errors) == len(results):
+            # Не распознано ничего — это ошибка, а не пустое сообщение
+            raise errors[-1][1]
+        elapsed = time.monotonic() - started
+        self.stats["message_time_last"] = elapsed
+        self.stats["message_time_max"] = max(self.stats["message_time_max"], elapsed)
+        logger.info(f"[VOICE] Распознано {len(chunks) - len(errors)}/{len(chunks)} чанков за {elapsed:.1f} с")
+        return " ".join(text for text in results if isinstance(text, str) and text), len(errors)
+
+    def shutdown(self):
+        """Останавливает пулы движков (при остановке приложения)"""
+        for backend in self.backends:
+            backend.shutdown()
+
+    def metrics(self) -> dict:
+        return {**self.stats, "backends": {backend.name: backend.metrics() for backend in self.backends}}
+
+transcriber = TranscriptionEngine()
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from aiogram import Bot, Dispatcher, types
+
+from config import UPDATE_DEDUP_WINDOW
+from update_queue import get_update_chat_id
+
+logger = logging.getLogger(__name__)
+
+class UpdateDeduplicator:
+    """Помнит последние update_id (LRU ограниченного размера), чтобы не обрабатывать повторные доставки"""
+
+    def __init__(self, window: int = UPDATE_DEDUP_WINDOW):
+        self.window = max(1, window)
+        self._seen = OrderedDict()
+
+    def check_and_mark(self, update_id: int) -> bool:
+        """True, если update_id уже встречался; иначе запоминает его"""
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            return True
+        self._seen[update_id] = None
+        if len(self._seen) > self.window:
+            self._seen.popitem(last=False)
+        return False
+
+class ChatLocks:
+    """Блокировки по chat_id: обновления одного чата обрабатываются строго по очереди"""
+
+    def __init__(self):
+        self._locks = {}
+        self._waiters = {}
+
+    def lock(self, chat_id) -> "_ChatLockContext":
+        return _ChatLockContext(self, chat_id)
+
+    def _get(self, chat_id) -> asyncio.Lock:
+        self._waiters[chat_id] = self._waiters.get(chat_id, 0) + 1
+        return self._locks.setdefault(chat_id, asyncio.Lock())
+
+    def _put(self, chat_id):
+        self._waiters[chat_id] -= 1
+        if self._waiters[chat_id] == 0:
+            # Блокировка больше никому не нужна — не копим их для всех когда-либо писавших чатов
+            del self._waiters[chat_id]
+            del self._locks[chat_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+class _ChatLockContext:
+    def __init__(self, locks: ChatLocks, chat_id):
+        self._locks = locks
+        self._chat_id = chat_id
+        self._lock = None
+
+    async def __aenter__(self):
+        self._lock = self._locks._get(self._chat_id)
+        try:
+            await self._lock.acquire()
+        except BaseException:
+            self._locks._put(self._chat_id)
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._lock.release()
+        self._locks._put(self._chat_id)
+
+class UpdateDispatcher:
+    """Слой перед Dispatcher.feed_update: отбрасывает дубли и сериализует обработку внутри одного чата"""
+
+    def __init__(self, name: str, dispatcher: Dispatcher, bot: Bot):
+        self.name = name
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.deduplicator = UpdateDeduplicator()
+        self.chat_locks = ChatLocks()
+        self.stats = {"fed_total": 0, "duplicates_total": 0}
+
+    async def feed(self, update: types.Update):
+        if self.deduplicator.check_and_mark(update.update_id):
+            self.stats["duplicates_total"] += 1
+            logger.info(f"[UPDATE_DISPATCH] {self.name}: повторный update {update.update_id} пропущен")
+            return
+        chat_id = get_update_chat_id(update)
+        # Обновления без чата сериализуются по собственному update_id, т.е. не блокируют друг друга
+        lock_key = chat_id if chat_id is not None else f"update:{update.update_id}"
+        async with self.chat_locks.lock(lock_key):
+            # Соединение с БД берётся на каждый запрос, а не на всё обновление: иначе обработчик держал бы его
+            # и во время ответа LLM, и воркеров очередей было бы больше, чем соединений в пуле
+            await self.dispatcher.feed_update(self.bot, update)
+        self.stats["fed_total"] += 1
+
+    def metrics(self) -> dict:
+        return {"active_chats": len(self.chat_locks), **self.stats}
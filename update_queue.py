@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from aiogram import types
+
+from config import UPDATE_QUEUE_WORKERS, UPDATE_QUEUE_MAXSIZE, UPDATE_QUEUE_PUT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+class UpdateQueueFull(Exception):
+    """Очередь переполнена — webhook должен ответить ошибкой, чтобы Telegram повторил доставку позже"""
+
+def get_update_chat_id(update: types.Update) -> Optional[int]:
+    """Определяет чат обновления (для сохранения порядка сообщений одного чата)"""
+    event = update.event
+    if event is None:
+        return None
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:
+        chat = getattr(event.message, "chat", None)
+    if chat is not None:
+        return chat.id
+    from_user = getattr(event, "from_user", None)
+    return from_user.id if from_user is not None else None
+
+class UpdateQueue:
+    """Общая очередь обновлений с пулом воркеров; обновления одного чата обрабатываются строго по очереди"""
+
+    def __init__(self, name: str, handler: Callable[[types.Update], Awaitable[None]],
+                 workers: int = UPDATE_QUEUE_WORKERS, maxsize: int = UPDATE_QUEUE_MAXSIZE,
+                 put_timeout: float = UPDATE_QUEUE_PUT_TIMEOUT):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self.put_timeout = put_timeout
+        # Очередь чатов, у которых есть необработанные обновления; чат стоит в ней не больше одного раза
+        # и не попадает туда, пока его обновление обрабатывается — так медленный чат занимает только один воркер
+        self._ready: Optional[asyncio.Queue] = None
+        self._pending = {}  # чат -> deque[(время постановки, update)]
+        self._active = set()  # чаты, которые сейчас в очереди _ready или в обработке
+        self._size = 0
+        self._space: Optional[asyncio.Condition] = None
+        self._tasks = []
+        self.stats = {
+            "enqueued_total": 0, "processed_total": 0, "failed_total": 0, "rejected_total": 0,
+            "wait_time_total": 0.0, "wait_time_max": 0.0, "processing_time_total": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def _ensure_primitives(self):
+        # Примитивы создаются лениво, в рабочем event loop
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            self._space = asyncio.Condition()
+
+    def start(self):
+        """Запускает воркеры (вызывается при старте приложения)"""
+        if self.running:
+            return
+        self._ensure_primitives()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-update-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"[UPDATE_QUEUE] {self.name}: запущено {self.workers} воркеров, ёмкость {self.maxsize}")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Дожидается обработки накопленных обновлений и останавливает воркеры"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[UPDATE_QUEUE] {self.name}: не все обновления обработаны до остановки ({self.depth()} в очереди)")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"[UPDATE_QUEUE] {self.name}: воркеры остановлены")
+
+    async def put(self, update: types.Update):
+        """Ставит обновление в очередь; при переполнении ждёт put_timeout и выбрасывает UpdateQueueFull"""
+        self._ensure_primitives()
+        try:
+            async with self._space:
+                await asyncio.wait_for(self._space.wait_for(lambda: self._size < self.maxsize), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected_total"] += 1
+            raise UpdateQueueFull(f"{self.name}: очередь переполнена")
+        chat_id = get_update_chat_id(update)
+        key = chat_id if chat_id is not None else update.update_id
+        self._pending.setdefault(key, deque()).append((time.monotonic(), update))
+        self._size += 1
+        self.stats["enqueued_total"] += 1
+        if key not in self._active:
+            self._active.add(key)
+            self._ready.put_nowait(key)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            updates = self._pending[key]
+            enqueued_at, update = updates.popleft()
+            self._size -= 1
+            async with self._space:
+                self._space.notify()
+            started = time.monotonic()
+            wait_time = started - enqueued_at
+            self.stats["wait_time_total"] += wait_time
+            self.stats["wait_time_max"] = max(self.stats["wait_time_max"], wait_time)
+            try:
+                await self.handler(update)
+                self.stats["processed_total"] += 1
+            except Exception as e:
+                self.stats["failed_total"] += 1
+                logger.error(f"[UPDATE_QUEUE] {self.name}: ошибка обработки update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self.stats["processing_time_total"] += time.monotonic() - started
+                # Следующее обновление чата — в конец общей очереди, чтобы активный чат не вытеснял остальные
+                if updates:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                    self._active.discard(key)
+                self._ready.task_done()
+
+    def depth(self) -> int:
+        return self._size
+
+    def metrics(self) -> dict:
+        done = self.stats["processed_total"] + self.stats["failed_total"]
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "depth": self.depth(),
+            "capacity": self.maxsize,
+            "chats_pending": len(self._pending),
+            "wait_time_avg": self.stats["wait_time_total"] / done if done else 0.0,
+            **self.stats,
+        }